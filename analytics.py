@@ -0,0 +1,242 @@
+"""Vectorized analytics over columnar batches (NumPy when installed).
+
+``aggregate_batch`` is a drop-in for kpis.aggregate_batch: it reduces a
+batch to the same mergeable partial, with numeric columns (start time,
+duration, cost, message count, rating) as arrays and the categorical ones
+(status, outcome, direction, termination reason, criteria JSON) counted
+per distinct value, so each distinct criteria JSON is parsed once (with
+orjson when installed).
+
+``load_columns`` / ``distributions`` load the numeric columns of a whole
+history once and compute hour-of-day buckets, percentiles and histograms.
+Without NumPy both fall back to plain Python with the same results.
+"""
+
+import bisect
+import json
+import math
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional: pure Python fallback (kpis.aggregate_batch)
+    np = None
+
+try:
+    import orjson
+except ImportError:  # optional: faster criteria JSON parsing
+    orjson = None
+
+import kpis
+from kpis import _count_criteria
+
+PERCENTILES = (50, 90, 95, 99)
+# Left edges of the histogram buckets; the last bucket is open-ended
+HISTOGRAM_EDGES = {
+    "call_duration_secs": (0, 30, 60, 120, 180, 300, 600, 900, 1800),
+    "message_count": (0, 5, 10, 20, 30, 50, 100),
+    "cost": (0, 100, 250, 500, 1000, 2500, 5000),
+}
+NUMERIC_COLUMNS = ("start_time_unix", "call_duration_secs", "message_count", "cost")
+
+
+def _ints(values):
+    """Integer column as an int64 array, NULL as 0."""
+    return np.nan_to_num(np.array(values, dtype=float), nan=0).astype(np.int64)
+
+
+def _day(day_number: int) -> str:
+    return datetime.utcfromtimestamp(day_number * 86400).strftime("%Y-%m-%d")
+
+
+def aggregate_batch(batch: dict) -> dict:
+    """Same partial as kpis.aggregate_batch, computed column-wise."""
+    if np is None:
+        return kpis.aggregate_batch(batch)
+    outcome = np.array(batch["call_successful"], dtype=object)
+    secs = _ints(batch["call_duration_secs"])
+    messages = _ints(batch["message_count"])
+    cost = _ints(batch["cost"])
+    start = _ints(batch["start_time_unix"])
+    rating = np.array(batch["rating"], dtype=float)
+    rating = rating[~np.isnan(rating)]
+
+    positive = secs[secs > 0]
+    duration = [int(positive.size), int(positive.sum()), None, None,
+                int((positive < 30).sum()), int((positive > 300).sum())]
+    if positive.size:
+        duration[2], duration[3] = int(positive.min()), int(positive.max())
+
+    statuses = {}
+    transfers = dropouts = 0
+    for (status, termination), n in Counter(zip(batch["status"], batch["termination_reason"])).items():
+        statuses[status] = statuses.get(status, 0) + n
+        reason = termination.lower() if termination else ""
+        if "transfer" in reason:
+            transfers += n
+        if status in ("failed", "initiated") or "hang" in reason:
+            dropouts += n
+
+    criteria = {}
+    for criteria_json, n in Counter(batch["evaluation_criteria_results"]).items():
+        if criteria_json:
+            _count_criteria(criteria_json, criteria, n, orjson.loads if orjson else json.loads)
+
+    dated = start != 0
+    day_numbers, index = np.unique(start[dated] // 86400, return_inverse=True)
+    size = day_numbers.size
+    day_secs = secs[dated]
+    per_day = zip(
+        np.bincount(index, minlength=size),
+        np.bincount(index, weights=(outcome[dated] == "success"), minlength=size),
+        np.bincount(index, weights=(outcome[dated] == "failure"), minlength=size),
+        np.bincount(index, weights=day_secs, minlength=size),
+        np.bincount(index, weights=(day_secs != 0), minlength=size),
+        np.bincount(index, weights=cost[dated], minlength=size),
+    )
+    days = {
+        _day(int(d)): [int(v) for v in values]
+        for d, values in zip(day_numbers, per_day)
+    }
+
+    return {
+        "total": len(outcome),
+        "outcomes": dict(Counter(batch["call_successful"])),
+        "directions": dict(Counter(batch["direction"])),
+        "statuses": statuses,
+        "duration": duration,
+        "messages": [int((messages > 0).sum()), int(messages[messages > 0].sum())],
+        "costs": [int((cost > 0).sum()), int(cost[cost > 0].sum())],
+        "ratings": [int(rating.size), float(rating.sum())],
+        "transfers": transfers,
+        "dropouts": dropouts,
+        "criteria": criteria,
+        "days": days,
+    }
+
+
+def load_columns(batches: Iterable[dict]) -> dict:
+    """Numeric columns plus success/failure flags of all batches, concatenated."""
+    parts = {c: [] for c in (*NUMERIC_COLUMNS, "success", "failure")}
+    for batch in batches:
+        if np is None:
+            for c in NUMERIC_COLUMNS:
+                parts[c].extend(v or 0 for v in batch[c])
+            parts["success"].extend(o == "success" for o in batch["call_successful"])
+            parts["failure"].extend(o == "failure" for o in batch["call_successful"])
+            continue
+        for c in NUMERIC_COLUMNS:
+            parts[c].append(_ints(batch[c]))
+        outcome = np.array(batch["call_successful"], dtype=object)
+        parts["success"].append(outcome == "success")
+        parts["failure"].append(outcome == "failure")
+    if np is None:
+        return parts
+    return {
+        c: np.concatenate(arrays) if arrays else np.zeros(0, dtype=bool if c in ("success", "failure") else np.int64)
+        for c, arrays in parts.items()
+    }
+
+
+def distributions(agent_id: str, month: Optional[str], columns: dict) -> dict:
+    """Hour-of-day buckets (UTC), percentiles and histograms of positive values."""
+    if np is None:
+        hourly = _hourly_py(columns)
+        values = {c: [v for v in columns[c] if v > 0] for c in HISTOGRAM_EDGES}
+        percentiles = {c: _percentiles_py(sorted(v)) for c, v in values.items()}
+        histograms = {c: _histogram_py(v, HISTOGRAM_EDGES[c]) for c, v in values.items()}
+    else:
+        hourly = _hourly_np(columns)
+        values = {c: columns[c][columns[c] > 0] for c in HISTOGRAM_EDGES}
+        percentiles = {
+            c: dict(zip((f"p{p}" for p in PERCENTILES), (round(float(x), 1) for x in np.percentile(v, PERCENTILES))))
+            if v.size else _percentiles_py([])
+            for c, v in values.items()
+        }
+        histograms = {
+            c: _histogram_rows(HISTOGRAM_EDGES[c], np.bincount(
+                np.searchsorted(HISTOGRAM_EDGES[c], v, side="right") - 1, minlength=len(HISTOGRAM_EDGES[c]),
+            ))
+            for c, v in values.items()
+        }
+    return {
+        "agent_id": agent_id,
+        "month": month or "all",
+        "total_conversations": len(columns["start_time_unix"]),
+        "hourly": hourly,
+        "percentiles": percentiles,
+        "histograms": histograms,
+    }
+
+
+def _hourly_rows(totals, success, failed, secs, secs_count, cost) -> list[dict]:
+    return [
+        {
+            "hour": hour,
+            "total": int(totals[hour]),
+            "success": int(success[hour]),
+            "failed": int(failed[hour]),
+            "avg_duration": round(float(secs[hour]) / float(secs_count[hour]), 1) if secs_count[hour] else 0,
+            "cost": int(cost[hour]),
+        }
+        for hour in range(24)
+    ]
+
+
+def _hourly_np(columns: dict) -> list[dict]:
+    start = columns["start_time_unix"]
+    dated = start != 0
+    hour = (start[dated] % 86400) // 3600
+    secs = columns["call_duration_secs"][dated]
+
+    def per_hour(weights=None):
+        return np.bincount(hour, weights=weights, minlength=24)
+
+    return _hourly_rows(
+        per_hour(), per_hour(columns["success"][dated]), per_hour(columns["failure"][dated]),
+        per_hour(secs), per_hour(secs != 0), per_hour(columns["cost"][dated]),
+    )
+
+
+def _hourly_py(columns: dict) -> list[dict]:
+    sums = [[0] * 24 for _ in range(6)]
+    for start, success, failure, secs, cost in zip(
+        columns["start_time_unix"], columns["success"], columns["failure"],
+        columns["call_duration_secs"], columns["cost"],
+    ):
+        if not start:
+            continue
+        hour = (start % 86400) // 3600
+        for row, value in zip(sums, (1, success, failure, secs, secs != 0, cost)):
+            row[hour] += value
+    return _hourly_rows(*sums)
+
+
+def _percentiles_py(ordered: list) -> dict:
+    """Linear interpolation between closest ranks, like numpy.percentile's default."""
+    result = {}
+    for p in PERCENTILES:
+        if not ordered:
+            result[f"p{p}"] = 0
+            continue
+        rank = (len(ordered) - 1) * p / 100
+        low = math.floor(rank)
+        high = min(low + 1, len(ordered) - 1)
+        result[f"p{p}"] = round(ordered[low] + (ordered[high] - ordered[low]) * (rank - low), 1)
+    return result
+
+
+def _histogram_py(values: list, edges: tuple) -> list[dict]:
+    counts = [0] * len(edges)
+    for v in values:
+        counts[bisect.bisect_right(edges, v) - 1] += 1
+    return _histogram_rows(edges, counts)
+
+
+def _histogram_rows(edges: tuple, counts) -> list[dict]:
+    return [
+        {"from": low, "to": edges[i + 1] if i + 1 < len(edges) else None, "count": int(counts[i])}
+        for i, low in enumerate(edges)
+    ]
@@ -1,33 +1,64 @@
 """Main FastAPI application with scheduler, API endpoints, and dashboard."""
 
 import asyncio
+import hashlib
 import json
 import logging
 import os
 import time
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from fastapi import FastAPI, Request, Depends, HTTPException, Form, Query
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Request, Response, Depends, HTTPException, Form, Query
+from fastapi.responses import (
+    HTMLResponse, JSONResponse, ORJSONResponse, FileResponse, StreamingResponse, PlainTextResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from pydantic import BaseModel
 
-from database import init_db, get_db, SessionLocal, AppSettings, Conversation, SyncLog, ArchiveLog
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib JSON encoder
+    orjson = None
+
+from archive_store import month_source, evict_month, migrate_archives
+from compression import CompressionMiddleware, strip_etag_encoding
+from data_version import get_version
+from kpi_pool import KpiCancelled, cached_kpis, compare_kpis_async, compute_kpis_async, shutdown_pool
+from elevenlabs_client import ElevenLabsClient, close_http_client
+import metrics
+from metrics import MetricsMiddleware, SCHEDULER_JOB_SECONDS, cache_lookup
+from profiling import PROFILE_REQUESTS, PROFILE_THRESHOLD_MS, ProfilingMiddleware, list_profiles, get_profile
+from phone_extractor import scan_detail, explain_phone_numbers, path_statistics
+from reextract import reextract_phones, load_raw_details
+from rollups import backfill_rollups, range_kpis
+from settings_registry import get_setting, set_setting, get_agents, set_agents, agent_records, load as load_settings
+from shards import SHARD_BY_MONTH, conversation_sessions, paginate, migrate_hot_table, migrate_shards
+from database import (
+    init_db, get_db, engine, SessionLocal, AppSettings, Conversation, ConversationRawDetail, SyncLog, ArchiveLog,
+    change_seq_horizon,
+)
+from search_service import ensure_search_index, backfill_search_index, search_sessions
+import sync_progress
 from sync_service import (
-    sync_conversations, compute_kpis, get_setting, set_setting,
-    get_agents, set_agents,
-    check_and_archive, get_available_months, archive_month_to_csv,
+    sync_conversations,
+    check_and_archive, get_available_months, archive_month_to_csv, compute_distributions,
+    filter_conversations, order_conversations, conversation_sort_key, backfill_change_seq,
     CSV_DIR,
 )
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Voicebot Dashboard", version="1.0.0")
+app = FastAPI(title="Voicebot Dashboard", version="1.0.0", default_response_class=ORJSONResponse if orjson else JSONResponse)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+if PROFILE_REQUESTS:
+    app.add_middleware(ProfilingMiddleware)
 
 TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "templates")
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
@@ -43,6 +74,28 @@ scheduler = AsyncIOScheduler()
 @app.on_event("startup")
 async def startup():
     init_db()
+    migrate_archives()
+    ensure_search_index(engine)
+    db = SessionLocal()
+    try:
+        load_settings(db)
+        if SHARD_BY_MONTH:
+            migrate_shards()
+            moved = migrate_hot_table(db)
+            if moved:
+                logger.info(f"Moved {moved} conversations into month shards")
+        with conversation_sessions(db, write=True) as sessions:
+            indexed = sum(backfill_search_index(s) for s in sessions)
+            sequenced = sum(backfill_change_seq(db, s) for s in sessions)
+        if indexed:
+            logger.info(f"Indexed {indexed} conversations for full-text search")
+        if sequenced:
+            logger.info(f"Assigned change sequence numbers to {sequenced} conversations")
+        rolled_up = backfill_rollups(db)
+        if rolled_up:
+            logger.info(f"Built day rollups for {rolled_up} agent-months")
+    finally:
+        db.close()
     scheduler.add_job(scheduled_sync, "cron", hour=2, minute=0, id="daily_sync")
     scheduler.add_job(scheduled_archive_check, "cron", day="1-5", hour=3, minute=0, id="archive_check")
     scheduler.start()
@@ -52,10 +105,13 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     scheduler.shutdown(wait=False)
+    await close_http_client()
+    shutdown_pool()
 
 
 # ─── Scheduled Jobs ───────────────────────────────────────────────────
 
+@SCHEDULER_JOB_SECONDS.time(job="daily_sync")
 async def scheduled_sync():
     """Daily incremental sync for ALL configured agents."""
     db = SessionLocal()
@@ -85,6 +141,9 @@ async def scheduled_sync():
                     f"({agent['id'][:12]}) "
                     f"({first_of_month.strftime('%Y-%m-%d')} to {now.strftime('%Y-%m-%d %H:%M')})"
                 )
+            except sync_progress.SyncInProgress:
+                logger.info(f"Scheduled sync skipped for agent {agent.get('name', '')}: a sync is already running")
+                continue
             except Exception as e:
                 logger.error(f"Scheduled sync failed for agent {agent.get('name', '')}: {e}")
             await asyncio.sleep(2)  # rate-limit between agents
@@ -94,6 +153,7 @@ async def scheduled_sync():
         db.close()
 
 
+@SCHEDULER_JOB_SECONDS.time(job="archive_check")
 async def scheduled_archive_check():
     """Archive previous month data to CSV on days 1-5."""
     db = SessionLocal()
@@ -126,12 +186,26 @@ class SyncRequest(BaseModel):
 # ─── HTML Pages ───────────────────────────────────────────────────────
 
 @app.get("/", response_class=HTMLResponse)
-async def dashboard_page(request: Request, db: Session = Depends(get_db)):
+async def dashboard_page(
+    request: Request,
+    bootstrap: bool = Query(True, description="Embed the initial data so the first paint needs no fetches"),
+    db: Session = Depends(get_db),
+):
     api_key = get_setting(db, "api_key")
     agents = get_agents(db)
     configured = bool(api_key and agents)
     first_agent_id = agents[0]["id"] if agents else None
-    months = get_available_months(db, first_agent_id) if first_agent_id else []
+    bootstrap_data = None
+    if bootstrap and first_agent_id:
+        # Only the cheap parts are read here; KPIs only when already computed
+        # for the current data, otherwise the page fetches /api/kpis itself.
+        bootstrap_data = await dashboard_bundle(first_agent_id, parts=BOOTSTRAP_PARTS)
+        kpis = cached_kpis(first_agent_id)
+        if kpis is not None:
+            bootstrap_data["kpis"] = kpis
+        months = bootstrap_data["months"]
+    else:
+        months = get_available_months(db, first_agent_id) if first_agent_id else []
     return templates.TemplateResponse("dashboard.html", {
         "request": request,
         "configured": configured,
@@ -139,9 +213,60 @@ async def dashboard_page(request: Request, db: Session = Depends(get_db)):
         "agents_json": json.dumps(agents, ensure_ascii=False),
         "api_key_set": bool(api_key),
         "months": months,
+        # Embedded in a <script> element: "</script>" or "<!--" must not appear
+        "bootstrap_json": json.dumps(bootstrap_data, ensure_ascii=False).replace("<", "\\u003c"),
     })
 
 
+# ─── HTTP Caching ─────────────────────────────────────────────────────
+
+# Browsers keep the response but revalidate every time (cheap 304s).
+CACHE_CONTROL = "private, no-cache"
+
+
+def data_etag(request: Request, *agent_ids: str) -> str:
+    """Strong ETag from the agents' data versions and the exact request."""
+    key = "|".join([
+        app.version,
+        ",".join(str(get_version(agent_id)) for agent_id in agent_ids),
+        request.url.path,
+        str(sorted(request.query_params.multi_items())),
+    ])
+    return '"' + hashlib.sha256(key.encode()).hexdigest()[:32] + '"'
+
+
+def not_modified(request: Request, response: Response, *agent_ids: str) -> Optional[Response]:
+    """Set ETag/Cache-Control; return a 304 response if the client is current."""
+    etag = data_etag(request, *agent_ids)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        for sent in if_none_match.split(","):
+            sent = sent.strip().removeprefix("W/")
+            if sent == "*" or strip_etag_encoding(sent) == etag:
+                cache_lookup("http_etag", True)
+                # Echo the validator the client holds: the 200 it came with had
+                # the encoding suffix (CompressionMiddleware) if it was compressed
+                validator = etag if sent == "*" else sent
+                return Response(status_code=304, headers={"ETag": validator, "Cache-Control": CACHE_CONTROL})
+    cache_lookup("http_etag", False)
+    return None
+
+
+def json_response(content, response: Optional[Response] = None) -> Response:
+    """Render JSON-native content directly with the app's JSON class.
+
+    Skips FastAPI's jsonable_encoder pass, which costs far more than the
+    encoding itself on KPI payloads and conversation pages.  Headers set on
+    an injected ``response`` (ETag, Cache-Control) are carried over.
+    """
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    return app.router.default_response_class(content, headers=headers)
+
+
 # ─── API Endpoints ────────────────────────────────────────────────────
 
 @app.post("/api/settings")
@@ -168,7 +293,8 @@ async def get_settings_endpoint(db: Session = Depends(get_db)):
 
 @app.get("/api/agents")
 async def list_agents_endpoint(db: Session = Depends(get_db)):
-    return {"agents": get_agents(db)}
+    """Configured agents with last sync time/status and listing watermark."""
+    return {"agents": agent_records(db)}
 
 
 @app.post("/api/sync")
@@ -192,13 +318,30 @@ async def trigger_sync(req: SyncRequest, db: Session = Depends(get_db)):
 
     if req.agent_id:
         # Sync single specified agent
+        if sync_progress.active(req.agent_id):
+            raise HTTPException(409, "Synchronizacja agenta już trwa")
+        run_id = sync_progress.begin([req.agent_id])
         asyncio.create_task(_run_sync(req.agent_id, api_key, start_unix, end_unix))
-        return {"status": "started", "message": f"Synchronizacja agenta uruchomiona", "agents_count": 1}
+        return {"status": "started", "message": f"Synchronizacja agenta uruchomiona", "agents_count": 1, "run_id": run_id}
     else:
-        # Sync ALL configured agents
-        for agent in agents:
-            asyncio.create_task(_run_sync(agent["id"], api_key, start_unix, end_unix))
-        return {"status": "started", "message": f"Synchronizacja {len(agents)} agentów uruchomiona", "agents_count": len(agents)}
+        # Sync ALL configured agents; agents still syncing are left to finish
+        idle = [agent["id"] for agent in agents if not sync_progress.active(agent["id"])]
+        if not idle:
+            raise HTTPException(409, "Synchronizacja wszystkich agentów już trwa")
+        run_id = sync_progress.begin(idle)
+        for agent_id in idle:
+            asyncio.create_task(_run_sync(agent_id, api_key, start_unix, end_unix))
+        return {"status": "started", "message": f"Synchronizacja {len(idle)} agentów uruchomiona", "agents_count": len(idle), "run_id": run_id}
+
+
+@app.get("/api/sync/progress")
+async def sync_progress_stream(request: Request):
+    """Server-Sent Events: per-agent sync progress (pages, details, throughput, ETA)."""
+    return StreamingResponse(
+        sync_progress.event_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 async def _run_sync(agent_id, api_key, start_unix, end_unix):
@@ -211,35 +354,189 @@ async def _run_sync(agent_id, api_key, start_unix, end_unix):
             sync_type="manual",
         )
         logger.info(f"Manual sync completed for {agent_id[:12]}: {result}")
+    except sync_progress.SyncInProgress:
+        # A scheduled sync got there first; its progress is left alone
+        logger.info(f"Manual sync skipped for {agent_id[:12]}: a sync is already running")
     except Exception as e:
         logger.error(f"Manual sync failed for {agent_id[:12]}: {e}")
+        sync_progress.finish(agent_id, error=str(e))
+
+
+KPI_GRANULARITIES = ("day", "hour")
+MAX_HOURLY_RANGE_DAYS = 31
+
+
+def _range_bound(value: str, name: str) -> int:
+    """Unix time of a range bound; naive values are UTC and a date-only end covers its whole day."""
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(400, f"Nieprawidłowa data w parametrze {name}: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    if name == "end" and len(value) == 10:
+        moment += timedelta(days=1)
+    return int(moment.timestamp())
 
 
 @app.get("/api/kpis")
 async def get_kpis(
+    request: Request,
+    response: Response,
+    agent_id: str = Query(..., description="Agent ID"),
+    month: Optional[str] = None,
+    start: Optional[str] = Query(None, description="Range start, YYYY-MM-DD or YYYY-MM-DDTHH:MM (UTC)"),
+    end: Optional[str] = Query(None, description="Range end; a date includes the whole day (UTC)"),
+    granularity: str = Query("day", description="day | hour"),
+):
+    if granularity not in KPI_GRANULARITIES:
+        raise HTTPException(400, "Granulacja musi być jedną z: day, hour")
+    ranged = bool(start or end)
+    if ranged and month:
+        raise HTTPException(400, "Podaj miesiąc albo zakres dat, nie oba")
+    if granularity == "hour" and not ranged:
+        raise HTTPException(400, "Granulacja godzinowa wymaga zakresu dat (start/end)")
+    if ranged:
+        start_unix = _range_bound(start, "start") if start else 0
+        end_unix = _range_bound(end, "end") if end else int(time.time()) + 3600
+        if end_unix <= start_unix:
+            raise HTTPException(400, "Koniec zakresu musi być późniejszy niż początek")
+        if granularity == "hour" and end_unix - start_unix > MAX_HOURLY_RANGE_DAYS * 86400:
+            raise HTTPException(400, f"Zakres godzinowy może obejmować najwyżej {MAX_HOURLY_RANGE_DAYS} dni")
+    cached = not_modified(request, response, agent_id)
+    if cached:
+        return cached
+    if ranged:
+        kpis = await asyncio.to_thread(_with_session, range_kpis, agent_id, start_unix, end_unix, granularity)
+        return json_response(kpis, response)
+    try:
+        kpis = await compute_kpis_async(agent_id, month, request)
+    except (asyncio.TimeoutError, TimeoutError):
+        raise HTTPException(504, "Przekroczono czas obliczania KPI")
+    except KpiCancelled:
+        # The client is gone and nobody reads this; a standard empty status
+        # keeps access logs and metrics free of the nonstandard 499
+        return Response(status_code=204)
+    return json_response(kpis, response)
+
+
+MAX_COMPARE_AGENTS = 50
+
+
+@app.get("/api/kpis/compare")
+async def compare_agent_kpis(
+    request: Request,
+    response: Response,
+    agent_ids: str = Query(..., description="Comma-separated agent IDs"),
+    month: Optional[str] = None,
+):
+    """KPIs of several agents side by side plus their combined totals, in one request."""
+    ids = list(dict.fromkeys(a.strip() for a in agent_ids.split(",") if a.strip()))
+    if not ids:
+        raise HTTPException(400, "Podaj co najmniej jednego agenta")
+    if len(ids) > MAX_COMPARE_AGENTS:
+        raise HTTPException(400, f"Można porównać najwyżej {MAX_COMPARE_AGENTS} agentów")
+    cached = not_modified(request, response, *ids)
+    if cached:
+        return cached
+    try:
+        comparison = await compare_kpis_async(ids, month)
+    except (asyncio.TimeoutError, TimeoutError):
+        raise HTTPException(504, "Przekroczono czas obliczania KPI")
+    return json_response(comparison, response)
+
+
+@app.get("/api/analytics")
+def get_analytics(
+    request: Request,
+    response: Response,
     agent_id: str = Query(..., description="Agent ID"),
     month: Optional[str] = None,
     db: Session = Depends(get_db),
 ):
-    kpis = compute_kpis(db, agent_id, month)
-    return kpis
+    """Hour-of-day buckets, duration/message/cost percentiles and histograms."""
+    cached = not_modified(request, response, agent_id)
+    if cached:
+        return cached
+    return json_response(compute_distributions(db, agent_id, month), response)
+
+
+def conversation_filters(
+    status: Optional[str] = None,
+    call_successful: Optional[str] = None,
+    direction: Optional[str] = None,
+    source: Optional[str] = Query(None, description="conversation_initiation_source, e.g. twilio"),
+    min_duration: Optional[int] = Query(None, ge=0),
+    max_duration: Optional[int] = Query(None, ge=0),
+    min_cost: Optional[int] = Query(None, ge=0),
+    max_cost: Optional[int] = Query(None, ge=0),
+    criterion: Optional[str] = Query(None, pattern='^[^"]+$', description="Evaluation criterion ID"),
+    criterion_result: Optional[str] = Query(None, description="success, failure, unknown"),
+) -> dict:
+    """Filters shared by the conversation list and the CSV export."""
+    return {
+        "status": status,
+        "call_successful": call_successful,
+        "direction": direction,
+        "source": source,
+        "min_duration": min_duration,
+        "max_duration": max_duration,
+        "min_cost": min_cost,
+        "max_cost": max_cost,
+        "criterion": criterion,
+        "criterion_result": criterion_result,
+    }
 
 
 @app.get("/api/conversations")
 async def list_conversations(
+    request: Request,
+    response: Response,
     agent_id: str = Query(..., description="Agent ID"),
     month: Optional[str] = None,
     page: int = 1,
     per_page: int = 50,
+    sort: str = Query("start_time", pattern="^(start_time|duration|cost)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    filters: dict = Depends(conversation_filters),
     db: Session = Depends(get_db),
 ):
-    query = db.query(Conversation).filter(Conversation.agent_id == agent_id)
-    if month:
-        query = query.filter(Conversation.month_partition == month)
-    query = query.order_by(Conversation.start_time_unix.desc())
+    cached = not_modified(request, response, agent_id)
+    if cached:
+        return cached
+    return json_response(conversations_page(db, agent_id, month, page, per_page, sort, order, filters), response)
 
-    total = query.count()
-    conversations = query.offset((page - 1) * per_page).limit(per_page).all()
+
+def conversations_page(
+    db: Session,
+    agent_id: str,
+    month: Optional[str] = None,
+    page: int = 1,
+    per_page: int = 50,
+    sort: str = "start_time",
+    order: str = "desc",
+    filters: Optional[dict] = None,
+) -> dict:
+    filters = filters or {}
+
+    def build_query(source):
+        query = source.query(Conversation).filter(Conversation.agent_id == agent_id)
+        if month:
+            query = query.filter(Conversation.month_partition == month)
+        query = filter_conversations(query, filters)
+        return order_conversations(query, sort, order)
+
+    with month_source(db, agent_id, month) as sessions:
+        # Read before the page: changes made in between are re-sent, not lost
+        change_seq = max(
+            (s.query(func.max(Conversation.change_seq)).filter(Conversation.agent_id == agent_id).scalar() or 0
+             for s in sessions),
+            default=0,
+        )
+        total, conversations = paginate(
+            sessions, build_query, conversation_sort_key(sort),
+            (page - 1) * per_page, per_page, reverse=(order == "desc"),
+        )
 
     # Collect all unique criteria IDs across the page for column headers
     all_criteria_ids = set()
@@ -256,47 +553,133 @@ async def list_conversations(
 
     sorted_criteria_ids = sorted(all_criteria_ids)
 
-    conv_list = []
-    for c in conversations:
-        ecr = parsed_criteria.get(c.conversation_id, {})
-        criteria_results = {}
-        for crit_id in sorted_criteria_ids:
-            crit = ecr.get(crit_id)
-            if crit and isinstance(crit, dict):
-                criteria_results[crit_id] = crit.get("result", None)
-            else:
-                criteria_results[crit_id] = None
-
-        conv_list.append({
-            "conversation_id": c.conversation_id,
-            "agent_name": c.agent_name,
-            "status": c.status,
-            "call_successful": c.call_successful,
-            "start_time": datetime.utcfromtimestamp(c.start_time_unix).isoformat() if c.start_time_unix else None,
-            "duration_secs": c.call_duration_secs,
-            "message_count": c.message_count,
-            "direction": c.direction,
-            "agent_phone": c.agent_phone,
-            "client_phone": c.client_phone,
-            "conversation_source": c.conversation_initiation_source,
-            "rating": c.rating,
-            "termination_reason": c.termination_reason,
-            "cost": c.cost,
-            "transcript_summary": c.transcript_summary,
-            "criteria": criteria_results,
-        })
+    conv_list = [
+        conversation_row(c, parsed_criteria.get(c.conversation_id, {}), sorted_criteria_ids)
+        for c in conversations
+    ]
 
     return {
         "total": total,
         "page": page,
         "per_page": per_page,
         "criteria_columns": sorted_criteria_ids,
+        "change_seq": change_seq,
         "conversations": conv_list,
     }
 
 
+def conversation_row(c: Conversation, ecr: dict, criteria_ids: list) -> dict:
+    """One conversation as shown in the table (criteria results by ID)."""
+    criteria_results = {}
+    for crit_id in criteria_ids:
+        crit = ecr.get(crit_id)
+        if crit and isinstance(crit, dict):
+            criteria_results[crit_id] = crit.get("result", None)
+        else:
+            criteria_results[crit_id] = None
+
+    return {
+        "conversation_id": c.conversation_id,
+        "agent_name": c.agent_name,
+        "status": c.status,
+        "call_successful": c.call_successful,
+        "start_time": datetime.utcfromtimestamp(c.start_time_unix).isoformat() if c.start_time_unix else None,
+        "duration_secs": c.call_duration_secs,
+        "message_count": c.message_count,
+        "direction": c.direction,
+        "agent_phone": c.agent_phone,
+        "client_phone": c.client_phone,
+        "conversation_source": c.conversation_initiation_source,
+        "rating": c.rating,
+        "termination_reason": c.termination_reason,
+        "cost": c.cost,
+        "transcript_summary": c.transcript_summary,
+        "criteria": criteria_results,
+    }
+
+
+@app.get("/api/conversations/changes")
+async def conversation_changes(
+    agent_id: str = Query(..., description="Agent ID"),
+    since: int = Query(0, ge=0, description="Last change_seq the client has applied"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db),
+):
+    """Conversations inserted or updated after ``since`` (ascending change_seq).
+
+    Poll with ``since=next_since`` until ``has_more`` is false.  Archived
+    and evicted months are immutable and not part of the feed.
+    """
+    # Read before the rows: numbers reserved later are all above it, and
+    # numbers still pending on a shard write stop the feed until they commit.
+    horizon = change_seq_horizon(db)
+
+    def build_query(source):
+        return (
+            source.query(Conversation)
+            .filter(
+                Conversation.agent_id == agent_id,
+                Conversation.change_seq > since,
+                Conversation.change_seq < horizon,
+            )
+            .order_by(Conversation.change_seq)
+        )
+
+    with conversation_sessions(db) as sessions:
+        total, changed = paginate(sessions, build_query, lambda c: c.change_seq, 0, limit)
+
+    changes = []
+    for c in changed:
+        try:
+            ecr = json.loads(c.evaluation_criteria_results) if c.evaluation_criteria_results else {}
+        except (json.JSONDecodeError, TypeError):
+            ecr = {}
+        if not isinstance(ecr, dict):
+            ecr = {}
+        row = conversation_row(c, ecr, sorted(ecr))
+        row["month"] = c.month_partition
+        row["change_seq"] = c.change_seq
+        changes.append(row)
+
+    return json_response({
+        "since": since,
+        "next_since": changed[-1].change_seq if changed else since,
+        "has_more": total > len(changed),
+        "changes": changes,
+    })
+
+
+@app.get("/api/conversations/search")
+async def search_conversations_endpoint(
+    q: str = Query(..., min_length=1, description="Search text; words are AND-ed, trailing * = prefix"),
+    agent_id: Optional[str] = None,
+    month: Optional[str] = None,
+    page: int = 1,
+    per_page: int = 20,
+    db: Session = Depends(get_db),
+):
+    """Full-text search over titles, summaries and transcripts, ranked by relevance."""
+    started = time.perf_counter()
+    with conversation_sessions(db, month) as sessions:
+        total, hits = search_sessions(
+            sessions, q, agent_id=agent_id, month=month,
+            limit=per_page, offset=(page - 1) * per_page,
+        )
+    return json_response({
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "took_ms": round((time.perf_counter() - started) * 1000, 1),
+        "results": hits,
+    })
+
+
 @app.get("/api/sync-logs")
 async def list_sync_logs(db: Session = Depends(get_db)):
+    return sync_logs_list(db)
+
+
+def sync_logs_list(db: Session) -> list[dict]:
     logs = db.query(SyncLog).order_by(SyncLog.started_at.desc()).limit(50).all()
     return [
         {
@@ -309,6 +692,17 @@ async def list_sync_logs(db: Session = Depends(get_db)):
             "details_fetched": l.details_fetched,
             "status": l.status,
             "error_message": l.error_message,
+            "phases": {
+                "listing_secs": l.listing_secs,
+                "write_secs": l.write_secs,
+                "detail_fetch_secs": l.detail_fetch_secs,
+                "throttle_secs": l.throttle_secs,
+                "commit_secs": l.commit_secs,
+            },
+            "api_calls": l.api_calls,
+            "api_retries": l.api_retries,
+            "bytes_downloaded": l.bytes_downloaded,
+            "rows_written": l.rows_written,
         }
         for l in logs
     ]
@@ -316,26 +710,100 @@ async def list_sync_logs(db: Session = Depends(get_db)):
 
 @app.get("/api/months")
 async def list_months(
+    request: Request,
+    response: Response,
     agent_id: str = Query(..., description="Agent ID"),
     db: Session = Depends(get_db),
 ):
+    cached = not_modified(request, response, agent_id)
+    if cached:
+        return cached
     return {"months": get_available_months(db, agent_id)}
 
 
+DASHBOARD_PARTS = ("months", "kpis", "conversations", "sync_logs", "archives")
+# Embedded in the HTML page: everything but the KPI computation
+BOOTSTRAP_PARTS = tuple(p for p in DASHBOARD_PARTS if p != "kpis")
+
+
+def _with_session(fn, *args):
+    """Run ``fn(db, *args)`` on a session of its own (one per worker thread)."""
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+async def _bundle_kpis(agent_id: str, month: Optional[str]) -> Optional[dict]:
+    """KPIs for the bundle; None when they time out (the dashboard then asks /api/kpis)."""
+    try:
+        return await compute_kpis_async(agent_id, month)
+    except (asyncio.TimeoutError, TimeoutError):
+        return None
+
+
+async def dashboard_bundle(agent_id: Optional[str], month: Optional[str] = None, parts=DASHBOARD_PARTS) -> dict:
+    """Everything the initial dashboard view needs, computed concurrently."""
+    jobs = {}
+    if agent_id:
+        if "months" in parts:
+            jobs["months"] = asyncio.to_thread(_with_session, get_available_months, agent_id)
+        if "kpis" in parts:
+            jobs["kpis"] = _bundle_kpis(agent_id, month)
+        if "conversations" in parts:
+            jobs["conversations"] = asyncio.to_thread(_with_session, conversations_page, agent_id, month)
+    if "sync_logs" in parts:
+        jobs["sync_logs"] = asyncio.to_thread(_with_session, sync_logs_list)
+    if "archives" in parts:
+        jobs["archives"] = asyncio.to_thread(_with_session, archives_list)
+
+    results = await asyncio.gather(*jobs.values())
+    return {"agent_id": agent_id, "month": month, **dict(zip(jobs, results))}
+
+
+@app.get("/api/dashboard")
+async def dashboard_data(
+    agent_id: Optional[str] = Query(None, description="Agent ID (default: first configured agent)"),
+    month: Optional[str] = None,
+    include: Optional[str] = Query(None, description="Comma-separated parts: " + ",".join(DASHBOARD_PARTS)),
+    db: Session = Depends(get_db),
+):
+    """Bootstrap data for the dashboard in a single round trip."""
+    if not agent_id:
+        agents = get_agents(db)
+        agent_id = agents[0]["id"] if agents else None
+    parts = DASHBOARD_PARTS
+    if include:
+        parts = tuple(p for p in include.split(",") if p in DASHBOARD_PARTS)
+    return json_response(await dashboard_bundle(agent_id, month, parts))
+
+
 @app.post("/api/archive")
 async def trigger_archive(
     month: str = Query(...),
     agent_id: str = Query(..., description="Agent ID"),
+    evict: bool = Query(False, description="Remove archived rows from the hot database"),
     db: Session = Depends(get_db),
 ):
     filepath = archive_month_to_csv(db, agent_id, month)
     if not filepath:
         raise HTTPException(404, "Brak konwersacji dla tego miesiąca i agenta")
-    return {"status": "ok", "file": filepath}
+    evicted = 0
+    if evict:
+        try:
+            evicted = evict_month(db, agent_id, month)
+        except ValueError:
+            raise HTTPException(409, "Archiwum nie obejmuje wszystkich danych z bazy")
+    return {"status": "ok", "file": filepath, "evicted": evicted}
 
 
 @app.get("/api/archives")
 async def list_archives(db: Session = Depends(get_db)):
+    return archives_list(db)
+
+
+def archives_list(db: Session) -> list[dict]:
     logs = db.query(ArchiveLog).order_by(ArchiveLog.archived_at.desc()).all()
     return [
         {
@@ -343,6 +811,7 @@ async def list_archives(db: Session = Depends(get_db)):
             "month": a.month_partition,
             "agent_id": a.agent_id,
             "file_path": a.file_path,
+            "queryable": bool(a.db_path and os.path.exists(a.db_path)),
             "records_count": a.records_count,
             "archived_at": a.archived_at.isoformat() if a.archived_at else None,
         }
@@ -350,28 +819,43 @@ async def list_archives(db: Session = Depends(get_db)):
     ]
 
 
+@app.post("/api/reextract-phones")
+async def reextract_phones_endpoint(agent_id: Optional[str] = Query(None, description="Agent ID (all agents if empty)")):
+    """Re-run phone extraction over stored raw details, without calling the API."""
+    result = await asyncio.to_thread(_with_session, reextract_phones, agent_id)
+    return {"status": "ok", **result}
+
+
 @app.post("/api/refetch-details")
 async def refetch_details(
     agent_id: str = Query(..., description="Agent ID"),
     db: Session = Depends(get_db),
 ):
-    """Reset details_fetched flag for conversations missing phone numbers, so next sync re-fetches them."""
+    """Fix missing phone numbers: re-extract from stored raw details, then re-fetch the rest from the API."""
     api_key = get_setting(db, "api_key")
     if not api_key:
         raise HTTPException(400, "API key nie skonfigurowany")
 
-    # Reset details_fetched for conversations that have no phone numbers
-    updated = (
-        db.query(Conversation)
-        .filter(
-            Conversation.agent_id == agent_id,
-            Conversation.details_fetched == True,
-            (Conversation.agent_phone == None) | (Conversation.agent_phone == ""),
-            (Conversation.client_phone == None) | (Conversation.client_phone == ""),
-        )
-        .update({Conversation.details_fetched: False}, synchronize_session="fetch")
-    )
-    db.commit()
+    reextracted = await asyncio.to_thread(_with_session, reextract_phones, agent_id)
+
+    # Reset details_fetched for conversations that have no phone numbers and no
+    # stored raw detail (those with one were just re-extracted)
+    updated = 0
+    with conversation_sessions(db, write=True) as sessions:
+        for source in sessions:
+            stored = source.query(ConversationRawDetail.conversation_id)
+            updated += (
+                source.query(Conversation)
+                .filter(
+                    Conversation.agent_id == agent_id,
+                    Conversation.details_fetched == True,
+                    (Conversation.agent_phone == None) | (Conversation.agent_phone == ""),
+                    (Conversation.client_phone == None) | (Conversation.client_phone == ""),
+                    Conversation.conversation_id.not_in(stored),
+                )
+                .update({Conversation.details_fetched: False}, synchronize_session=False)
+            )
+            source.commit()
 
     if updated > 0:
         # Auto-trigger sync in background
@@ -379,7 +863,13 @@ async def refetch_details(
         first_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         asyncio.create_task(_run_sync(agent_id, api_key, int(first_of_month.timestamp()), int(now.timestamp())))
 
-    return {"status": "ok", "conversations_reset": updated, "message": f"Zresetowano {updated} konwersacji. Ponowne pobieranie szczegółów uruchomione."}
+    return {
+        "status": "ok",
+        "conversations_reextracted": reextracted["updated"],
+        "conversations_reset": updated,
+        "message": f"Poprawiono lokalnie {reextracted['updated']} konwersacji. "
+                   f"Zresetowano {updated} konwersacji. Ponowne pobieranie szczegółów uruchomione.",
+    }
 
 
 @app.get("/api/download-csv/{archive_id}")
@@ -390,127 +880,146 @@ async def download_csv(archive_id: int, db: Session = Depends(get_db)):
     return FileResponse(archive.file_path, media_type="text/csv", filename=os.path.basename(archive.file_path))
 
 
+DEBUG_SAMPLE_MAX = 2000
+
+
+def _debug_selection(db: Session, agent_id: str, conversation_id: Optional[str], limit: int, sample: int):
+    """Ids to show in full, the statistics sample, stored phones and stored raw details."""
+    with conversation_sessions(db) as sessions:
+        if conversation_id:
+            shown = [conversation_id]
+        else:
+            # Pick some with phone numbers and some without
+            has_phone = (Conversation.agent_phone != None) & (Conversation.agent_phone != "")
+            with_phones, without_phones = [], []
+            for source in sessions:
+                base = source.query(Conversation.conversation_id).filter(Conversation.agent_id == agent_id)
+                if len(with_phones) < 2:
+                    with_phones += [r[0] for r in base.filter(has_phone).limit(2 - len(with_phones))]
+                if len(without_phones) < 3:
+                    without_phones += [r[0] for r in base.filter(~has_phone).limit(3 - len(without_phones))]
+            shown = (with_phones + without_phones)[:limit]
+
+        # Newest conversations with details, merged across shards
+        recent = []
+        for source in sessions:
+            recent += (
+                source.query(Conversation.conversation_id, Conversation.start_time_unix)
+                .filter(Conversation.agent_id == agent_id, Conversation.details_fetched == True)
+                .order_by(Conversation.start_time_unix.desc())
+                .limit(sample)
+                .all()
+            )
+        sampled = [r.conversation_id for r in sorted(recent, key=lambda r: r.start_time_unix, reverse=True)[:sample]]
+
+        ids = list(dict.fromkeys(shown + sampled))
+        phone_ids = set()
+        for source in sessions:
+            for i in range(0, len(ids), 500):
+                phone_ids.update(
+                    r[0] for r in source.query(Conversation.conversation_id)
+                    .filter(
+                        Conversation.conversation_id.in_(ids[i:i + 500]),
+                        Conversation.agent_phone != None,
+                        Conversation.agent_phone != "",
+                    )
+                )
+        details = load_raw_details(sessions, ids)
+    return shown, sampled, phone_ids, details
+
+
+def _debug_report(shown: list, sampled: list, phone_ids: set, details: dict, stored: int, errors: dict) -> dict:
+    diagnostics = []
+    for cid in shown:
+        if cid in errors:
+            diagnostics.append({"conversation_id": cid, "error": str(errors[cid])})
+            continue
+        detail = details[cid]
+        scan = scan_detail(detail)
+        phone_paths = [{"path": path, "value": value} for path, value in scan.phone_values]
+        for role, found in explain_phone_numbers(detail, scan).items():
+            phone_paths.append({"path": found["path"], "value": str(found["value"]),
+                                "reason": f"{role}_phone ({found['kind']})"})
+
+        meta = detail.get("metadata", {})
+        meta_keys = list(meta.keys()) if isinstance(meta, dict) else str(type(meta))
+        body = meta.get("body", {}) if isinstance(meta, dict) else {}
+        body_keys = list(body.keys()) if isinstance(body, dict) else str(type(body))
+        cicd = detail.get("conversation_initiation_client_data", {})
+        cicd_keys = list(cicd.keys()) if isinstance(cicd, dict) else str(type(cicd))
+
+        # Dump entire metadata and cicd as raw JSON for inspection
+        diagnostics.append({
+            "conversation_id": cid,
+            "has_phone_in_db": cid in phone_ids,
+            "phone_paths_found": phone_paths,
+            "metadata_keys": meta_keys,
+            "metadata_body_keys": body_keys,
+            "metadata_body_raw": body if isinstance(body, dict) else str(body),
+            "metadata_phone_call": meta.get("phone_call") if isinstance(meta, dict) else None,
+            "cicd_keys": cicd_keys,
+            "cicd_dynamic_variables": cicd.get("dynamic_variables") if isinstance(cicd, dict) else None,
+            "full_metadata_raw": meta,
+        })
+
+    sample_details = [details[cid] for cid in sampled if cid in details]
+    return {
+        "diagnostics": diagnostics,
+        "total_checked": len(diagnostics),
+        "sample": {
+            "size": len(sampled),
+            "from_store": stored,
+            "fetched": len(details) - stored,
+            "errors": len(errors),
+            "with_phone_in_db": sum(1 for cid in sampled if cid in phone_ids),
+            **path_statistics(sample_details),
+        },
+    }
+
+
 @app.get("/api/debug-metadata")
 async def debug_metadata(
     agent_id: str = Query(..., description="Agent ID"),
     conversation_id: Optional[str] = None,
-    limit: int = 5,
+    limit: int = Query(5, ge=1, le=50),
+    sample: int = Query(500, ge=0, le=DEBUG_SAMPLE_MAX),
     db: Session = Depends(get_db),
 ):
     """
-    Diagnostic endpoint: fetch raw JSON detail from ElevenLabs API for
-    conversations and find ALL keys/paths that contain phone-like values.
-    Useful for discovering where phone numbers actually reside.
-    """
-    import re
-    from elevenlabs_client import ElevenLabsClient
+    Diagnostic endpoint: where do phone numbers sit in conversation details?
 
+    ``limit`` conversations (or ``conversation_id``) are shown in full; path
+    statistics are aggregated over the newest ``sample`` conversations.
+    Stored raw details are used where available, the rest is fetched from
+    the API in parallel.
+    """
     api_key = get_setting(db, "api_key")
     if not api_key:
         raise HTTPException(400, "API key nie skonfigurowany")
 
-    client = ElevenLabsClient(api_key)
-
-    # Collect conversations to inspect
-    if conversation_id:
-        conv_ids = [conversation_id]
-    else:
-        # Pick some with phone numbers and some without
-        with_phones = (
-            db.query(Conversation.conversation_id)
-            .filter(
-                Conversation.agent_id == agent_id,
-                Conversation.agent_phone != None,
-                Conversation.agent_phone != "",
-            )
-            .limit(2)
-            .all()
-        )
-        without_phones = (
-            db.query(Conversation.conversation_id)
-            .filter(
-                Conversation.agent_id == agent_id,
-                (Conversation.agent_phone == None) | (Conversation.agent_phone == ""),
-            )
-            .limit(3)
-            .all()
-        )
-        conv_ids = [r[0] for r in with_phones] + [r[0] for r in without_phones]
-
-    phone_pattern = re.compile(r'(\+?\d[\d\s\-]{6,15}\d)')
-
-    def find_phone_paths(obj, path=""):
-        """Recursively find all paths in JSON that contain phone-like values."""
-        results = []
-        if isinstance(obj, dict):
-            for k, v in obj.items():
-                new_path = f"{path}.{k}" if path else k
-                results.extend(find_phone_paths(v, new_path))
-        elif isinstance(obj, list):
-            for i, v in enumerate(obj):
-                new_path = f"{path}[{i}]"
-                results.extend(find_phone_paths(v, new_path))
-        elif isinstance(obj, str):
-            if phone_pattern.search(obj):
-                results.append({"path": path, "value": obj})
-            # Also flag phone-related key names
-            lower_path = path.lower()
-            if any(kw in lower_path for kw in ("phone", "number", "caller", "called", "from", "to", "sip", "dial", "tel")):
-                results.append({"path": path, "value": str(obj), "reason": "phone-related key name"})
-        elif isinstance(obj, (int, float)):
-            s = str(obj)
-            if len(s) >= 8 and phone_pattern.search(s):
-                results.append({"path": path, "value": s, "reason": "numeric phone-like"})
-        return results
+    shown, sampled, phone_ids, details = await asyncio.to_thread(
+        _with_session, _debug_selection, agent_id, conversation_id, limit, sample
+    )
+    stored = len(details)
+    missing = [cid for cid in dict.fromkeys(shown + sampled) if cid not in details]
+    errors = {}
+    if missing:
+        for cid, result in (await ElevenLabsClient(api_key).fetch_details(missing)).items():
+            if isinstance(result, Exception):
+                errors[cid] = result
+            else:
+                details[cid] = result
 
-    diagnostics = []
-    for cid in conv_ids[:limit]:
-        try:
-            detail = await client.get_conversation_detail(cid)
-            # Find all phone-like paths
-            phone_paths = find_phone_paths(detail)
-            # Also dump top-level metadata structure
-            meta = detail.get("metadata", {})
-            meta_keys = list(meta.keys()) if isinstance(meta, dict) else str(type(meta))
-            body = meta.get("body", {}) if isinstance(meta, dict) else {}
-            body_keys = list(body.keys()) if isinstance(body, dict) else str(type(body))
-
-            # Check conversation_initiation_client_data
-            cicd = detail.get("conversation_initiation_client_data", {})
-            cicd_keys = list(cicd.keys()) if isinstance(cicd, dict) else str(type(cicd))
-
-            # Dump entire metadata and cicd as raw JSON for inspection
-            diagnostics.append({
-                "conversation_id": cid,
-                "has_phone_in_db": bool(
-                    db.query(Conversation)
-                    .filter(
-                        Conversation.conversation_id == cid,
-                        Conversation.agent_phone != None,
-                        Conversation.agent_phone != "",
-                    )
-                    .first()
-                ),
-                "phone_paths_found": phone_paths,
-                "metadata_keys": meta_keys,
-                "metadata_body_keys": body_keys,
-                "metadata_body_raw": body if isinstance(body, dict) else str(body),
-                "metadata_phone_call": meta.get("phone_call") if isinstance(meta, dict) else None,
-                "cicd_keys": cicd_keys,
-                "cicd_dynamic_variables": cicd.get("dynamic_variables") if isinstance(cicd, dict) else None,
-                "full_metadata_raw": meta,
-            })
-            await asyncio.sleep(0.2)
-        except Exception as e:
-            diagnostics.append({"conversation_id": cid, "error": str(e)})
-
-    return {"diagnostics": diagnostics, "total_checked": len(diagnostics)}
+    return await asyncio.to_thread(_debug_report, shown, sampled, phone_ids, details, stored, errors)
 
 
 @app.get("/api/export-csv")
 async def export_csv_on_demand(
     agent_id: str = Query(..., description="Agent ID"),
     month: Optional[str] = None,
+    sort: str = Query("start_time", pattern="^(start_time|duration|cost)$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    filters: dict = Depends(conversation_filters),
     db: Session = Depends(get_db),
 ):
     """Export currently filtered conversations to CSV on demand (no pagination limit)."""
@@ -518,12 +1027,15 @@ async def export_csv_on_demand(
     import io
     import tempfile
 
-    query = db.query(Conversation).filter(Conversation.agent_id == agent_id)
-    if month:
-        query = query.filter(Conversation.month_partition == month)
-    query = query.order_by(Conversation.start_time_unix.desc())
-
-    conversations = query.all()
+    conversations = []
+    with month_source(db, agent_id, month) as sessions:
+        for source in sessions:
+            query = source.query(Conversation).filter(Conversation.agent_id == agent_id)
+            if month:
+                query = query.filter(Conversation.month_partition == month)
+            query = filter_conversations(query, filters)
+            conversations.extend(order_conversations(query, sort, order).all())
+    conversations.sort(key=conversation_sort_key(sort), reverse=(order == "desc"))
     if not conversations:
         raise HTTPException(404, "Brak danych do eksportu")
 
@@ -585,6 +1097,35 @@ async def export_csv_on_demand(
     )
 
 
+# ─── Metrics ──────────────────────────────────────────────────────────
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint (text exposition format)."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+# ─── Profiling ────────────────────────────────────────────────────────
+
+@app.get("/api/profiles")
+async def get_profiles():
+    """Kept request profiles (PROFILE_REQUESTS=1), newest first."""
+    return {"enabled": PROFILE_REQUESTS, "threshold_ms": PROFILE_THRESHOLD_MS, "profiles": list_profiles()}
+
+
+@app.get("/api/profiles/{profile_id}")
+async def download_profile(profile_id: int, format: str = Query("json", pattern="^(json|folded)$")):
+    """One profile as a JSON report, or as collapsed stacks for flame graph tools."""
+    profile = get_profile(profile_id)
+    if profile is None:
+        raise HTTPException(404, "Nie znaleziono profilu")
+    if format == "folded":
+        return PlainTextResponse(profile.folded(), headers={
+            "Content-Disposition": f'attachment; filename="profile_{profile_id}.folded"',
+        })
+    return profile.report()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000)
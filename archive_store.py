@@ -0,0 +1,235 @@
+"""Per-month SQLite archives that stay queryable after leaving the hot database."""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from data_version import bump as bump_data_version
+from database import Conversation, ConversationRawDetail, ArchiveLog, add_missing_columns
+from search_service import FTS_IDS_TABLE, FTS_TABLE, remove_from_index
+from shards import SHARD_BY_MONTH, conversation_sessions, drop_shard_if_empty
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DB_DIR = os.path.join(os.path.dirname(__file__), "db_archives")
+os.makedirs(ARCHIVE_DB_DIR, exist_ok=True)
+
+_ARCHIVE_FILE_RE = re.compile(r"^conversations_(.+)_\d{4}-\d{2}\.db$")  # archive_db_path names
+
+# Archives are read-only, so they can be memory-mapped in full.
+ARCHIVE_MMAP_SIZE = 256 * 1024 * 1024
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def archive_db_path(agent_id: str, month_partition: str) -> str:
+    return os.path.join(ARCHIVE_DB_DIR, f"conversations_{agent_id}_{month_partition}.db")
+
+
+def write_archive_db(conversations: list, agent_id: str, month_partition: str) -> str:
+    """Write conversations into a standalone SQLite file with the hot schema.
+
+    The file reuses the ``conversations`` table definition (including the
+    ``start_time_unix`` index), so the regular KPI and listing queries run
+    against it unchanged.  It holds only this agent's conversations, also in
+    sharded mode, where the month shard has every agent's rows.
+    """
+    path = archive_db_path(agent_id, month_partition)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    columns = Conversation.__table__.columns
+    rows = [{col.name: getattr(c, col.key) for col in columns} for c in conversations]
+
+    engine = create_engine(f"sqlite:///{tmp_path}")
+    try:
+        Conversation.__table__.create(bind=engine)
+        with engine.begin() as conn:
+            if rows:
+                conn.execute(Conversation.__table__.insert(), rows)
+    finally:
+        engine.dispose()
+
+    _dispose_engine(path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def migrate_archives():
+    """Bring archive files up to the current conversations schema."""
+    for name in os.listdir(ARCHIVE_DB_DIR):
+        match = _ARCHIVE_FILE_RE.match(name)
+        if not match:
+            continue
+        path = os.path.join(ARCHIVE_DB_DIR, name)
+        _dispose_engine(path)
+        engine = create_engine(f"sqlite:///{path}")
+        try:
+            add_missing_columns(engine, [Conversation.__table__])
+        finally:
+            engine.dispose()
+        _strip_shard_copy(path, match.group(1))
+
+
+def _strip_shard_copy(path: str, agent_id: str):
+    """Reduce an archive made as a copy of a whole month shard to the agent's own conversations."""
+    conn = sqlite3.connect(path)
+    try:
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        foreign = conn.execute("SELECT 1 FROM conversations WHERE agent_id != ? LIMIT 1", (agent_id,)).fetchone()
+        extra = [t for t in (FTS_TABLE, FTS_IDS_TABLE, ConversationRawDetail.__tablename__) if t in tables]
+        if not foreign and not extra:
+            return
+        with conn:
+            conn.execute("DELETE FROM conversations WHERE agent_id != ?", (agent_id,))
+            for table in extra:
+                conn.execute(f"DROP TABLE {table}")
+        conn.execute("VACUUM")
+        logger.info(f"Stripped other agents' data from archive {path}")
+    finally:
+        conn.close()
+
+
+def _dispose_engine(path: str):
+    with _engines_lock:
+        engine = _engines.pop(path, None)
+    if engine is not None:
+        engine.dispose()
+
+
+def _readonly_engine(path: str):
+    with _engines_lock:
+        engine = _engines.get(path)
+        if engine is None:
+            uri = Path(path).absolute().as_uri() + "?mode=ro"
+            engine = create_engine(
+                "sqlite://",
+                creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+            )
+
+            @event.listens_for(engine, "connect")
+            def _set_pragmas(dbapi_conn, _record):
+                cursor = dbapi_conn.cursor()
+                cursor.execute(f"PRAGMA mmap_size={ARCHIVE_MMAP_SIZE}")
+                cursor.execute("PRAGMA query_only=1")
+                cursor.close()
+
+            _engines[path] = engine
+        return engine
+
+
+@contextmanager
+def archive_session(path: str):
+    """Open a read-only ORM session on an archive file."""
+    session = Session(bind=_readonly_engine(path))
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def find_archive_db(db: Session, agent_id: str, month_partition: str) -> Optional[str]:
+    """Return the newest queryable archive file for agent/month, if any."""
+    logs = (
+        db.query(ArchiveLog.db_path)
+        .filter(
+            ArchiveLog.agent_id == agent_id,
+            ArchiveLog.month_partition == month_partition,
+            ArchiveLog.db_path != None,
+        )
+        .order_by(ArchiveLog.archived_at.desc())
+        .all()
+    )
+    for (path,) in logs:
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def archived_months(db: Session, agent_id: str) -> list[str]:
+    """Month partitions with a queryable archive file for agent."""
+    rows = (
+        db.query(ArchiveLog.month_partition, ArchiveLog.db_path)
+        .filter(ArchiveLog.agent_id == agent_id, ArchiveLog.db_path != None)
+        .distinct()
+        .all()
+    )
+    return sorted({month for month, path in rows if os.path.exists(path)}, reverse=True)
+
+
+def _has_rows(sessions: list, agent_id: str, month_partition: str) -> bool:
+    return any(
+        s.query(Conversation.conversation_id)
+        .filter(Conversation.agent_id == agent_id, Conversation.month_partition == month_partition)
+        .first()
+        is not None
+        for s in sessions
+    )
+
+
+@contextmanager
+def month_source(db: Session, agent_id: str, month: Optional[str]):
+    """Yield the sessions holding agent/month data: hot (or sharded) or archive.
+
+    The hot database wins whenever it still has rows for the month, so
+    archiving without eviction changes nothing for readers.
+    """
+    with conversation_sessions(db, month) as sessions:
+        if not month or _has_rows(sessions, agent_id, month):
+            yield sessions
+            return
+
+        path = find_archive_db(db, agent_id, month)
+        if not path:
+            yield sessions
+            return
+
+    with archive_session(path) as session:
+        yield [session]
+
+
+def evict_month(db: Session, agent_id: str, month_partition: str) -> int:
+    """Delete archived agent/month rows from the hot database.
+
+    In sharded mode a shard left without rows is removed as a whole file.
+    """
+    path = find_archive_db(db, agent_id, month_partition)
+    if not path:
+        raise ValueError(f"No queryable archive for {agent_id} {month_partition}")
+
+    with archive_session(path) as archive:
+        archived = (
+            archive.query(Conversation)
+            .filter(Conversation.agent_id == agent_id, Conversation.month_partition == month_partition)
+            .count()
+        )
+    with conversation_sessions(db, month_partition, write=True) as (hot_db,):
+        hot = (
+            hot_db.query(Conversation)
+            .filter(Conversation.agent_id == agent_id, Conversation.month_partition == month_partition)
+        )
+        if hot.count() > archived:
+            raise ValueError(f"Archive for {agent_id} {month_partition} is older than the hot data")
+
+        hot_db.query(ConversationRawDetail).filter(
+            ConversationRawDetail.conversation_id.in_(hot.with_entities(Conversation.conversation_id))
+        ).delete(synchronize_session=False)
+        deleted = hot.delete(synchronize_session=False)
+        remove_from_index(hot_db, agent_id, month_partition)
+        hot_db.commit()
+
+    if SHARD_BY_MONTH:
+        drop_shard_if_empty(month_partition)
+    bump_data_version(db, agent_id)
+    logger.info(f"Evicted {deleted} conversations for {agent_id} {month_partition} from hot database")
+    return deleted
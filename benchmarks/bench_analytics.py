@@ -0,0 +1,103 @@
+"""Row-by-row vs vectorized KPI aggregation and distributions.
+
+Usage: python benchmarks/bench_analytics.py [rows ...]   (default: 10000 100000 1000000)
+
+Builds synthetic columnar batches (the shape iter_kpi_batches yields) in
+memory, so database reads are left out and both sides see the same input.
+Times the pure Python partials (kpis.aggregate_batch) against
+analytics.aggregate_batch, and analytics.distributions with and without
+NumPy, and checks that both produce identical results.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import analytics  # noqa: E402
+import kpis  # noqa: E402
+
+BATCH_SIZE = 5000  # sync_service.KPI_BATCH_SIZE
+START = 1767225600  # 2026-01-01
+CRITERIA = ["id_greeting", "id_identity_check", "id_resolution", "id_upsell", "id_goodbye"]
+
+
+def make_batches(rows: int) -> list[dict]:
+    rnd = random.Random(11)
+    batches = []
+    for offset in range(0, rows, BATCH_SIZE):
+        n = min(BATCH_SIZE, rows - offset)
+        columns = {
+            "call_successful": [rnd.choice(("success", "success", "failure", "unknown")) for _ in range(n)],
+            "direction": [rnd.choice(("inbound", "outbound")) for _ in range(n)],
+            "status": [rnd.choice(("done", "done", "done", "failed", "initiated")) for _ in range(n)],
+            "termination_reason": [rnd.choice(("end_call", "client hang up", "transfer_to_number", None))
+                                   for _ in range(n)],
+            # A rationale per conversation, as the API returns it, so the JSON is rarely repeated
+            "evaluation_criteria_results": [
+                json.dumps({c: {"criteria_id": c, "result": rnd.choice(("success", "failure")),
+                                "rationale": f"Rozmowa {offset + i}: kryterium ocenione automatycznie."}
+                            for c in CRITERIA})
+                for i in range(n)
+            ],
+            "call_duration_secs": [rnd.choice((0, rnd.randint(5, 900))) for _ in range(n)],
+            "message_count": [rnd.randint(0, 60) for _ in range(n)],
+            "cost": [rnd.randint(0, 3000) for _ in range(n)],
+            "rating": [rnd.choice((None, None, 3.0, 4.5, 5.0)) for _ in range(n)],
+            "start_time_unix": [START + rnd.randint(0, 86400 * 365) for _ in range(n)],
+        }
+        batches.append({c: tuple(columns[c]) for c in kpis.KPI_COLUMNS})
+    return batches
+
+
+def kpis_with(aggregate, batches: list[dict]) -> dict:
+    partial = None
+    for batch in batches:
+        partial = kpis.merge_partials(partial, aggregate(batch))
+    return kpis.finalize_kpis("agent_bench", None, partial)
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def without_numpy(fn, *args):
+    np, analytics.np = analytics.np, None
+    try:
+        return fn(*args)
+    finally:
+        analytics.np = np
+
+
+def distributions_for(batches: list[dict]) -> dict:
+    return analytics.distributions("agent_bench", None, analytics.load_columns(batches))
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    if analytics.np is None:
+        print("NumPy is not installed: analytics falls back to pure Python, nothing to compare")
+        return
+    print(f"{'rows':>9} | {'KPIs rows':>10} {'KPIs vec':>9} {'speedup':>7} | "
+          f"{'dist rows':>10} {'dist vec':>9} {'speedup':>7}")
+    for rows in sizes:
+        batches = make_batches(rows)
+        baseline, base_secs = timed(kpis_with, kpis.aggregate_batch, batches)
+        vectorized, vec_secs = timed(kpis_with, analytics.aggregate_batch, batches)
+        assert vectorized == baseline, "vectorized KPIs differ from the row-by-row ones"
+
+        dist_base, dist_base_secs = timed(without_numpy, distributions_for, batches)
+        dist_vec, dist_vec_secs = timed(distributions_for, batches)
+        assert dist_vec == dist_base, "vectorized distributions differ from the pure Python ones"
+
+        print(f"{rows:>9} | {base_secs:>9.3f}s {vec_secs:>8.3f}s {base_secs / vec_secs:>6.1f}x | "
+              f"{dist_base_secs:>9.3f}s {dist_vec_secs:>8.3f}s {dist_base_secs / dist_vec_secs:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Per-document cost of phone number extraction over recorded detail fixtures.
+
+Usage: python benchmarks/bench_phone_extractor.py [repeat]
+
+Runs :func:`phone_extractor.extract_phone_numbers` and the previous
+multi-walk implementation (kept below for reference) on every document in
+``fixtures/conversation_details.json``, checks that both return the same
+numbers and prints the time per document: without and with the fixture's
+``conversation_initiation_source`` (``source``), next to the cost of a full
+:func:`phone_extractor.scan_detail` walk.
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from phone_extractor import extract_phone_numbers, scan_detail  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "conversation_details.json")
+
+
+# ─── Previous implementation ─────────────────────────────────
+
+def legacy_deep_find_phone_values(obj, path=""):
+    phone_re = re.compile(r'^\+?\d[\d\s\-]{6,15}\d$')
+    results = []
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            new_path = f"{path}.{k}" if path else k
+            results.extend(legacy_deep_find_phone_values(v, new_path))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            results.extend(legacy_deep_find_phone_values(v, f"{path}[{i}]"))
+    elif isinstance(obj, str):
+        stripped = obj.strip()
+        if phone_re.match(stripped):
+            results.append((path, stripped))
+    return results
+
+
+def legacy_deep_search_in_dict(d, existing_agent, existing_client, result):
+    agent_keywords = {"agent_number", "to_number", "To", "Called", "agent_phone",
+                      "called_number", "bot_number", "destination_number", "dialed_number",
+                      "agent_phone_number", "to"}
+    client_keywords = {"from_number", "From", "Caller", "external_number", "customer_number",
+                       "caller_number", "client_phone", "source_number", "originating_number",
+                       "customer_phone", "phone_number", "phone", "from", "caller_phone_number"}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            legacy_deep_search_in_dict(v, existing_agent, existing_client, result)
+        elif isinstance(v, str) and v.strip():
+            if not existing_agent and not result.get("agent") and k in agent_keywords:
+                result["agent"] = v.strip()
+            if not existing_client and not result.get("client") and k in client_keywords:
+                result["client"] = v.strip()
+
+
+def legacy_extract_phone_numbers(detail, meta):
+    agent_phone = None
+    client_phone = None
+
+    body = meta.get("body", {})
+    if body and isinstance(body, dict):
+        if body.get("To"):
+            agent_phone = body["To"]
+        if body.get("From"):
+            client_phone = body["From"]
+        if not agent_phone and body.get("to_number"):
+            agent_phone = body["to_number"]
+        if not client_phone and body.get("from_number"):
+            client_phone = body["from_number"]
+        if not agent_phone and body.get("to"):
+            agent_phone = body["to"]
+        if not client_phone and body.get("from"):
+            client_phone = body["from"]
+        if not agent_phone and body.get("Called"):
+            agent_phone = body["Called"]
+        if not client_phone and body.get("Caller"):
+            client_phone = body["Caller"]
+
+    phone_call = meta.get("phone_call", {})
+    if phone_call and isinstance(phone_call, dict):
+        if not agent_phone:
+            agent_phone = phone_call.get("agent_number") or phone_call.get("to_number") or phone_call.get("to")
+        if not client_phone:
+            client_phone = phone_call.get("external_number") or phone_call.get("from_number") or phone_call.get("from")
+        if not agent_phone:
+            agent_phone = phone_call.get("agent_phone_number") or phone_call.get("called_number")
+        if not client_phone:
+            client_phone = phone_call.get("caller_phone_number") or phone_call.get("caller_number")
+
+    client_data = detail.get("conversation_initiation_client_data", {})
+    if client_data and isinstance(client_data, dict):
+        dyn = client_data.get("dynamic_variables", {})
+        if dyn and isinstance(dyn, dict):
+            if not agent_phone:
+                agent_phone = (dyn.get("agent_number") or dyn.get("to_number")
+                               or dyn.get("To") or dyn.get("agent_phone")
+                               or dyn.get("called_number") or dyn.get("Called"))
+            if not client_phone:
+                client_phone = (dyn.get("customer_number") or dyn.get("from_number")
+                                or dyn.get("From") or dyn.get("client_phone")
+                                or dyn.get("caller_number") or dyn.get("Caller")
+                                or dyn.get("phone") or dyn.get("phone_number")
+                                or dyn.get("customer_phone"))
+
+    if (not agent_phone or not client_phone) and isinstance(meta, dict):
+        deep_result = {}
+        legacy_deep_search_in_dict(meta, agent_phone, client_phone, deep_result)
+        if not agent_phone and deep_result.get("agent"):
+            agent_phone = deep_result["agent"]
+        if not client_phone and deep_result.get("client"):
+            client_phone = deep_result["client"]
+
+    if not agent_phone or not client_phone:
+        phone_values = legacy_deep_find_phone_values(detail)
+        if phone_values:
+            for path, value in phone_values:
+                path_lower = path.lower()
+                if not agent_phone and any(kw in path_lower for kw in
+                    ("agent", "to_number", ".to", "called", "voicebot", "bot_number")):
+                    agent_phone = value
+                elif not client_phone and any(kw in path_lower for kw in
+                    ("client", "customer", "from_number", ".from", "caller", "external", "user_phone")):
+                    client_phone = value
+            if not agent_phone and not client_phone and len(phone_values) >= 2:
+                agent_phone = phone_values[0][1]
+                client_phone = phone_values[1][1]
+            elif not agent_phone and not client_phone and len(phone_values) == 1:
+                client_phone = phone_values[0][1]
+
+    if agent_phone:
+        agent_phone = str(agent_phone).strip()
+    if client_phone:
+        client_phone = str(client_phone).strip()
+    return agent_phone, client_phone
+
+
+# ─── Benchmark ───────────────────────────────────────────────
+
+def timeit(fn, repeat: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(FIXTURES, encoding="utf-8") as f:
+        fixtures = json.load(f)
+
+    print(f"{'fixture':<24} {'source':<10} {'legacy µs':>10} {'new µs':>10} {'source µs':>10} {'scan µs':>10}  result")
+    totals = [0.0, 0.0, 0.0]
+    for fx in fixtures:
+        detail, source = fx["detail"], fx["source"]
+        expected = legacy_extract_phone_numbers(detail, detail.get("metadata", {}))
+        got = extract_phone_numbers(detail)
+        if got != expected or extract_phone_numbers(detail, source=source) != expected:
+            sys.exit(f"{fx['name']}: got {got}, previous implementation returned {expected}")
+
+        legacy = timeit(lambda: legacy_extract_phone_numbers(detail, detail.get("metadata", {})), repeat)
+        new = timeit(lambda: extract_phone_numbers(detail), repeat)
+        by_source = timeit(lambda: extract_phone_numbers(detail, source=source), repeat)
+        scan = timeit(lambda: scan_detail(detail), repeat)
+        for i, value in enumerate((legacy, new, by_source)):
+            totals[i] += value
+        print(f"{fx['name']:<24} {str(source):<10} {legacy:10.1f} {new:10.1f} {by_source:10.1f} {scan:10.1f}  {got}")
+
+    n = len(fixtures)
+    print(f"{'mean':<35} {totals[0] / n:10.1f} {totals[1] / n:10.1f} {totals[2] / n:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Offline phone re-extraction throughput over stored raw details.
+
+Usage: python benchmarks/bench_reextract.py [conversations] [workers]
+
+Seeds a throwaway SQLite database with conversations whose raw details are
+the recorded fixtures (``fixtures/conversation_details.json``, cycled), then
+times :func:`reextract.reextract_phones` in-process and with a process pool.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+_tmp = tempfile.mkdtemp(prefix="voicebot_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+
+from database import init_db, SessionLocal, Conversation, ConversationRawDetail  # noqa: E402
+from reextract import encode_detail, reextract_phones, REEXTRACT_WORKERS  # noqa: E402
+
+AGENT_ID = "agent_bench"
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "conversation_details.json")
+
+
+def seed(n: int):
+    init_db()
+    with open(FIXTURES, encoding="utf-8") as f:
+        blobs = [encode_detail(fx["detail"]) for fx in json.load(f)]
+    db = SessionLocal()
+    for start in range(0, n, 5000):
+        ids = [f"conv_{i:07d}" for i in range(start, min(start + 5000, n))]
+        db.execute(Conversation.__table__.insert(), [
+            dict(conversation_id=cid, agent_id=AGENT_ID, status="done", start_time_unix=1767225600 + i,
+                 month_partition="2026-01", details_fetched=True)
+            for i, cid in enumerate(ids)
+        ])
+        db.execute(ConversationRawDetail.__table__.insert(), [
+            dict(conversation_id=cid, agent_id=AGENT_ID, detail=blobs[i % len(blobs)])
+            for i, cid in enumerate(ids)
+        ])
+        db.commit()
+    db.close()
+    size = os.path.getsize(os.path.join(_tmp, "bench.db")) / 1024 / 1024
+    print(f"{n} conversations with raw details, database {size:.1f} MB")
+
+
+def run(label: str, workers: int):
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = reextract_phones(db, AGENT_ID, workers=workers)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.close()
+    print(f"  {label:<20} {elapsed:7.2f} s  {result['scanned'] / elapsed:9.0f} conv/s  updated {result['updated']}")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else REEXTRACT_WORKERS
+    seed(n)
+    run("first run (writes)", workers)
+    run("1 process", 1)
+    run(f"{workers} processes", workers)
+
+
+if __name__ == "__main__":
+    main()
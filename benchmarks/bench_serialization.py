@@ -0,0 +1,115 @@
+"""Serialization time and bytes on the wire for a typical month of KPI/list payloads.
+
+Usage: python benchmarks/bench_serialization.py [conversations_per_month]
+
+Seeds a throwaway SQLite database with one synthetic month, builds the
+/api/kpis payload and a 50-row /api/conversations page, then compares the
+stdlib JSONResponse with ORJSONResponse (with and without FastAPI's
+jsonable_encoder pass) and the gzip/brotli sizes.
+"""
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+_tmp = tempfile.mkdtemp(prefix="voicebot_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+
+import compression  # noqa: E402
+from database import init_db, SessionLocal, Conversation  # noqa: E402
+
+AGENT_ID = "agent_bench"
+MONTH = "2026-01"
+CRITERIA = ["id_greeting", "id_identity_check", "id_resolution", "id_upsell", "id_goodbye"]
+WORDS = ("klient pyta o fakturę, termin płatności, zmianę taryfy, numer umowy i reklamację; "
+         "agent potwierdza dane i przekazuje informacje o kolejnych krokach").split()
+
+
+def seed(n: int):
+    init_db()
+    db = SessionLocal()
+    rnd = random.Random(7)
+    base = int(datetime(2026, 1, 1).timestamp())
+    rows = []
+    for i in range(n):
+        rows.append(dict(
+            conversation_id=f"conv_{i:06d}", agent_id=AGENT_ID, agent_name="Bench",
+            status=rnd.choice(["done", "done", "done", "failed"]),
+            call_successful=rnd.choice(["success", "success", "failure", "unknown"]),
+            start_time_unix=base + rnd.randint(0, 30 * 86400),
+            call_duration_secs=rnd.randint(5, 900), message_count=rnd.randint(2, 60),
+            transcript_summary=" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(40, 90))),
+            call_summary_title="Rozmowa o fakturze",
+            direction=rnd.choice(["inbound", "outbound"]),
+            conversation_initiation_source=rnd.choice(["twilio", "sip_trunk", "react_sdk"]),
+            agent_phone="+48221234567", client_phone=f"+48600{i % 1000000:06d}",
+            cost=rnd.randint(50, 2000), termination_reason="end_call",
+            evaluation_criteria_results=json.dumps({
+                c: {"criteria_id": c, "result": rnd.choice(["success", "failure", "unknown"]),
+                    "rationale": "Agent spełnił kryterium zgodnie z instrukcją."}
+                for c in CRITERIA
+            }),
+            details_fetched=True, month_partition=MONTH,
+        ))
+    db.execute(Conversation.__table__.insert(), rows)
+    db.commit()
+    db.close()
+
+
+def timeit(fn, repeat: int = 50) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def report(name: str, payload):
+    std = JSONResponse(jsonable_encoder(payload)).body
+    rows = [
+        ("stdlib json + jsonable_encoder", lambda: JSONResponse(jsonable_encoder(payload)).body),
+        ("orjson + jsonable_encoder", lambda: ORJSONResponse(jsonable_encoder(payload)).body),
+        ("orjson direct", lambda: ORJSONResponse(payload).body),
+    ]
+    print(f"\n{name}")
+    for label, fn in rows:
+        print(f"  {label:<32} {timeit(fn):8.3f} ms")
+    print(f"  {'identity':<32} {len(std):8d} bytes")
+    print(f"  {'gzip':<32} {len(compression.compress(std, 'gzip')):8d} bytes"
+          f"  ({timeit(lambda: compression.compress(std, 'gzip')):.3f} ms)")
+    if compression.brotli is not None:
+        print(f"  {'br':<32} {len(compression.compress(std, 'br')):8d} bytes"
+              f"  ({timeit(lambda: compression.compress(std, 'br')):.3f} ms)")
+    else:
+        print("  br                               (brotli not installed)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    seed(n)
+
+    from app import conversations_page
+    from sync_service import compute_kpis
+
+    db = SessionLocal()
+    try:
+        kpis = compute_kpis(db, AGENT_ID, MONTH)
+        page = conversations_page(db, AGENT_ID, MONTH, page=1, per_page=50)
+    finally:
+        db.close()
+
+    print(f"{n} conversations in {MONTH}")
+    report("/api/kpis", kpis)
+    report("/api/conversations (50 rows)", page)
+
+
+if __name__ == "__main__":
+    main()
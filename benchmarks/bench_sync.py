@@ -0,0 +1,165 @@
+"""End-to-end sync benchmark against the local ElevenLabs stand-in.
+
+Usage: python benchmarks/bench_sync.py [calls ...] [--latency-ms 0] [--error-rate 0]
+       [--listing-only]
+
+For each month size (default 1000 and 10000 calls; pass e.g. ``100000``
+explicitly for the large one) this starts ``fake_elevenlabs.py`` and runs
+:func:`sync_service.sync_conversations` for that month in a fresh process
+with a throwaway SQLite database, then reports conversations/s, API calls
+(as seen by the server, plus client retries), database writes (INSERT /
+UPDATE / DELETE statements and rows) and the peak RSS of the sync process.
+The client-side pauses between requests are set to zero, so the numbers
+show the cost of the sync itself.
+"""
+
+import argparse
+import asyncio
+import calendar
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MONTH = "2026-01"
+AGENT_ID = "agent_bench"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def child(base_url: str, fetch_details: bool):
+    """Run one sync in this process and print the measurements as JSON."""
+    tmp = tempfile.mkdtemp(prefix="voicebot_bench_sync_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ["ELEVENLABS_BASE_URL"] = base_url
+    os.environ["ELEVENLABS_DETAIL_DELAY"] = "0"
+    os.environ["ELEVENLABS_PAGE_DELAY"] = "0"
+    sys.path.insert(0, os.path.join(HERE, ".."))
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    import elevenlabs_client
+    from database import init_db
+    from sync_service import sync_conversations
+
+    writes = {"statements": 0, "rows": 0}
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+            writes["statements"] += 1
+            writes["rows"] += max(cursor.rowcount, 0)
+
+    clients = []
+    original_init = elevenlabs_client.ElevenLabsClient.__init__
+
+    def track_client(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        clients.append(self)
+
+    elevenlabs_client.ElevenLabsClient.__init__ = track_client
+
+    init_db()
+    writes.update(statements=0, rows=0)
+    year, mon = map(int, MONTH.split("-"))
+    start = calendar.timegm(datetime(year, mon, 1).timetuple())
+    end = start + calendar.monthrange(year, mon)[1] * 86400 - 1
+
+    async def run():
+        try:
+            return await sync_conversations(AGENT_ID, "bench-key", start, end, "benchmark", fetch_details)
+        finally:
+            await elevenlabs_client.close_http_client()
+
+    started = time.perf_counter()
+    result = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "seconds": elapsed,
+        "result": result,
+        "client_requests": sum(c.requests for c in clients),
+        "client_retries": sum(c.retries for c in clients),
+        "writes": writes,
+        "peak_rss_mb": _peak_rss_mb(),
+    }))
+
+
+def bench(calls: int, args) -> dict:
+    port = _free_port()
+    server = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_elevenlabs.py"), "--port", str(port),
+        "--conversations", str(calls), "--month", MONTH,
+        "--latency-ms", str(args.latency_ms), "--error-rate", str(args.error_rate),
+    ])
+    try:
+        stats_url = f"http://127.0.0.1:{port}/stats"
+        for _ in range(100):
+            try:
+                httpx.get(stats_url)
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", f"http://127.0.0.1:{port}/v1/convai"]
+            + (["--listing-only"] if args.listing_only else []),
+            check=True, capture_output=True, text=True,
+        ).stdout
+        report = json.loads(out.strip().splitlines()[-1])
+        report["server"] = httpx.get(stats_url).json()
+        return report
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("calls", nargs="*", type=int, default=[1000, 10000])
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--listing-only", action="store_true", help="skip detail fetching")
+    parser.add_argument("--child", metavar="BASE_URL", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, not args.listing_only)
+        return
+
+    print(f"{'calls':>8} {'seconds':>9} {'conv/s':>8} {'API calls':>10} {'retries':>8} "
+          f"{'DB stmts':>9} {'DB rows':>9} {'peak RSS':>9}")
+    for calls in args.calls:
+        r = bench(calls, args)
+        server = r["server"]
+        rss = f"{r['peak_rss_mb']:.0f} MB" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{calls:>8} {r['seconds']:>9.2f} {calls / r['seconds']:>8.0f} "
+              f"{server['listing'] + server['detail']:>10} {r['client_retries']:>8} "
+              f"{r['writes']['statements']:>9} {r['writes']['rows']:>9} {rss:>9}")
+        if r["client_requests"] != server["listing"] + server["detail"]:
+            print(f"  warning: client sent {r['client_requests']} requests, server saw "
+                  f"{server['listing'] + server['detail']}")
+
+
+if __name__ == "__main__":
+    main()
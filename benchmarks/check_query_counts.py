@@ -0,0 +1,255 @@
+"""SQL statement counts per endpoint and sync phase, with upper bounds.
+
+Usage: python benchmarks/check_query_counts.py [--small 40] [--large 400] [-v]
+
+Syncs two agents from the local ElevenLabs stand-in (``fake_elevenlabs.py``)
+into a throwaway SQLite database, one with ``--small`` and one with
+``--large`` calls, then counts the statements issued by each sync phase and
+each read endpoint for both.  The in-process KPI, data-version and settings
+caches are emptied before every endpoint request, so both agents are read cold.  A
+check fails when a count exceeds its bound for the large agent, or when the
+two agents' read counts differ (an N+1 query).  Exits with status 1 on any failure, so it can
+gate local runs; set ``VOICEBOT_SHARD_BY_MONTH=1`` to check the sharded layout.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+_tmp = tempfile.mkdtemp(prefix="voicebot_query_counts_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+os.environ["ELEVENLABS_DETAIL_DELAY"] = "0"
+os.environ["ELEVENLABS_PAGE_DELAY"] = "0"
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+
+MONTH = "2026-01"
+MONTH_START, MONTH_END = 1767225600, 1769903999
+
+
+class QueryCounter:
+    """Statements executed on any engine while active, split into reads and writes."""
+
+    def __init__(self):
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(Engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, "before_cursor_execute", self._record)
+
+    @property
+    def reads(self) -> int:
+        return sum(1 for s in self.statements if s.lstrip()[:6].upper() in ("SELECT", "PRAGMA", "WITH"))
+
+    @property
+    def writes(self) -> int:
+        return len(self.statements) - self.reads
+
+
+# Endpoint reads must be the same for both agents, whatever their size;
+# ``bound`` caps the count.
+ENDPOINTS = [
+    # (name, path, bound)
+    ("kpis", "/api/kpis?agent_id={agent}", 8),
+    ("kpis (month)", "/api/kpis?agent_id={agent}&month=" + MONTH, 8),
+    ("kpis (range, hourly)", "/api/kpis?agent_id={agent}&start=" + MONTH + "-01&end=" + MONTH + "-28&granularity=hour", 4),
+    ("analytics", "/api/analytics?agent_id={agent}", 8),
+    ("kpis compare", "/api/kpis/compare?agent_ids={agent},agent_qc_small,agent_qc_large&month=" + MONTH, 8),
+    ("conversations", "/api/conversations?agent_id={agent}&per_page=50", 8),
+    ("conversations (filtered)", "/api/conversations?agent_id={agent}&status=done&sort=duration&order=asc", 8),
+    ("conversation changes", "/api/conversations/changes?agent_id={agent}&since=0", 8),
+    ("search", "/api/conversations/search?agent_id={agent}&q=faktura", 8),
+    ("months", "/api/months?agent_id={agent}", 6),
+    ("dashboard bundle", "/api/dashboard?agent_id={agent}", 20),
+    ("sync logs", "/api/sync-logs", 4),
+    ("archives", "/api/archives", 4),
+    ("export csv", "/api/export-csv?agent_id={agent}&month=" + MONTH, 8),
+    ("debug metadata", "/api/debug-metadata?agent_id={agent}&limit=5&sample=100", 12),
+]
+
+# Sync phases: statements per conversation (reads, writes) for the large agent.
+# Reads are batched, so they should stay well below one per conversation.
+SYNC_BOUNDS = {
+    "listing": (0.05, 0.05),
+    "details": (0.35, 6.0),
+}
+
+
+def clear_caches():
+    """Drop cached KPIs, comparisons, data versions and settings: the next read hits the database."""
+    import data_version
+    import kpi_pool
+    import settings_registry
+
+    kpi_pool._kpi_cache.clear()
+    kpi_pool._compare_cache.clear()
+    with data_version._lock:
+        data_version._cache.clear()
+    with settings_registry._lock:
+        settings_registry._loaded_at = 0.0
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def fake_server(calls: int):
+    port = _free_port()
+    server = subprocess.Popen([
+        sys.executable, os.path.join(HERE, "fake_elevenlabs.py"), "--port", str(port),
+        "--conversations", str(calls), "--month", MONTH,
+    ])
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/stats")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}/v1/convai"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def sync_agent(agent_id: str, calls: int) -> dict:
+    """Sync ``calls`` conversations for ``agent_id``; counts per phase."""
+    import elevenlabs_client
+    from sync_service import sync_conversations
+
+    async def run(fetch_details: bool):
+        try:
+            return await sync_conversations(agent_id, "check-key", MONTH_START, MONTH_END, "check", fetch_details)
+        finally:
+            await elevenlabs_client.close_http_client()
+
+    counts = {}
+    with fake_server(calls) as base_url:
+        elevenlabs_client.BASE_URL = base_url
+        with QueryCounter() as listing:
+            asyncio.run(run(False))
+        with QueryCounter() as details:
+            asyncio.run(run(True))
+    counts["listing"] = listing
+    counts["details"] = details
+    return counts
+
+
+class Checks:
+    def __init__(self, verbose: bool):
+        self.verbose = verbose
+        self.failures = []
+
+    def check(self, name: str, ok: bool, detail: str):
+        if not ok:
+            self.failures.append(f"{name}: {detail}")
+        if self.verbose or not ok:
+            print(f"  {'ok  ' if ok else 'FAIL'} {name:<28} {detail}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--small", type=int, default=40)
+    parser.add_argument("--large", type=int, default=400)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+
+    import app
+    import archive_store
+    import settings_registry
+    import shards
+    import sync_service
+    from database import SessionLocal
+    from sync_service import check_and_archive
+
+    # Archives, exports and shards go to the throwaway directory too
+    sync_service.CSV_DIR = app.CSV_DIR = archive_store.ARCHIVE_DB_DIR = _tmp
+    shards.SHARD_DIR = os.path.join(_tmp, "shards")
+
+    checks = Checks(args.verbose)
+    agents = {"small": "agent_qc_small", "large": "agent_qc_large"}
+    sizes = {"small": args.small, "large": args.large}
+
+    with TestClient(app.app) as client:
+        db = SessionLocal()
+        settings_registry.set_setting(db, "api_key", "check-key")
+        db.close()
+
+        print("sync")
+        for size, agent_id in agents.items():
+            phases = sync_agent(agent_id, sizes[size])
+            if size != "large":
+                continue
+            for phase, (reads_per, writes_per) in SYNC_BOUNDS.items():
+                counted = phases[phase]
+                n = sizes[size]
+                checks.check(
+                    f"sync {phase}", counted.reads <= 10 + reads_per * n and counted.writes <= 10 + writes_per * n,
+                    f"{counted.reads} reads, {counted.writes} writes for {n} conversations",
+                )
+
+        print("endpoints")
+        for name, path, bound in ENDPOINTS:
+            counts = {}
+            for size, agent_id in agents.items():
+                clear_caches()
+                with QueryCounter() as counted:
+                    resp = client.get(path.format(agent=agent_id))
+                if resp.status_code != 200:
+                    checks.check(name, False, f"HTTP {resp.status_code}: {resp.text[:200]}")
+                    break
+                counts[size] = counted.reads
+            else:
+                checks.check(
+                    name, counts["large"] <= bound and counts["large"] == counts["small"],
+                    f"{counts['small']} -> {counts['large']} reads (bound {bound})",
+                )
+
+        print("archive check")
+        db = SessionLocal()
+        try:
+            first_of_next = datetime(2026, 2, 2)
+            with QueryCounter() as first:
+                check_and_archive(db, now=first_of_next)
+            with QueryCounter() as again:
+                check_and_archive(db, now=first_of_next)
+        finally:
+            db.close()
+        checks.check("check_and_archive", first.reads <= 6 * len(agents) + 4,
+                     f"{first.reads} reads archiving {len(agents)} agents")
+        checks.check("check_and_archive (done)", again.reads <= 3,
+                     f"{again.reads} reads with every agent archived")
+
+    if checks.failures:
+        print(f"\n{len(checks.failures)} query count check(s) failed:")
+        for failure in checks.failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nall query count checks passed")
+
+
+if __name__ == "__main__":
+    main()
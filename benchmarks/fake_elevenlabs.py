@@ -0,0 +1,242 @@
+"""Local stand-in for the ElevenLabs conversations API, for benchmarks.
+
+Usage: python benchmarks/fake_elevenlabs.py [--port 8765] [--conversations 1000]
+       [--month 2026-01] [--latency-ms 0] [--error-rate 0] [--retry-after 0.1]
+
+Serves ``GET /v1/convai/conversations`` (newest first, cursor pagination with
+``has_more``/``next_cursor``, ``call_start_after_unix``/``call_start_before_unix``)
+and ``GET /v1/convai/conversations/{id}`` for every agent id asked for.  Data
+is synthetic and deterministic per conversation: Twilio, SIP trunk and web
+call metadata shapes, transcripts, evaluation criteria and data collection.
+``--error-rate`` answers that share of requests with 429 + Retry-After.
+``GET /stats`` returns request counts.  Point the dashboard at it with
+``ELEVENLABS_BASE_URL=http://127.0.0.1:8765/v1/convai``.
+"""
+
+import argparse
+import asyncio
+import calendar
+import random
+from datetime import datetime
+
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import JSONResponse
+
+SOURCES = ("twilio", "sip_trunk", "react_sdk")
+CRITERIA = ("id_greeting", "id_identity_check", "id_resolution", "id_goodbye")
+AGENT_LINES = (
+    "Dzień dobry, tu asystent obsługi klienta. W czym mogę pomóc?",
+    "Rozumiem. Czy mogę prosić o numer umowy?",
+    "Dziękuję, sprawdzam dane w systemie.",
+    "Faktura za ten miesiąc została wystawiona piątego dnia miesiąca.",
+    "Termin płatności to czternaście dni od daty wystawienia.",
+    "Czy mogę pomóc w czymś jeszcze?",
+)
+USER_LINES = (
+    "Dzień dobry, dzwonię w sprawie faktury.",
+    "Numer umowy to UM/2025/10432.",
+    "Nie dostałem jeszcze faktury za ostatni miesiąc.",
+    "A kiedy jest termin płatności?",
+    "Chciałbym zmienić taryfę na tańszą.",
+    "Nie, to wszystko, dziękuję.",
+)
+
+
+class FakeData:
+    """``conversations`` calls per agent spread evenly over ``month``."""
+
+    def __init__(self, conversations: int, month: str, seed: int = 7):
+        self.n = conversations
+        self.seed = seed
+        year, mon = map(int, month.split("-"))
+        self.month_start = calendar.timegm(datetime(year, mon, 1).timetuple())
+        self.month_secs = calendar.monthrange(year, mon)[1] * 86400
+
+    def start_time(self, i: int) -> int:
+        return self.month_start + i * self.month_secs // max(self.n, 1)
+
+    @staticmethod
+    def conversation_id(agent_id: str, i: int) -> str:
+        return f"fake_{i:07d}_{agent_id}"
+
+    @staticmethod
+    def parse_id(conversation_id: str):
+        _, i, agent_id = conversation_id.split("_", 2)
+        return agent_id, int(i)
+
+    def _rnd(self, agent_id: str, i: int) -> random.Random:
+        return random.Random(f"{self.seed}:{agent_id}:{i}")
+
+    def listing_item(self, agent_id: str, i: int) -> dict:
+        rnd = self._rnd(agent_id, i)
+        source = SOURCES[i % len(SOURCES)]
+        status = "failed" if rnd.random() < 0.05 else "done"
+        return {
+            "agent_id": agent_id,
+            "agent_name": "Fake agent",
+            "conversation_id": self.conversation_id(agent_id, i),
+            "start_time_unix_secs": self.start_time(i),
+            "call_duration_secs": rnd.randint(5, 600),
+            "message_count": rnd.randint(2, 40),
+            "status": status,
+            "call_successful": "failure" if status == "failed" else rnd.choice(("success", "success", "failure", "unknown")),
+            "transcript_summary": "Klient pytał o fakturę i termin płatności; agent udzielił informacji.",
+            "call_summary_title": "Pytanie o fakturę",
+            "main_language": "pl",
+            "direction": "outbound" if source != "react_sdk" and rnd.random() < 0.2 else "inbound",
+            "rating": rnd.choice((None, None, 3, 4, 5)),
+            "tool_names": ["end_call"] if rnd.random() < 0.7 else [],
+            "conversation_initiation_source": source,
+        }
+
+    def detail(self, agent_id: str, i: int) -> dict:
+        item = self.listing_item(agent_id, i)
+        rnd = self._rnd(agent_id, i)
+        agent_number = "+48221234567"
+        client_number = f"+48{rnd.randint(500000000, 899999999)}"
+        metadata = {
+            "start_time_unix_secs": item["start_time_unix_secs"],
+            "call_duration_secs": item["call_duration_secs"],
+            "cost": rnd.randint(50, 2000),
+            "termination_reason": "end_call tool was called.",
+            "main_language": "pl",
+            "error": None,
+            "feedback": {"overall_score": None, "likes": 0, "dislikes": 0},
+            "charging": {"dev_discount": False, "tier": "pro", "llm_charge": rnd.randint(1, 9)},
+        }
+        source = item["conversation_initiation_source"]
+        if source == "twilio":
+            metadata["phone_call"] = {
+                "direction": item["direction"], "phone_number_id": "pn_fake", "type": "twilio",
+                "agent_number": agent_number, "external_number": client_number, "call_sid": f"CA{i:032d}",
+            }
+            metadata["body"] = {"To": agent_number, "From": client_number, "Called": agent_number,
+                                "Caller": client_number, "CallStatus": "ringing", "Direction": "inbound"}
+        elif source == "sip_trunk":
+            metadata["phone_call"] = {
+                "direction": item["direction"], "phone_number_id": "pn_fake_sip", "type": "sip_trunk",
+                "agent_number": agent_number, "external_number": client_number, "call_sid": f"sip-{i}",
+            }
+            metadata["body"] = {"to_number": agent_number, "from_number": client_number}
+
+        transcript, t = [], 0
+        for turn in range(item["message_count"]):
+            t += rnd.randint(2, 9)
+            agent_turn = turn % 2 == 0
+            transcript.append({
+                "role": "agent" if agent_turn else "user",
+                "message": rnd.choice(AGENT_LINES if agent_turn else USER_LINES),
+                "tool_calls": [], "tool_results": [], "feedback": None,
+                "time_in_call_secs": t,
+                "conversation_turn_metrics": {"metrics": {"convai_llm_service_ttfb": {"elapsed_time": round(rnd.random(), 3)}}} if agent_turn else None,
+            })
+
+        return {
+            "agent_id": agent_id,
+            "conversation_id": item["conversation_id"],
+            "status": item["status"],
+            "user_id": None,
+            "has_audio": source != "react_sdk",
+            "transcript": transcript,
+            "metadata": metadata,
+            "analysis": {
+                "call_successful": item["call_successful"],
+                "transcript_summary": item["transcript_summary"],
+                "evaluation_criteria_results": {
+                    c: {"criteria_id": c, "result": rnd.choice(("success", "success", "failure", "unknown")),
+                        "rationale": "Agent spełnił kryterium zgodnie z instrukcją."}
+                    for c in CRITERIA
+                },
+                "data_collection_results": {
+                    "topic": {"data_collection_id": "topic", "value": "faktura", "rationale": "Klient pytał o fakturę."},
+                },
+            },
+            "conversation_initiation_client_data": {
+                "dynamic_variables": {"system__agent_id": agent_id, "system__conversation_id": item["conversation_id"]},
+            },
+        }
+
+
+def create_app(data: FakeData, latency_ms: float = 0, error_rate: float = 0, retry_after: float = 0.1) -> FastAPI:
+    app = FastAPI(title="Fake ElevenLabs API")
+    stats = {"listing": 0, "detail": 0, "rate_limited": 0}
+    rnd = random.Random(data.seed)
+
+    async def simulate(kind: str):
+        stats[kind] += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000 * rnd.uniform(0.5, 1.5))
+        if error_rate and rnd.random() < error_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse({"detail": "Too many requests"}, status_code=429,
+                                headers={"Retry-After": str(retry_after)})
+        return None
+
+    @app.get("/v1/convai/conversations")
+    async def list_conversations(
+        agent_id: str,
+        page_size: int = Query(30, ge=1, le=100),
+        cursor: str = None,
+        call_start_after_unix: int = None,
+        call_start_before_unix: int = None,
+    ):
+        limited = await simulate("listing")
+        if limited:
+            return limited
+        # Newest first: walk indexes downwards, the cursor is the next index
+        i = int(cursor) if cursor else data.n - 1
+        items = []
+        while i >= 0 and len(items) < page_size:
+            ts = data.start_time(i)
+            if call_start_before_unix and ts > call_start_before_unix:
+                i -= 1
+                continue
+            if call_start_after_unix and ts < call_start_after_unix:
+                i = -1
+                break
+            items.append(data.listing_item(agent_id, i))
+            i -= 1
+        has_more = i >= 0 and not (call_start_after_unix and data.start_time(i) < call_start_after_unix)
+        return {"conversations": items, "has_more": has_more, "next_cursor": str(i) if has_more else None}
+
+    @app.get("/v1/convai/conversations/{conversation_id}")
+    async def get_conversation(conversation_id: str):
+        limited = await simulate("detail")
+        if limited:
+            return limited
+        try:
+            agent_id, i = data.parse_id(conversation_id)
+        except ValueError:
+            raise HTTPException(404, "Conversation not found")
+        if not 0 <= i < data.n:
+            raise HTTPException(404, "Conversation not found")
+        return data.detail(agent_id, i)
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--conversations", type=int, default=1000, help="calls per agent")
+    parser.add_argument("--month", default="2026-01")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    app = create_app(FakeData(args.conversations, args.month, args.seed),
+                     args.latency_ms, args.error_rate, args.retry_after)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Per-agent data versions used for HTTP ETags."""
+
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, DataVersion
+from metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# How long a version read from the database is trusted.  Bumps made by this
+# process are seen immediately; other workers' bumps within the TTL.
+DATA_VERSION_TTL = float(os.environ.get("DATA_VERSION_TTL", "2"))
+
+_cache: dict[str, tuple[int, float]] = {}
+_lock = threading.Lock()
+
+
+def get_version(agent_id: str) -> int:
+    """Current data version for agent (cached, no database hit within the TTL)."""
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(agent_id)
+    if cached and now - cached[1] < DATA_VERSION_TTL:
+        cache_lookup("data_version", True)
+        return cached[0]
+    cache_lookup("data_version", False)
+
+    db = SessionLocal()
+    try:
+        row = db.get(DataVersion, agent_id)
+        version = row.version if row else 0
+    finally:
+        db.close()
+    with _lock:
+        _cache[agent_id] = (version, now)
+    return version
+
+
+def bump(db: Session, agent_id: str) -> int:
+    """Increment and commit the agent's data version. Returns the new version."""
+    for _ in range(2):
+        updated = db.execute(
+            update(DataVersion)
+            .where(DataVersion.agent_id == agent_id)
+            .values(version=DataVersion.version + 1)
+        ).rowcount
+        if not updated:
+            db.add(DataVersion(agent_id=agent_id, version=1))
+        try:
+            db.commit()
+            break
+        except IntegrityError:
+            # Another writer inserted the row first; increment it instead
+            db.rollback()
+
+    version = db.get(DataVersion, agent_id, populate_existing=True).version
+    with _lock:
+        _cache[agent_id] = (version, time.monotonic())
+    logger.debug(f"Data version for {agent_id[:12]} is now {version}")
+    return version
@@ -1,18 +1,38 @@
-"""Database models and session management using SQLAlchemy + SQLite."""
+"""Database models and session management using SQLAlchemy (SQLite or PostgreSQL)."""
 
+import logging
 import os
+import time
 from datetime import datetime
 
 from sqlalchemy import (
-    Column, String, Integer, Float, Boolean, Text, DateTime,
-    create_engine, JSON
+    Column, String, Integer, Float, Boolean, Text, DateTime, LargeBinary, Index,
+    create_engine, func, inspect, text, update, select
 )
 from sqlalchemy.orm import declarative_base, sessionmaker
 
+logger = logging.getLogger(__name__)
+
 DB_PATH = os.path.join(os.path.dirname(__file__), "voicebot.db")
-DATABASE_URL = f"sqlite:///{DB_PATH}"
+DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{DB_PATH}")
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Pool sizing only applies to server databases; size it to the number of
+# dashboard workers x concurrent requests/syncs per worker.
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+if IS_SQLITE:
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+    )
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
@@ -68,6 +88,31 @@ class Conversation(Base):
     # Month partition for archival (YYYY-MM)
     month_partition = Column(String, nullable=False, index=True)
 
+    # Global change sequence of the last insert/update (see next_change_seq)
+    change_seq = Column(Integer, nullable=True)
+
+    # Sort keys of /api/conversations, scoped the way every list query is
+    __table_args__ = (
+        Index("ix_conversations_agent_change_seq", "agent_id", "change_seq"),
+        Index("ix_conversations_agent_start", "agent_id", "start_time_unix"),
+        Index("ix_conversations_agent_month_start", "agent_id", "month_partition", "start_time_unix"),
+        Index("ix_conversations_agent_month_duration", "agent_id", "month_partition", "call_duration_secs"),
+        Index("ix_conversations_agent_month_cost", "agent_id", "month_partition", "cost"),
+    )
+
+
+class ConversationRawDetail(Base):
+    """Detail JSON as returned by the API, zlib-compressed (see reextract.py).
+
+    Lives next to ``conversations`` (main database or month shard).
+    """
+    __tablename__ = "conversation_raw_details"
+
+    conversation_id = Column(String, primary_key=True)
+    agent_id = Column(String, nullable=False, index=True)
+    detail = Column(LargeBinary, nullable=False)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
 
 class SyncLog(Base):
     __tablename__ = "sync_logs"
@@ -83,6 +128,16 @@ class SyncLog(Base):
     error_message = Column(Text, nullable=True)
     period_from = Column(Integer, nullable=True)
     period_to = Column(Integer, nullable=True)
+    # Wall time per phase (seconds); together they add up to roughly the sync duration
+    listing_secs = Column(Float, nullable=True)  # listing requests
+    write_secs = Column(Float, nullable=True)  # upserts and detail row updates
+    detail_fetch_secs = Column(Float, nullable=True)  # detail requests
+    throttle_secs = Column(Float, nullable=True)  # rate-limit pauses and retry backoff
+    commit_secs = Column(Float, nullable=True)
+    api_calls = Column(Integer, nullable=True)  # retries included
+    api_retries = Column(Integer, nullable=True)
+    bytes_downloaded = Column(Integer, nullable=True)
+    rows_written = Column(Integer, nullable=True)  # conversation + raw detail rows
 
 
 class ArchiveLog(Base):
@@ -92,35 +147,226 @@ class ArchiveLog(Base):
     month_partition = Column(String, nullable=False)
     agent_id = Column(String, nullable=False)
     file_path = Column(String, nullable=False)
+    db_path = Column(String, nullable=True)  # queryable SQLite archive
     records_count = Column(Integer, default=0)
     archived_at = Column(DateTime, default=datetime.utcnow)
 
 
+class DataVersion(Base):
+    """Per-agent counter bumped whenever the agent's conversation data changes."""
+    __tablename__ = "data_versions"
+
+    agent_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Agent(Base):
+    """Configured voicebot agent with its sync state."""
+    __tablename__ = "agents"
+
+    id = Column(String, primary_key=True)
+    name = Column(String, nullable=True)
+    position = Column(Integer, nullable=False, default=0)  # order in the selector
+    last_synced_at = Column(DateTime, nullable=True)
+    last_sync_status = Column(String, nullable=True)  # completed, failed
+    watermark_unix = Column(Integer, nullable=True)  # newest start_time stored
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class AgentDayRollup(Base):
+    """Per agent and UTC day summary of its conversations, refreshed by syncs (see rollups.py)."""
+    __tablename__ = "agent_day_rollups"
+
+    agent_id = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)  # YYYY-MM-DD
+    month_partition = Column(String, nullable=False)
+    conversations = Column(Integer, nullable=False, default=0)
+    # quantiles.QuantileSketch JSON over the positive values of the day
+    duration_sketch = Column(Text, nullable=True)
+    message_sketch = Column(Text, nullable=True)
+    cost_sketch = Column(Text, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_agent_day_rollups_agent_month", "agent_id", "month_partition"),
+    )
+
+
+class AgentHourRollup(Base):
+    """Per agent and UTC hour KPI sums, refreshed by syncs; date ranges add these up (see rollups.py)."""
+    __tablename__ = "agent_hour_rollups"
+
+    agent_id = Column(String, primary_key=True)
+    hour_start = Column(Integer, primary_key=True)  # unix time, multiple of 3600
+    month_partition = Column(String, nullable=False)
+    conversations = Column(Integer, nullable=False, default=0)
+    # call_successful / direction / status counts
+    success = Column(Integer, nullable=False, default=0)
+    failure = Column(Integer, nullable=False, default=0)
+    unknown = Column(Integer, nullable=False, default=0)
+    inbound = Column(Integer, nullable=False, default=0)
+    outbound = Column(Integer, nullable=False, default=0)
+    done = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    transfers = Column(Integer, nullable=False, default=0)
+    dropouts = Column(Integer, nullable=False, default=0)
+    # Over positive values only, like the KPI averages
+    duration_count = Column(Integer, nullable=False, default=0)
+    duration_sum = Column(Integer, nullable=False, default=0)
+    duration_min = Column(Integer, nullable=True)
+    duration_max = Column(Integer, nullable=True)
+    short_calls = Column(Integer, nullable=False, default=0)  # under 30s
+    long_calls = Column(Integer, nullable=False, default=0)  # over 300s
+    message_count = Column(Integer, nullable=False, default=0)
+    message_sum = Column(Integer, nullable=False, default=0)
+    cost_count = Column(Integer, nullable=False, default=0)
+    cost_sum = Column(Integer, nullable=False, default=0)
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0)
+    criteria = Column(Text, nullable=True)  # JSON {criterion: [pass, fail, total]}
+
+    __table_args__ = (
+        Index("ix_agent_hour_rollups_agent_month", "agent_id", "month_partition"),
+    )
+
+
+class ChangeSequence(Base):
+    """Monotonic counters; row "conversations" feeds Conversation.change_seq."""
+    __tablename__ = "change_sequences"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+# A pending reservation older than this belongs to a writer that died
+PENDING_CHANGE_SEQ_TTL = 60
+
+
+class PendingChangeSeq(Base):
+    """Change sequence ranges committed ahead of the month-shard rows that carry them."""
+    __tablename__ = "pending_change_seqs"
+
+    first_seq = Column(Integer, primary_key=True)
+    reserved_at = Column(Float, nullable=False)  # unix time
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
-    _migrate_add_phone_columns()
+    add_missing_columns(engine)
+    with SessionLocal() as db:
+        if db.get(ChangeSequence, "conversations") is None:
+            db.add(ChangeSequence(name="conversations", value=0))
+            db.commit()
 
 
-def _migrate_add_phone_columns():
-    """Add phone columns if they don't exist (SQLite migration)."""
-    import sqlite3
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    try:
-        # Check existing columns
-        cursor.execute("PRAGMA table_info(conversations)")
-        columns = {row[1] for row in cursor.fetchall()}
-
-        if "agent_phone" not in columns:
-            cursor.execute("ALTER TABLE conversations ADD COLUMN agent_phone TEXT")
-        if "client_phone" not in columns:
-            cursor.execute("ALTER TABLE conversations ADD COLUMN client_phone TEXT")
-
-        conn.commit()
-    except Exception:
-        pass
-    finally:
-        conn.close()
+def next_change_seq(db, count: int = 1) -> int:
+    """Reserve ``count`` consecutive change sequence numbers; returns the first.
+
+    Runs in the caller's transaction on the main database: the row stays
+    locked until commit, so numbers are handed out in commit order.
+    """
+    db.execute(
+        update(ChangeSequence)
+        .where(ChangeSequence.name == "conversations")
+        .values(value=ChangeSequence.value + count)
+    )
+    last = db.execute(select(ChangeSequence.value).where(ChangeSequence.name == "conversations")).scalar_one()
+    return last - count + 1
+
+
+def reserve_change_seq(db, conv_db, count: int = 1) -> int:
+    """``next_change_seq`` for rows written through ``conv_db``.
+
+    When ``conv_db`` is another database (a month shard) the numbers are
+    committed on ``db`` right away, ahead of the rows that carry them, so the
+    range is recorded as pending until ``release_change_seqs`` runs after the
+    shard commit.  ``change_seq_horizon`` keeps feeds below pending ranges.
+    """
+    first = next_change_seq(db, count)
+    if conv_db is not db:
+        db.add(PendingChangeSeq(first_seq=first, reserved_at=time.time()))
+        db.commit()
+        db.info.setdefault("pending_change_seqs", []).append(first)
+    return first
+
+
+def release_change_seqs(db):
+    """Clear the ranges reserved through ``db`` once their shard commit is done (or failed)."""
+    firsts = db.info.pop("pending_change_seqs", None)
+    if not firsts:
+        return
+    db.query(PendingChangeSeq).filter(
+        PendingChangeSeq.first_seq.in_(firsts)
+        | (PendingChangeSeq.reserved_at < time.time() - PENDING_CHANGE_SEQ_TTL)
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def change_seq_horizon(db) -> int:
+    """Every change_seq below this is committed and visible; feeds must not read past it.
+
+    The counter and the oldest pending range are read in one statement,
+    so numbers reserved afterwards are all at or above the result.
+    """
+    pending = (
+        select(func.min(PendingChangeSeq.first_seq))
+        .where(PendingChangeSeq.reserved_at >= time.time() - PENDING_CHANGE_SEQ_TTL)
+        .scalar_subquery()
+    )
+    value, first_pending = db.execute(
+        select(ChangeSequence.value, pending).where(ChangeSequence.name == "conversations")
+    ).one()
+    return first_pending if first_pending is not None else value + 1
+
+
+def add_missing_columns(bind, tables=None):
+    """Add columns/indexes that are missing from existing tables (any backend).
+
+    ``create_all`` only creates missing tables, so columns added to the
+    models later (phone numbers, archive paths, ...) are added here with
+    ``ALTER TABLE ... ADD COLUMN`` using the dialect's type names.  Also
+    used for month shards and archive files, which hold only some tables.
+    """
+    inspector = inspect(bind)
+    quote = bind.dialect.identifier_preparer.quote
+    for table in tables or Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            col_type = column.type.compile(dialect=bind.dialect)
+            try:
+                with bind.begin() as conn:
+                    conn.execute(text(
+                        f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {col_type}"
+                    ))
+                logger.info(f"Added column {table.name}.{column.name}")
+            except Exception as e:
+                logger.warning(f"Could not add column {table.name}.{column.name}: {e}")
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+
+def upsert(db, table, rows: list[dict], key: str, update_columns: list[str]):
+    """INSERT ... ON CONFLICT (key) DO UPDATE, using the session's dialect."""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"upsert not supported for {dialect}")
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key],
+        set_={col: stmt.excluded[col] for col in update_columns},
+    )
+    db.execute(stmt, rows)
 
 
 def get_db():
@@ -1,20 +1,99 @@
 """ElevenLabs Conversational AI API client."""
 
+import asyncio
+import os
+import random
 import time
 import logging
-from typing import Optional
+from typing import Callable, Optional
 
 import httpx
 
+from metrics import ELEVENLABS_REQUEST_SECONDS, status_label
+
 logger = logging.getLogger(__name__)
 
-BASE_URL = "https://api.elevenlabs.io/v1/convai"
+# Overridable to point syncs at a local stand-in (benchmarks/fake_elevenlabs.py)
+BASE_URL = os.environ.get("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1/convai").rstrip("/")
+
+# Pause between listing pages
+LISTING_PAGE_DELAY = float(os.environ.get("ELEVENLABS_PAGE_DELAY", "0.2"))
+
+# Parallel detail requests per fetch_details() call
+DETAIL_CONCURRENCY = 8
+
+# Rate limiting / transient errors: retried with exponential backoff
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+_http: Optional[httpx.AsyncClient] = None
+_http_loop = None
+
+
+def http_client() -> httpx.AsyncClient:
+    """Connection pool shared by all API clients of the running event loop.
+
+    Reusing it keeps TLS connections alive between requests instead of a
+    new handshake per call.
+    """
+    global _http, _http_loop
+    loop = asyncio.get_running_loop()
+    if _http is None or _http.is_closed or _http_loop is not loop:
+        _http = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=DETAIL_CONCURRENCY),
+        )
+        _http_loop = loop
+    return _http
+
+
+async def close_http_client():
+    global _http
+    if _http is not None and not _http.is_closed:
+        await _http.aclose()
+    _http = None
+
+
+def _retry_delay(resp: httpx.Response, attempt: int) -> float:
+    """Retry-After when the server sends seconds, else jittered exponential backoff."""
+    try:
+        return min(float(resp.headers["retry-after"]), RETRY_MAX_DELAY)
+    except (KeyError, ValueError):
+        return min(RETRY_BASE_DELAY * 2 ** attempt, RETRY_MAX_DELAY) * random.uniform(0.5, 1.0)
 
 
 class ElevenLabsClient:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.headers = {"xi-api-key": api_key}
+        self.requests = 0  # HTTP requests sent, retries included
+        self.retries = 0
+        self.throttle_secs = 0.0  # time spent in retry backoff and page delays
+        self.bytes_downloaded = 0
+
+    async def _get(self, endpoint: str, url: str, params: Optional[dict] = None) -> dict:
+        for attempt in range(MAX_RETRIES + 1):
+            self.requests += 1
+            started = time.perf_counter()
+            status = None
+            try:
+                resp = await http_client().get(url, headers=self.headers, params=params)
+                status = resp.status_code
+                self.bytes_downloaded += resp.num_bytes_downloaded
+            finally:
+                ELEVENLABS_REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                                   endpoint=endpoint, status=status_label(status))
+            if resp.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                break
+            delay = _retry_delay(resp, attempt)
+            self.retries += 1
+            self.throttle_secs += delay
+            logger.warning(f"ElevenLabs API returned {resp.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        resp.raise_for_status()
+        return resp.json()
 
     async def list_conversations(
         self,
@@ -39,32 +118,36 @@ class ElevenLabsClient:
         if call_successful:
             params["call_successful"] = call_successful
 
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(
-                f"{BASE_URL}/conversations",
-                headers=self.headers,
-                params=params,
-            )
-            resp.raise_for_status()
-            return resp.json()
+        return await self._get("list_conversations", f"{BASE_URL}/conversations", params)
 
     async def get_conversation_detail(self, conversation_id: str) -> dict:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            resp = await client.get(
-                f"{BASE_URL}/conversations/{conversation_id}",
-                headers=self.headers,
-            )
-            resp.raise_for_status()
-            return resp.json()
+        return await self._get("conversation_detail", f"{BASE_URL}/conversations/{conversation_id}")
+
+    async def fetch_details(self, conversation_ids: list[str], concurrency: int = DETAIL_CONCURRENCY) -> dict:
+        """Fetch several details in parallel. Returns {id: detail or the exception raised}."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(conversation_id: str):
+            async with semaphore:
+                try:
+                    return await self.get_conversation_detail(conversation_id)
+                except Exception as e:
+                    return e
+
+        results = await asyncio.gather(*(fetch(cid) for cid in conversation_ids))
+        return dict(zip(conversation_ids, results))
 
     async def fetch_all_conversations(
         self,
         agent_id: str,
         start_after_unix: Optional[int] = None,
         start_before_unix: Optional[int] = None,
+        on_page: Optional[Callable[[int, int], None]] = None,
     ) -> list[dict]:
+        """Follow the listing cursor; ``on_page(pages, total)`` is called after each page."""
         all_conversations = []
         cursor = None
+        pages = 0
         while True:
             data = await self.list_conversations(
                 agent_id=agent_id,
@@ -74,7 +157,10 @@ class ElevenLabsClient:
             )
             conversations = data.get("conversations", [])
             all_conversations.extend(conversations)
+            pages += 1
             logger.info(f"Fetched page with {len(conversations)} conversations (total: {len(all_conversations)})")
+            if on_page:
+                on_page(pages, len(all_conversations))
 
             if not data.get("has_more", False):
                 break
@@ -82,11 +168,11 @@ class ElevenLabsClient:
             if not cursor:
                 break
             # small delay to avoid rate limits
-            await _async_sleep(0.2)
+            self.throttle_secs += LISTING_PAGE_DELAY
+            await _async_sleep(LISTING_PAGE_DELAY)
 
         return all_conversations
 
 
 async def _async_sleep(seconds: float):
-    import asyncio
     await asyncio.sleep(seconds)
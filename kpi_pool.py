@@ -0,0 +1,211 @@
+"""KPI computation off the event loop, with large histories spread over a process pool.
+
+A worker thread reads the KPI columns in batches and hands each batch to a
+process pool, which reduces it to a partial (analytics.aggregate_batch); the
+thread merges the partials in order.  Histories that fit in one batch are
+aggregated in the thread itself.  The async entry point gives up after
+``KPI_TIMEOUT`` seconds (``asyncio.wait_for``) or when the client
+disconnects: no further batches are read or submitted and queued ones are
+cancelled.  Every caller goes through it, the dashboard bootstrap included.
+Results are kept per agent, month and data version (``cached_kpis``), so
+the dashboard page can embed them without computing anything.
+
+Agent comparisons (sync_service.compare_kpis) also run in a thread; their
+results are cached by agents, month and data versions, and concurrent
+identical requests share one computation.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from itertools import chain
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from data_version import get_version
+from database import SessionLocal
+from analytics import aggregate_batch
+from kpis import merge_partials, finalize_kpis
+from metrics import KPI_COMPUTE_SECONDS, cache_lookup
+from sync_service import compare_kpis, iter_kpi_batches, kpi_percentiles
+
+logger = logging.getLogger(__name__)
+
+# Leave a core for the web worker itself
+KPI_WORKERS = int(os.environ.get("KPI_WORKERS", "0")) or max(1, (os.cpu_count() or 2) - 1)
+KPI_TIMEOUT = float(os.environ.get("KPI_TIMEOUT", "60"))
+# How often a waiting computation checks for cancellation / client disconnects
+POLL_INTERVAL = 0.25
+# Finished comparisons kept per (agents, month, data versions)
+COMPARE_CACHE_SIZE = 32
+# Finished KPI results kept per (agent, month, data version)
+KPI_CACHE_SIZE = 64
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_compare_cache: OrderedDict = OrderedDict()
+_kpi_cache: OrderedDict = OrderedDict()
+_compare_inflight: dict = {}
+
+
+class KpiCancelled(Exception):
+    """The computation was abandoned (timeout or client gone)."""
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(KPI_WORKERS)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _check(cancelled: Optional[threading.Event]):
+    if cancelled is not None and cancelled.is_set():
+        raise KpiCancelled()
+
+
+def _result(future, cancelled: Optional[threading.Event]) -> dict:
+    while True:
+        _check(cancelled)
+        try:
+            return future.result(timeout=POLL_INTERVAL)
+        except FutureTimeout:
+            continue
+
+
+@KPI_COMPUTE_SECONDS.time()
+def compute_kpis_pooled(db: Session, agent_id: str, month: Optional[str] = None,
+                        cancelled: Optional[threading.Event] = None) -> dict:
+    """Same result as sync_service.compute_kpis; run it in a worker thread, not on the event loop."""
+    batches = iter_kpi_batches(db, agent_id, month)
+    first = next(batches, None)
+    second = next(batches, None)
+    if second is None:
+        # One batch: not worth the round trip to another process
+        partial = aggregate_batch(first) if first else None
+        return finalize_kpis(agent_id, month, partial, kpi_percentiles(db, agent_id, month, partial))
+
+    pool = get_pool()
+    partial = None
+    pending = deque()
+    try:
+        for batch in chain((first, second), batches):
+            _check(cancelled)
+            pending.append(pool.submit(aggregate_batch, batch))
+            # Read ahead a little, so batches don't pile up in memory
+            if len(pending) >= KPI_WORKERS * 2:
+                partial = merge_partials(partial, _result(pending.popleft(), cancelled))
+        while pending:
+            partial = merge_partials(partial, _result(pending.popleft(), cancelled))
+    finally:
+        for future in pending:
+            future.cancel()
+        batches.close()
+    return finalize_kpis(agent_id, month, partial, kpi_percentiles(db, agent_id, month, partial))
+
+
+def cached_kpis(agent_id: str, month: Optional[str] = None) -> Optional[dict]:
+    """The KPIs last computed for the agent's current data version, or None."""
+    key = (agent_id, month, get_version(agent_id))
+    cached = _kpi_cache.get(key)
+    cache_lookup("kpis", cached is not None)
+    if cached is not None:
+        _kpi_cache.move_to_end(key)
+    return cached
+
+
+async def compute_kpis_async(agent_id: str, month: Optional[str] = None, request=None,
+                             timeout: float = KPI_TIMEOUT) -> dict:
+    """compute_kpis_pooled in a thread; raises TimeoutError, or KpiCancelled if ``request`` disconnects."""
+    key = (agent_id, month, get_version(agent_id))
+    cached = cached_kpis(agent_id, month)
+    if cached is not None:
+        return cached
+    cancelled = threading.Event()
+
+    def run():
+        db = SessionLocal()
+        try:
+            return compute_kpis_pooled(db, agent_id, month, cancelled)
+        finally:
+            db.close()
+
+    async def wait():
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=POLL_INTERVAL)
+            if done:
+                return task.result()
+            if request is not None and await request.is_disconnected():
+                logger.info(f"KPI computation for {agent_id} ({month or 'all'}) cancelled: client disconnected")
+                raise KpiCancelled()
+
+    task = asyncio.ensure_future(asyncio.to_thread(run))
+    try:
+        kpis = await asyncio.wait_for(wait(), timeout)
+    except (asyncio.TimeoutError, TimeoutError):
+        logger.warning(f"KPI computation for {agent_id} ({month or 'all'}) timed out after {timeout}s")
+        raise TimeoutError() from None
+    finally:
+        if not task.done():
+            cancelled.set()
+            # The thread notices within POLL_INTERVAL; its outcome no longer matters
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    # Keyed by the version read before computing: data written meanwhile bumps it
+    _kpi_cache[key] = kpis
+    while len(_kpi_cache) > KPI_CACHE_SIZE:
+        _kpi_cache.popitem(last=False)
+    return kpis
+
+
+async def compare_kpis_async(agent_ids: list[str], month: Optional[str] = None,
+                             timeout: float = KPI_TIMEOUT) -> dict:
+    """compare_kpis in a thread, cached and shared by concurrent identical requests.
+
+    Raises TimeoutError; a caller giving up does not cancel the computation
+    the other callers (and the cache) are waiting for.
+    """
+    key = (tuple(agent_ids), month, tuple(get_version(a) for a in agent_ids))
+    cached = _compare_cache.get(key)
+    cache_lookup("kpi_compare", cached is not None)
+    if cached is not None:
+        _compare_cache.move_to_end(key)
+        return cached
+
+    task = _compare_inflight.get(key)
+    if task is None:
+        def run():
+            db = SessionLocal()
+            try:
+                return compare_kpis(db, agent_ids, month)
+            finally:
+                db.close()
+
+        task = _compare_inflight[key] = asyncio.ensure_future(asyncio.to_thread(run))
+        task.add_done_callback(lambda t: _compare_done(key, t))
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except (asyncio.TimeoutError, TimeoutError):
+        logger.warning(f"KPI comparison of {len(agent_ids)} agents ({month or 'all'}) timed out after {timeout}s")
+        raise TimeoutError() from None
+
+
+def _compare_done(key: tuple, task: asyncio.Future):
+    _compare_inflight.pop(key, None)
+    if task.cancelled() or task.exception() is not None:
+        return
+    _compare_cache[key] = task.result()
+    while len(_compare_cache) > COMPARE_CACHE_SIZE:
+        _compare_cache.popitem(last=False)
@@ -0,0 +1,230 @@
+"""KPI aggregation over columnar batches of conversation rows.
+
+Each batch (``{column: sequence}`` for ``KPI_COLUMNS``) is reduced to a
+small mergeable partial; partials of all batches are merged in order and
+turned into the KPI dict.  Only the standard library is used; with NumPy
+installed analytics.aggregate_batch computes the same partials column-wise.
+"""
+
+import json
+from datetime import datetime
+from typing import Optional
+
+KPI_COLUMNS = (
+    "call_successful", "direction", "status", "termination_reason", "evaluation_criteria_results",
+    "call_duration_secs", "message_count", "cost", "rating", "start_time_unix",
+)
+
+
+def aggregate_batch(batch: dict) -> dict:
+    """Reduce one columnar batch to a partial (counts, sums, per-criterion and per-day maps)."""
+    outcomes, directions, statuses = {}, {}, {}
+    duration = [0, 0, None, None, 0, 0]  # count, sum, min, max, <30s, >300s (positive durations)
+    messages = [0, 0]
+    costs = [0, 0]
+    ratings = [0, 0]
+    transfers = dropouts = 0
+    criteria = {}
+    days = {}
+    total = 0
+
+    for (outcome, direction, status, termination, criteria_json,
+         secs, message_count, cost, rating, start) in zip(*(batch[c] for c in KPI_COLUMNS)):
+        total += 1
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        directions[direction] = directions.get(direction, 0) + 1
+        statuses[status] = statuses.get(status, 0) + 1
+
+        if secs and secs > 0:
+            duration[0] += 1
+            duration[1] += secs
+            duration[2] = secs if duration[2] is None else min(duration[2], secs)
+            duration[3] = secs if duration[3] is None else max(duration[3], secs)
+            duration[4] += secs < 30
+            duration[5] += secs > 300
+        reason = termination.lower() if termination else ""
+        transfers += "transfer" in reason
+        dropouts += status in ("failed", "initiated") or "hang" in reason
+        if message_count and message_count > 0:
+            messages[0] += 1
+            messages[1] += message_count
+        if cost and cost > 0:
+            costs[0] += 1
+            costs[1] += cost
+        if rating is not None:
+            ratings[0] += 1
+            ratings[1] += rating
+
+        if criteria_json:
+            _count_criteria(criteria_json, criteria)
+
+        if start:
+            day = datetime.utcfromtimestamp(start).strftime("%Y-%m-%d")
+            d = days.get(day)
+            if d is None:
+                d = days[day] = [0, 0, 0, 0, 0, 0]  # total, success, failed, duration sum/count, cost
+            d[0] += 1
+            if outcome == "success":
+                d[1] += 1
+            elif outcome == "failure":
+                d[2] += 1
+            if secs:
+                d[3] += secs
+                d[4] += 1
+            if cost:
+                d[5] += cost
+
+    return {
+        "total": total, "outcomes": outcomes, "directions": directions, "statuses": statuses,
+        "duration": duration, "messages": messages, "costs": costs, "ratings": ratings,
+        "transfers": transfers, "dropouts": dropouts, "criteria": criteria, "days": days,
+    }
+
+
+def _count_criteria(criteria_json: str, criteria: dict, n: int = 1, loads=json.loads):
+    """Add the evaluation results of ``n`` conversations to {criterion: [pass, fail, total]}."""
+    try:
+        parsed = loads(criteria_json)
+        if isinstance(parsed, dict):
+            items = [(crit_id, result.get("result") if isinstance(result, dict) else result)
+                     for crit_id, result in parsed.items()]
+        elif isinstance(parsed, list):
+            items = [(item.get("id") or item.get("criteria_id") or str(item), item.get("result"))
+                     for item in parsed]
+        else:
+            return
+    except (json.JSONDecodeError, TypeError, AttributeError):
+        return
+    for crit_id, result in items:
+        counts = criteria.get(crit_id)
+        if counts is None:
+            counts = criteria[crit_id] = [0, 0, 0]
+        counts[0 if result == "success" else 1] += n
+        counts[2] += n
+
+
+def _add_counts(into: dict, other: dict):
+    for key, n in other.items():
+        into[key] = into.get(key, 0) + n
+
+
+def merge_partials(into: Optional[dict], other: dict) -> dict:
+    """Merge ``other`` into ``into`` (in place) and return it; ``into`` may be None."""
+    if into is None:
+        return other
+    into["total"] += other["total"]
+    for key in ("outcomes", "directions", "statuses"):
+        _add_counts(into[key], other[key])
+    a, b = into["duration"], other["duration"]
+    if b[0]:
+        a[2] = b[2] if a[2] is None else min(a[2], b[2])
+        a[3] = b[3] if a[3] is None else max(a[3], b[3])
+    for i in (0, 1, 4, 5):
+        a[i] += b[i]
+    for key in ("messages", "costs", "ratings"):
+        into[key][0] += other[key][0]
+        into[key][1] += other[key][1]
+    into["transfers"] += other["transfers"]
+    into["dropouts"] += other["dropouts"]
+    for target, source in ((into["criteria"], other["criteria"]), (into["days"], other["days"])):
+        for key, values in source.items():
+            if key in target:
+                target[key] = [x + y for x, y in zip(target[key], values)]
+            else:
+                target[key] = values
+    return into
+
+
+def _rate(count: int, total: int) -> float:
+    return round(count / total * 100, 2) if total else 0
+
+
+def finalize_kpis(agent_id: str, month: Optional[str], partial: Optional[dict],
+                  percentiles: Optional[dict] = None) -> dict:
+    """The KPI response for the merged partial of all batches.
+
+    ``percentiles`` (rollups.percentiles) is passed through as is.
+    """
+    if not partial or not partial["total"]:
+        return empty_kpis(agent_id, month, percentiles)
+    total = partial["total"]
+    outcomes, directions, statuses = partial["outcomes"], partial["directions"], partial["statuses"]
+    dur_count, dur_sum, dur_min, dur_max, short_calls, long_calls = partial["duration"]
+    msg_count, msg_sum = partial["messages"]
+    cost_count, total_cost = partial["costs"]
+    rating_count, rating_sum = partial["ratings"]
+    successful = outcomes.get("success", 0)
+    done_calls = statuses.get("done", 0)
+    technical_errors = statuses.get("failed", 0)
+    avg_rating = rating_sum / rating_count if rating_count else None
+
+    return {
+        "agent_id": agent_id,
+        "month": month or "all",
+        "total_conversations": total,
+        # KPI 1
+        "conversion_rate": _rate(successful, total),
+        "successful_count": successful,
+        "failed_count": outcomes.get("failure", 0),
+        "unknown_count": outcomes.get("unknown", 0),
+        # KPI 2
+        "outbound_calls": directions.get("outbound", 0),
+        "inbound_calls": directions.get("inbound", 0),
+        "done_calls": done_calls,
+        "failed_calls": technical_errors,
+        "connection_rate": _rate(done_calls, total),
+        # KPI 3
+        "criteria_stats": [
+            {"name": crit_id, "pass": passed, "fail": failed, "total": n}
+            for crit_id, (passed, failed, n) in partial["criteria"].items()
+        ],
+        # KPI 4
+        "avg_duration_secs": round(dur_sum / dur_count, 1) if dur_count else 0,
+        "min_duration_secs": dur_min or 0,
+        "max_duration_secs": dur_max or 0,
+        "short_calls_under_30s": short_calls,
+        "long_calls_over_300s": long_calls,
+        "percentiles": percentiles or {},
+        # KPI 5
+        "transfer_count": partial["transfers"],
+        "transfer_rate": _rate(partial["transfers"], total),
+        # KPI 6
+        "dropout_count": partial["dropouts"],
+        "dropout_rate": _rate(partial["dropouts"], total),
+        "avg_message_count": round(msg_sum / msg_count, 1) if msg_count else 0,
+        "total_cost": total_cost,
+        "avg_cost_per_session": round(total_cost / cost_count, 2) if cost_count else 0,
+        "technical_errors": technical_errors,
+        "error_rate": _rate(technical_errors, total),
+        "avg_rating": round(avg_rating, 2) if avg_rating else None,
+        # Trends
+        "daily_trends": [
+            {
+                "date": day,
+                "total": d[0],
+                "success": d[1],
+                "failed": d[2],
+                "avg_duration": round(d[3] / d[4], 1) if d[4] else 0,
+                "cost": d[5],
+            }
+            for day, d in sorted(partial["days"].items())
+        ],
+    }
+
+
+def empty_kpis(agent_id: str, month: Optional[str], percentiles: Optional[dict] = None) -> dict:
+    return {
+        "agent_id": agent_id,
+        "month": month or "all",
+        "total_conversations": 0,
+        "conversion_rate": 0, "successful_count": 0, "failed_count": 0, "unknown_count": 0,
+        "outbound_calls": 0, "inbound_calls": 0, "done_calls": 0, "failed_calls": 0, "connection_rate": 0,
+        "criteria_stats": [],
+        "avg_duration_secs": 0, "min_duration_secs": 0, "max_duration_secs": 0,
+        "short_calls_under_30s": 0, "long_calls_over_300s": 0, "percentiles": percentiles or {},
+        "transfer_count": 0, "transfer_rate": 0,
+        "dropout_count": 0, "dropout_rate": 0,
+        "avg_message_count": 0, "total_cost": 0, "avg_cost_per_session": 0,
+        "technical_errors": 0, "error_rate": 0, "avg_rating": None,
+        "daily_trends": [],
+    }
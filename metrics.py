@@ -0,0 +1,250 @@
+"""In-process metrics in the Prometheus text exposition format (``GET /metrics``).
+
+Counters, gauges and histograms are kept per process; with several uvicorn
+workers each one reports its own series.  All metrics are declared at the
+bottom of this module so the catalog lives in one place.
+"""
+
+import functools
+import inspect
+import threading
+import time
+from contextlib import ContextDecorator
+from typing import Optional
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers sub-millisecond cache hits up to multi-minute syncs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _label_text(self.label_names, key), value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self._samples()]
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class _Timer(ContextDecorator):
+    """``with hist.time(...)`` or ``@hist.time(...)`` (plain and async functions)."""
+
+    def __init__(self, histogram: "Histogram", labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __call__(self, func):
+        if not inspect.iscoroutinefunction(func):
+            return super().__call__(func)
+
+        @functools.wraps(func)
+        async def timed(*args, **kwargs):
+            with self._recreate_cm():
+                return await func(*args, **kwargs)
+        return timed
+
+    def _recreate_cm(self):
+        # A fresh timer per decorated call, so concurrent calls don't share state
+        return _Timer(self.histogram, dict(self.labels))
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, sum, count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_format_value(float(bound))}"'
+                yield f"{self.name}_bucket", _label_text(self.label_names, key, le), cumulative
+            yield f"{self.name}_bucket", _label_text(self.label_names, key, 'le="+Inf"'), count
+            yield f"{self.name}_sum", _label_text(self.label_names, key), total
+            yield f"{self.name}_count", _label_text(self.label_names, key), count
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Record the latency of every HTTP request by route template.
+
+    The template (``/api/download-csv/{archive_id}``) keeps label values
+    bounded; requests that matched no route are counted as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"], route=_route_label(scope), status=status,
+            )
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    root = scope.get("root_path", "")
+    path = scope.get("path", "")
+    if path.startswith(root + "/static/"):
+        return "/static"
+    return "unmatched"
+
+
+def status_label(status: Optional[int]) -> str:
+    """HTTP status for labels; "error" when no response was received."""
+    return str(status) if status is not None else "error"
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+# ─── Catalog ──────────────────────────────────────────────────────────
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "voicebot_http_request_seconds", "Dashboard HTTP request latency by route",
+    ("method", "route", "status"),
+)
+ELEVENLABS_REQUEST_SECONDS = Histogram(
+    "voicebot_elevenlabs_request_seconds", "ElevenLabs API request latency (each attempt, retries included)",
+    ("endpoint", "status"),
+)
+SYNC_DETAILS_FETCHED = Counter(
+    "voicebot_sync_details_fetched_total", "Conversation details fetched and stored by syncs", ("agent_id",),
+)
+SYNC_DETAIL_FAILURES = Counter(
+    "voicebot_sync_detail_failures_total", "Conversation detail fetches that failed", ("agent_id",),
+)
+SYNC_SECONDS = Histogram(
+    "voicebot_sync_seconds", "Duration of complete syncs", ("sync_type", "status"),
+)
+SYNCS_IN_FLIGHT = Gauge("voicebot_syncs_in_flight", "Syncs currently running")
+DB_COMMIT_SECONDS = Histogram(
+    "voicebot_db_commit_seconds", "Sync database commit time by phase", ("phase",),
+)
+KPI_COMPUTE_SECONDS = Histogram("voicebot_compute_kpis_seconds", "compute_kpis duration")
+CACHE_REQUESTS = Counter(
+    "voicebot_cache_requests_total", "Cache lookups by cache and result (hit/miss)", ("cache", "result"),
+)
+PHONE_EXTRACTIONS = Counter(
+    "voicebot_phone_extractions_total",
+    "Phone number extractions by call source; hit = settled without walking the transcript",
+    ("source", "result"),
+)
+SCHEDULER_JOB_SECONDS = Histogram(
+    "voicebot_scheduler_job_seconds", "Scheduled job duration", ("job",),
+)
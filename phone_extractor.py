@@ -0,0 +1,385 @@
+"""Agent/client phone number extraction from ElevenLabs conversation details.
+
+Known provider fields are read through a declarative path table, in priority
+order.  Only when a number is still missing is the detail walked: a single
+pass collects both the phone-named keys under ``metadata`` and the
+phone-like strings, and the rest of the document (the transcript) is only
+visited if ``metadata`` did not settle it.  The transcript of calls
+without a phone line (:data:`NO_PHONE_LINE_SOURCES`) is not searched.
+"""
+
+import re
+from typing import Optional
+
+from metrics import PHONE_EXTRACTIONS
+
+AGENT = "agent"
+CLIENT = "client"
+
+# (provider, container path, key) per role, highest priority first.  A value
+# is taken when truthy; containers that are missing or not dicts are skipped.
+PHONE_PATHS = {
+    AGENT: (
+        ("twilio", ("metadata", "body"), "To"),
+        ("sip_trunk", ("metadata", "body"), "to_number"),
+        ("sip_trunk", ("metadata", "body"), "to"),
+        ("twilio", ("metadata", "body"), "Called"),
+        ("phone_call", ("metadata", "phone_call"), "agent_number"),
+        ("phone_call", ("metadata", "phone_call"), "to_number"),
+        ("phone_call", ("metadata", "phone_call"), "to"),
+        ("phone_call", ("metadata", "phone_call"), "agent_phone_number"),
+        ("phone_call", ("metadata", "phone_call"), "called_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "agent_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "to_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "To"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "agent_phone"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "called_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "Called"),
+    ),
+    CLIENT: (
+        ("twilio", ("metadata", "body"), "From"),
+        ("sip_trunk", ("metadata", "body"), "from_number"),
+        ("sip_trunk", ("metadata", "body"), "from"),
+        ("twilio", ("metadata", "body"), "Caller"),
+        ("phone_call", ("metadata", "phone_call"), "external_number"),
+        ("phone_call", ("metadata", "phone_call"), "from_number"),
+        ("phone_call", ("metadata", "phone_call"), "from"),
+        ("phone_call", ("metadata", "phone_call"), "caller_phone_number"),
+        ("phone_call", ("metadata", "phone_call"), "caller_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "customer_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "from_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "From"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "client_phone"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "caller_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "Caller"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "phone"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "phone_number"),
+        ("dynamic_variables", ("conversation_initiation_client_data", "dynamic_variables"), "customer_phone"),
+    ),
+}
+
+
+def _compile_lookups(table: dict) -> tuple:
+    """Group the table by container: ((path, ((role, keys), ...)), ...).
+
+    Every role lists its containers in the same order, so walking the groups
+    in order keeps each role's priority.
+    """
+    groups = {}
+    for role, rows in table.items():
+        for _, path, key in rows:
+            groups.setdefault(path, {}).setdefault(role, []).append(key)
+    return tuple(
+        (path, tuple((role, tuple(keys)) for role, keys in by_role.items()))
+        for path, by_role in groups.items()
+    )
+
+
+_LOOKUPS = _compile_lookups(PHONE_PATHS)
+
+# The same groups as (parent key, container key, agent keys, client keys) for
+# the fast path: every provider container sits two levels down.
+_PROVIDER_FIELDS = tuple(
+    (path[0], path[1], dict(keys_by_role).get(AGENT, ()), dict(keys_by_role).get(CLIENT, ()))
+    for path, keys_by_role in _LOOKUPS
+)
+
+# Key names that identify a number anywhere under ``metadata``
+META_KEYS = {
+    AGENT: frozenset({
+        "agent_number", "to_number", "To", "Called", "agent_phone", "called_number", "bot_number",
+        "destination_number", "dialed_number", "agent_phone_number", "to",
+    }),
+    CLIENT: frozenset({
+        "from_number", "From", "Caller", "external_number", "customer_number", "caller_number",
+        "client_phone", "source_number", "originating_number", "customer_phone", "phone_number",
+        "phone", "from", "caller_phone_number",
+    }),
+}
+
+# Path fragments used to classify phone-like values found by the walk
+PATH_HINTS = {
+    AGENT: ("agent", "to_number", ".to", "called", "voicebot", "bot_number"),
+    CLIENT: ("client", "customer", "from_number", ".from", "caller", "external", "user_phone"),
+}
+
+# conversation_initiation_source values of web widget and SDK sessions: nobody
+# dials a number, so once the fixed chain above comes up empty only data the
+# agent collected can hold one, and the transcript is not scanned.
+NO_PHONE_LINE_SOURCES = frozenset({
+    "widget", "js_sdk", "react_sdk", "react_native_sdk", "android_sdk", "swift_sdk",
+    "flutter_sdk", "python_sdk", "node_js_sdk",
+})
+_NO_PHONE_LINE_SKIP = frozenset({"transcript"})
+
+# Same as ^\+?\d[\d\s\-]{6,15}\d$ on the stripped string, without the strip
+_PHONE_RE = re.compile(r"\s*(\+?\d[\d\s\-]{6,15}\d)\s*")
+
+# How a number was found (see explain_phone_numbers)
+FIELD = "field"  # provider field: any truthy value
+KEY = "key"  # phone-named key under metadata: non-blank string
+PATTERN = "pattern"  # phone-like string anywhere
+
+
+class PhoneScan:
+    """Phone-named keys and phone-like values of one detail document.
+
+    ``metadata`` is walked first (it is where numbers live); the rest of
+    the document, transcript included, only when the phone-like values are
+    needed.  No part is walked twice.  Paths are tuples of keys and list
+    indexes.
+    """
+
+    def __init__(self, detail: dict):
+        self.detail = detail
+        self.meta_hits = {}  # role -> (path, value) of the first phone-named key in metadata
+        self._matches = {}  # top-level key -> [(path, value)]
+        meta = detail.get("metadata")
+        if type(meta) is dict:
+            self._matches["metadata"] = found = []
+            _walk_dict(meta, ("metadata",), found, self.meta_hits)
+
+    def matches(self, skip: frozenset = frozenset()) -> list:
+        """(path, value) for every phone-like string, in document order.
+
+        Top-level keys in ``skip`` are left out (and not walked).
+        """
+        values = []
+        for k, v in self.detail.items():
+            if k in skip:
+                continue
+            if k not in self._matches:
+                self._matches[k] = found = []
+                t = type(v)
+                if t is str:
+                    _match(v, (k,), found)
+                elif t is dict:
+                    _walk_dict(v, (k,), found)
+                elif t is list:
+                    _walk_list(v, (k,), found)
+            values.extend(self._matches[k])
+        return values
+
+    @property
+    def phone_values(self) -> list:
+        """Like :meth:`matches` with printable paths (``a.b[0].c``)."""
+        return [(format_path(path), value) for path, value in self.matches()]
+
+
+def scan_detail(detail: dict) -> PhoneScan:
+    scan = PhoneScan(detail)
+    scan.matches()
+    return scan
+
+
+def format_path(path: tuple, indexes: bool = True) -> str:
+    """``("a", "b", 0, "c")`` -> ``a.b[0].c`` (``a.b[*].c`` without indexes)."""
+    out = ""
+    for part in path:
+        if type(part) is int:
+            out += f"[{part}]" if indexes else "[*]"
+        else:
+            out = f"{out}.{part}" if out else part
+    return out
+
+
+def _match(value: str, path: tuple, found: list):
+    m = _PHONE_RE.fullmatch(value)
+    if m:
+        found.append((path, m.group(1)))
+
+
+# Dispatch on exact types: the input is decoded JSON, and this is the hot loop.
+def _walk_dict(obj: dict, path: tuple, found: list, meta_hits: Optional[dict] = None):
+    for k, v in obj.items():
+        t = type(v)
+        if t is str:
+            if meta_hits is not None:
+                _meta_hit(k, v, path, meta_hits)
+            m = _PHONE_RE.fullmatch(v)
+            if m:
+                found.append((path + (k,), m.group(1)))
+        elif t is dict:
+            # Phone-named keys count in metadata's nested dicts, not inside lists
+            _walk_dict(v, path + (k,), found, meta_hits)
+        elif t is list:
+            _walk_list(v, path + (k,), found)
+
+
+def _walk_list(obj: list, path: tuple, found: list):
+    for i, v in enumerate(obj):
+        t = type(v)
+        if t is str:
+            _match(v, path + (i,), found)
+        elif t is dict:
+            _walk_dict(v, path + (i,), found)
+        elif t is list:
+            _walk_list(v, path + (i,), found)
+
+
+def _meta_hit(key: str, value: str, path: tuple, hits: dict):
+    for role in (AGENT, CLIENT):
+        if role not in hits and key in META_KEYS[role]:
+            value = value.strip()
+            if value:
+                hits[role] = (path + (key,), value)
+
+
+def _get(detail, path: tuple):
+    obj = detail
+    for part in path:
+        if type(part) is int:
+            obj = obj[part] if type(obj) is list and part < len(obj) else None
+        else:
+            obj = obj.get(part) if type(obj) is dict else None
+    return obj
+
+
+def _lookup_fields(detail: dict, found: dict):
+    """Fill missing roles from the provider path table."""
+    for path, keys_by_role in _LOOKUPS:
+        container = _get(detail, path)
+        if type(container) is not dict or not container:
+            continue
+        for role, keys in keys_by_role:
+            if role not in found:
+                for key in keys:
+                    value = container.get(key)
+                    if value:
+                        found[role] = (path + (key,), FIELD, value)
+                        break
+        if len(found) == 2:
+            return
+
+
+def _provider_numbers(detail: dict) -> tuple:
+    """(agent, client) from the provider path table alone; a role is None when not found."""
+    agent = client = None
+    for parent_key, container_key, agent_keys, client_keys in _PROVIDER_FIELDS:
+        parent = detail.get(parent_key)
+        if type(parent) is not dict:
+            continue
+        container = parent.get(container_key)
+        if type(container) is not dict or not container:
+            continue
+        if agent is None:
+            for key in agent_keys:
+                value = container.get(key)
+                if value:
+                    agent = value
+                    break
+        if client is None:
+            for key in client_keys:
+                value = container.get(key)
+                if value:
+                    client = value
+                    break
+        if agent is not None and client is not None:
+            break
+    return agent, client
+
+
+def _search(detail: dict, scan: Optional[PhoneScan], skip: frozenset = frozenset()) -> dict:
+    """The fallback chain, pattern scan without the top-level keys in ``skip``.
+
+    Returns role -> (path, kind, value).
+    """
+    found = {}
+    _lookup_fields(detail, found)
+
+    if AGENT not in found or CLIENT not in found:
+        if scan is None:
+            scan = PhoneScan(detail)
+        for role, (path, value) in scan.meta_hits.items():
+            found.setdefault(role, (path, KEY, value))
+
+    if AGENT not in found or CLIENT not in found:
+        matches = scan.matches(skip)
+        for path, value in matches:
+            path_lower = format_path(path).lower()
+            if AGENT not in found and any(kw in path_lower for kw in PATH_HINTS[AGENT]):
+                found[AGENT] = (path, PATTERN, value)
+            elif CLIENT not in found and any(kw in path_lower for kw in PATH_HINTS[CLIENT]):
+                found[CLIENT] = (path, PATTERN, value)
+
+        # Nothing classified: take the first two numbers, or a single one as the client
+        if not found and len(matches) >= 2:
+            found[AGENT] = (matches[0][0], PATTERN, matches[0][1])
+            found[CLIENT] = (matches[1][0], PATTERN, matches[1][1])
+        elif not found and matches:
+            found[CLIENT] = (matches[0][0], PATTERN, matches[0][1])
+    return found
+
+
+def explain_phone_numbers(detail: dict, scan: Optional[PhoneScan] = None) -> dict:
+    """Where the full search finds each number: role -> {path, kind, value}."""
+    return {
+        role: {"path": format_path(path), "kind": kind, "value": value}
+        for role, (path, kind, value) in _search(detail, scan).items()
+    }
+
+
+def path_statistics(details: list, top: int = 50) -> dict:
+    """Aggregate over many details: which paths the numbers come from.
+
+    ``extraction`` counts the path and kind chosen for each role (``None``
+    when nothing was found); ``phone_values`` counts the documents with a
+    phone-like value at each path (list indexes folded to ``[*]``).
+    """
+    extraction = {AGENT: {}, CLIENT: {}}
+    value_paths = {}
+    for detail in details:
+        scan = PhoneScan(detail)
+        found = _search(detail, scan)
+        for role, counts in extraction.items():
+            key = (format_path(found[role][0]), found[role][1]) if role in found else (None, None)
+            counts[key] = counts.get(key, 0) + 1
+        for path in {format_path(path, indexes=False) for path, _ in scan.matches()}:
+            value_paths[path] = value_paths.get(path, 0) + 1
+
+    n = len(details)
+    return {
+        "documents": n,
+        "extraction": {
+            role: [
+                {"path": path, "kind": kind, "count": count, "share": round(count / n, 4)}
+                for (path, kind), count in sorted(counts.items(), key=lambda kv: -kv[1])
+            ]
+            for role, counts in extraction.items()
+        },
+        "phone_values": [
+            {"path": path, "count": count, "share": round(count / n, 4)}
+            for path, count in sorted(value_paths.items(), key=lambda kv: -kv[1])[:top]
+        ],
+    }
+
+
+def extract_phone_numbers(detail: dict, scan: Optional[PhoneScan] = None, source: Optional[str] = None) -> tuple:
+    """Return (agent_phone, client_phone) for a conversation detail.
+
+    Provider fields from :data:`PHONE_PATHS` win; then phone-named keys
+    anywhere in ``metadata``; then phone-like values classified by path,
+    with a lone number assigned to the client.  ``source`` is the
+    conversation's ``conversation_initiation_source``: for
+    :data:`NO_PHONE_LINE_SOURCES` the transcript is left out of that last
+    step.  Pass ``scan`` to reuse a walk already done by the caller.
+
+    Counted on /metrics per source: a hit when the transcript was not walked.
+    """
+    # Provider calls (metadata.body / metadata.phone_call) settle both roles
+    # here, without building paths or walking the document.
+    agent_phone, client_phone = _provider_numbers(detail)
+    hit = True
+    if agent_phone is None or client_phone is None:
+        skip = _NO_PHONE_LINE_SKIP if source in NO_PHONE_LINE_SOURCES else frozenset()
+        if scan is None:
+            scan = PhoneScan(detail)
+        found = _search(detail, scan, skip)
+        hit = bool(skip) or "transcript" not in scan._matches
+        agent_phone = found[AGENT][2] if AGENT in found else None
+        client_phone = found[CLIENT][2] if CLIENT in found else None
+    PHONE_EXTRACTIONS.inc(source=source or "unknown", result="hit" if hit else "miss")
+    return (
+        str(agent_phone).strip() if agent_phone else None,
+        str(client_phone).strip() if client_phone else None,
+    )
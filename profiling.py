@@ -0,0 +1,235 @@
+"""Opt-in request profiling: sampled stacks plus SQL counts for slow requests.
+
+Enabled with ``PROFILE_REQUESTS=1``.  While a request runs, a background
+thread samples the stacks of all threads every ``PROFILE_INTERVAL_MS``
+(event loop, threadpool and ``to_thread`` workers alike), and SQL statements
+executed on the request's behalf are counted and timed.  Requests slower
+than ``PROFILE_THRESHOLD_MS``, or sent with ``X-Profile: 1``, keep their
+profile; the last ``PROFILE_KEEP`` are listed at ``/api/profiles``.
+
+Samples cover the whole process, so requests running at the same time show
+up in each other's profiles.  Idle threads (waiting on a lock, queue or
+selector) are counted separately and left out of the stacks.
+"""
+
+import contextvars
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import Headers
+
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS", "").lower() in ("1", "true", "yes")
+PROFILE_THRESHOLD_MS = float(os.environ.get("PROFILE_THRESHOLD_MS", "1000"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "20"))
+PROFILE_HEADER = "x-profile"
+
+MAX_STACK_DEPTH = 64
+TOP_FUNCTIONS = 30
+TOP_STATEMENTS = 10
+# A thread whose innermost frame is in one of these modules is waiting, not working
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py")
+
+_current: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("request_profile", default=None)
+_ids = itertools.count(1)
+_profiles: deque = deque(maxlen=PROFILE_KEEP)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, query: str):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.query = query
+        self.started_at = datetime.utcnow()
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.sql_count = 0
+        self.sql_secs = 0.0
+        self.statements = {}  # statement -> [count, secs]
+        self._lock = threading.Lock()
+        self.status = None
+        self.duration_ms = None
+        self.reason = None
+
+    def add_samples(self, stacks: list, idle: int):
+        with self._lock:
+            self.samples += 1
+            self.idle_samples += idle
+            self.stacks.update(stacks)
+
+    def add_statement(self, statement: str, secs: float):
+        key = " ".join(statement.split())[:300]
+        with self._lock:
+            self.sql_count += 1
+            self.sql_secs += secs
+            entry = self.statements.setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += secs
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "captured_at": self.started_at.isoformat(),
+            "reason": self.reason,
+            "duration_ms": self.duration_ms,
+            "sql_count": self.sql_count,
+            "sql_ms": round(self.sql_secs * 1000, 1),
+            "samples": self.samples,
+        }
+
+    def report(self) -> dict:
+        """Summary plus the busiest functions (self / total samples) and slowest statements."""
+        own, total = Counter(), Counter()
+        for stack, n in self.stacks.items():
+            own[stack[-1]] += n
+            for frame in set(stack):
+                total[frame] += n
+        busy = sum(self.stacks.values()) or 1
+        functions = [
+            {"function": f, "self": own[f], "total": n, "total_share": round(n / busy, 3)}
+            for f, n in total.most_common(TOP_FUNCTIONS)
+        ]
+        statements = sorted(self.statements.items(), key=lambda kv: kv[1][1], reverse=True)[:TOP_STATEMENTS]
+        return {
+            **self.summary(),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "idle_samples": self.idle_samples,
+            "functions": functions,
+            "statements": [
+                {"statement": s, "count": count, "ms": round(secs * 1000, 1)} for s, (count, secs) in statements
+            ],
+        }
+
+    def folded(self) -> str:
+        """Collapsed stacks ("a;b;c 12" per line) for flamegraph.pl or speedscope."""
+        return "".join(f"{';'.join(stack)} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class _Sampler:
+    """One daemon thread that samples while at least one request is being profiled."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, profile: RequestProfile):
+        with self._lock:
+            self._active.discard(profile)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                continue
+            stacks, idle = [], 0
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if frame.f_code.co_filename.endswith(_IDLE_FILES):
+                    idle += 1
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stacks.append(tuple(reversed(stack)))
+            for profile in active:
+                profile.add_samples(stacks, idle)
+            time.sleep(self.interval)
+
+
+_sampler = _Sampler(PROFILE_INTERVAL_MS / 1000)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is not None and conn.info.get("profile_started"):
+        profile.add_statement(statement, time.perf_counter() - conn.info["profile_started"].pop())
+
+
+class ProfilingMiddleware:
+    """Profile every request; keep the slow ones and those that ask for it."""
+
+    def __init__(self, app, threshold_ms: float = PROFILE_THRESHOLD_MS):
+        self.app = app
+        self.threshold_ms = threshold_ms
+        if not event.contains(Engine, "before_cursor_execute", _before_execute):
+            event.listen(Engine, "before_cursor_execute", _before_execute)
+            event.listen(Engine, "after_cursor_execute", _after_execute)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/api/profiles"):
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"))
+        requested = Headers(scope=scope).get(PROFILE_HEADER) == "1"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                if requested:
+                    # Lets the caller find the profile it asked for
+                    message.setdefault("headers", []).append((b"x-profile-id", str(profile.id).encode()))
+            await send(message)
+
+        token = _current.set(profile)
+        _sampler.add(profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _sampler.remove(profile)
+            _current.reset(token)
+            profile.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            if requested or profile.duration_ms >= self.threshold_ms:
+                profile.reason = "header" if requested else "slow"
+                _profiles.append(profile)
+
+
+def list_profiles() -> list[dict]:
+    """Kept profiles, newest first."""
+    return [p.summary() for p in reversed(_profiles)]
+
+
+def get_profile(profile_id: int) -> Optional[RequestProfile]:
+    return next((p for p in _profiles if p.id == profile_id), None)
@@ -0,0 +1,174 @@
+"""Raw conversation details kept compressed, and phone re-extraction from them.
+
+Every fetched detail is stored once per conversation as zlib-compressed
+JSON (``conversation_raw_details``), so improved extraction logic can be
+re-applied to all rows locally instead of re-downloading every detail.
+Decompressing and parsing dominate the job, so batches run in a process
+pool.
+
+Usage: python reextract.py [agent_id]
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from data_version import bump as bump_data_version
+from database import Conversation, ConversationRawDetail, release_change_seqs, reserve_change_seq, upsert
+from phone_extractor import extract_phone_numbers
+from shards import conversation_sessions
+
+try:
+    import orjson
+except ImportError:  # optional: about twice as fast as json for large details
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+RAW_DETAIL_COMPRESSION = 6
+REEXTRACT_BATCH_SIZE = 1000
+REEXTRACT_WORKERS = int(os.environ.get("REEXTRACT_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def encode_detail(detail: dict) -> bytes:
+    if orjson is not None:
+        raw = orjson.dumps(detail)
+    else:
+        raw = json.dumps(detail, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return zlib.compress(raw, RAW_DETAIL_COMPRESSION)
+
+
+def decode_detail(blob: bytes) -> dict:
+    raw = zlib.decompress(blob)
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def store_raw_detail(db: Session, conv: Conversation, detail: dict):
+    """Insert or replace the raw detail of ``conv`` (in the caller's transaction)."""
+    upsert(db, ConversationRawDetail.__table__, [{
+        "conversation_id": conv.conversation_id,
+        "agent_id": conv.agent_id,
+        "detail": encode_detail(detail),
+        "fetched_at": datetime.utcnow(),
+    }], "conversation_id", ["agent_id", "detail", "fetched_at"])
+
+
+def load_raw_details(sessions: list, conversation_ids: list, batch_size: int = 500) -> dict:
+    """Decoded stored details for the given ids: {conversation_id: detail}."""
+    raw = ConversationRawDetail
+    details = {}
+    for db in sessions:
+        for i in range(0, len(conversation_ids), batch_size):
+            ids = conversation_ids[i:i + batch_size]
+            for cid, blob in db.query(raw.conversation_id, raw.detail).filter(raw.conversation_id.in_(ids)):
+                details[cid] = decode_detail(blob)
+    return details
+
+
+def _extract_batch(batch: list) -> list:
+    """Pool worker: [(conversation_id, source, blob)] -> [(conversation_id, agent_phone, client_phone)]."""
+    return [(cid, *extract_phone_numbers(decode_detail(blob), source=source)) for cid, source, blob in batch]
+
+
+def _load_batches(db: Session, current: dict, batch_size: int):
+    raw = ConversationRawDetail
+    conversation_ids = list(current)
+    for i in range(0, len(conversation_ids), batch_size):
+        ids = conversation_ids[i:i + batch_size]
+        yield [
+            (cid, current[cid].conversation_initiation_source, blob)
+            for cid, blob in db.query(raw.conversation_id, raw.detail).filter(raw.conversation_id.in_(ids))
+        ]
+
+
+def _run_batches(pool: Optional[ProcessPoolExecutor], workers: int, batches):
+    """Yield _extract_batch results, reading ahead only a couple of batches per worker."""
+    if pool is None:
+        for batch in batches:
+            yield _extract_batch(batch)
+        return
+    pending = deque()
+    for batch in batches:
+        pending.append(pool.submit(_extract_batch, batch))
+        if len(pending) >= workers * 2:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def reextract_phones(db: Session, agent_id: Optional[str] = None, workers: int = REEXTRACT_WORKERS,
+                     batch_size: int = REEXTRACT_BATCH_SIZE) -> dict:
+    """Re-run phone extraction over stored raw details and save what changed.
+
+    Changed rows get a new ``change_seq`` and their agents' data version is
+    bumped, like a sync would do.  Returns counts and the elapsed time.
+    """
+    started = time.perf_counter()
+    scanned = updated = 0
+    changed_agents = set()
+    pool = None
+    try:
+        with conversation_sessions(db, write=True) as sessions:
+            for conv_db in sessions:
+                query = (
+                    conv_db.query(Conversation.conversation_id, Conversation.agent_id,
+                                  Conversation.agent_phone, Conversation.client_phone,
+                                  Conversation.conversation_initiation_source)
+                    .join(ConversationRawDetail, ConversationRawDetail.conversation_id == Conversation.conversation_id)
+                )
+                if agent_id:
+                    query = query.filter(Conversation.agent_id == agent_id)
+                current = {r.conversation_id: r for r in query.all()}
+                if not current:
+                    continue
+                if pool is None and workers > 1 and len(current) > batch_size:
+                    pool = ProcessPoolExecutor(workers)
+
+                changes = []
+                batches = _load_batches(conv_db, current, batch_size)
+                for results in _run_batches(pool, workers, batches):
+                    for cid, agent_phone, client_phone in results:
+                        row = current[cid]
+                        if (agent_phone, client_phone) != (row.agent_phone, row.client_phone):
+                            changes.append({"conversation_id": cid, "agent_phone": agent_phone,
+                                            "client_phone": client_phone})
+                            changed_agents.add(row.agent_id)
+                scanned += len(current)
+
+                if changes:
+                    first = reserve_change_seq(db, conv_db, len(changes))
+                    for offset, change in enumerate(changes):
+                        change["change_seq"] = first + offset
+                    for i in range(0, len(changes), batch_size):
+                        conv_db.execute(update(Conversation), changes[i:i + batch_size])
+                    conv_db.commit()
+                    release_change_seqs(db)
+                    updated += len(changes)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for changed in changed_agents:
+        bump_data_version(db, changed)
+    elapsed = round(time.perf_counter() - started, 2)
+    logger.info(f"Re-extracted phones from {scanned} raw details in {elapsed}s, {updated} conversations updated")
+    return {"scanned": scanned, "updated": updated, "seconds": elapsed}
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    with SessionLocal() as session:
+        print(reextract_phones(session, sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,328 @@
+"""Per agent-day and agent-hour rollups of conversation data, refreshed by syncs.
+
+Each AgentDayRollup row summarizes one agent's conversations on one UTC
+day: their count and quantile sketches (quantiles.py) of the duration,
+message count and cost.  Percentiles for a month or date range merge the
+sketches of its days instead of sorting every row.
+
+Each AgentHourRollup row holds the KPI sums of one UTC hour (the fields of
+a kpis partial), so KPIs for any range of whole hours -- the last 7 days,
+yesterday by hour, an hour-of-week heatmap -- add up buckets instead of
+scanning conversations.
+
+Conversations are upserted, so a sync rebuilds the hour buckets and days
+it touched from their rows rather than adding to them (a sketch cannot
+take a replaced value back out); startup builds the months that have no
+rollups yet.
+Rollups stay in the main database when a month is archived and evicted.
+"""
+
+import json
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from analytics import PERCENTILES
+from archive_store import month_source
+from database import AgentDayRollup, AgentHourRollup, ArchiveLog, Conversation
+from kpis import KPI_COLUMNS, aggregate_batch, finalize_kpis, merge_partials
+from quantiles import QuantileSketch
+from shards import conversation_sessions
+
+logger = logging.getLogger(__name__)
+
+# Conversation column -> rollup sketch column
+SKETCH_COLUMNS = {
+    "call_duration_secs": "duration_sketch",
+    "message_count": "message_sketch",
+    "cost": "cost_sketch",
+}
+
+# Hour-of-week heatmap: 7 rows (Monday first) of 24 UTC hours
+WEEKDAYS = 7
+
+
+def rebuild_month(db: Session, agent_id: str, month: str) -> int:
+    """Recompute and commit the agent's day and hour rollups for ``month``; returns the number of days."""
+    return _rebuild(db, agent_id, month)
+
+
+def refresh_rollups(db: Session, agent_id: str, hours_by_month: dict[str, set[int]]):
+    """Recompute the rollups of the UTC hours (unix hour numbers) a sync wrote, per month partition."""
+    for month, touched in sorted(hours_by_month.items()):
+        if month != "unknown" and touched:
+            _rebuild(db, agent_id, month, touched)
+
+
+def _rebuild(db: Session, agent_id: str, month: str, touched: Optional[set[int]] = None) -> int:
+    """Rebuild the month's rollups, or only those of the ``touched`` hours and their days.
+
+    A day sketch needs all of the day's rows, so whole days are read, but
+    only the touched hours' buckets are aggregated and rewritten.
+    """
+    days = None if touched is None else {hour // 24 for hour in touched}
+    hours = {}  # hour number -> rows of KPI_COLUMNS
+    start_index = KPI_COLUMNS.index("start_time_unix")
+    with month_source(db, agent_id, month) as sessions:
+        for source in sessions:
+            query = (
+                select(*(getattr(Conversation, c) for c in KPI_COLUMNS))
+                .where(Conversation.agent_id == agent_id, Conversation.month_partition == month)
+            )
+            if days is not None:
+                query = query.where(
+                    Conversation.start_time_unix >= min(days) * 86400,
+                    Conversation.start_time_unix < (max(days) + 1) * 86400,
+                )
+            for row in source.execute(query):
+                start = row[start_index]
+                if start and (days is None or start // 86400 in days):
+                    rows = hours.get(start // 3600)
+                    if rows is None:
+                        rows = hours[start // 3600] = []
+                    rows.append(row)
+
+    conversations = Counter()  # day number -> conversations
+    values = {c: {} for c in SKETCH_COLUMNS}  # column -> day number -> Counter of values
+    hour_rollups = []
+    for hour, rows in sorted(hours.items()):
+        batch = dict(zip(KPI_COLUMNS, zip(*rows)))
+        if touched is None or hour in touched:
+            hour_rollups.append(_hour_rollup(agent_id, month, hour * 3600, aggregate_batch(batch)))
+        day = hour // 24
+        conversations[day] += len(rows)
+        for column in SKETCH_COLUMNS:
+            per_day = values[column].get(day)
+            if per_day is None:
+                per_day = values[column][day] = Counter()
+            per_day.update(v for v in batch[column] if v)
+
+    rollups = []
+    for day, count in sorted(conversations.items()):
+        rollup = AgentDayRollup(
+            agent_id=agent_id,
+            day=_day_label(day),
+            month_partition=month,
+            conversations=count,
+        )
+        for column, sketch_column in SKETCH_COLUMNS.items():
+            sketch = QuantileSketch()
+            for value, n in values[column].get(day, {}).items():
+                sketch.add(value, n)
+            setattr(rollup, sketch_column, sketch.to_json())
+        rollups.append(rollup)
+
+    stale_days = db.query(AgentDayRollup).filter(
+        AgentDayRollup.agent_id == agent_id, AgentDayRollup.month_partition == month,
+    )
+    stale_hours = db.query(AgentHourRollup).filter(
+        AgentHourRollup.agent_id == agent_id, AgentHourRollup.month_partition == month,
+    )
+    if days is not None:
+        stale_days = stale_days.filter(AgentDayRollup.day.in_(_day_label(day) for day in days))
+        stale_hours = stale_hours.filter(_hour_ranges(touched))
+    stale_days.delete(synchronize_session=False)
+    stale_hours.delete(synchronize_session=False)
+    db.add_all(rollups)
+    db.add_all(hour_rollups)
+    db.commit()
+    return len(rollups)
+
+
+def _day_label(day: int) -> str:
+    return datetime.utcfromtimestamp(day * 86400).strftime("%Y-%m-%d")
+
+
+def _hour_ranges(hours: set[int]):
+    """SQL condition matching hour buckets of the given hour numbers, as runs of consecutive hours."""
+    runs = []
+    for hour in sorted(hours):
+        if runs and runs[-1][1] == hour:
+            runs[-1][1] = hour + 1
+        else:
+            runs.append([hour, hour + 1])
+    return or_(*(
+        and_(AgentHourRollup.hour_start >= first * 3600, AgentHourRollup.hour_start < end * 3600)
+        for first, end in runs
+    ))
+
+
+def _hour_rollup(agent_id: str, month: str, hour_start: int, partial: dict) -> AgentHourRollup:
+    outcomes, directions, statuses = partial["outcomes"], partial["directions"], partial["statuses"]
+    dur_count, dur_sum, dur_min, dur_max, short_calls, long_calls = partial["duration"]
+    return AgentHourRollup(
+        agent_id=agent_id,
+        hour_start=hour_start,
+        month_partition=month,
+        conversations=partial["total"],
+        success=outcomes.get("success", 0),
+        failure=outcomes.get("failure", 0),
+        unknown=outcomes.get("unknown", 0),
+        inbound=directions.get("inbound", 0),
+        outbound=directions.get("outbound", 0),
+        done=statuses.get("done", 0),
+        failed=statuses.get("failed", 0),
+        transfers=partial["transfers"],
+        dropouts=partial["dropouts"],
+        duration_count=dur_count,
+        duration_sum=dur_sum,
+        duration_min=dur_min,
+        duration_max=dur_max,
+        short_calls=short_calls,
+        long_calls=long_calls,
+        message_count=partial["messages"][0],
+        message_sum=partial["messages"][1],
+        cost_count=partial["costs"][0],
+        cost_sum=partial["costs"][1],
+        rating_count=partial["ratings"][0],
+        rating_sum=partial["ratings"][1],
+        criteria=json.dumps(partial["criteria"], separators=(",", ":")) if partial["criteria"] else None,
+    )
+
+
+def _hour_partial(row) -> dict:
+    """The kpis partial of one agent_hour_rollups row (day trends use positive durations and costs)."""
+    day = datetime.utcfromtimestamp(row.hour_start).strftime("%Y-%m-%d")
+    return {
+        "total": row.conversations,
+        "outcomes": {"success": row.success, "failure": row.failure, "unknown": row.unknown},
+        "directions": {"inbound": row.inbound, "outbound": row.outbound},
+        "statuses": {"done": row.done, "failed": row.failed},
+        "duration": [row.duration_count, row.duration_sum, row.duration_min, row.duration_max,
+                     row.short_calls, row.long_calls],
+        "messages": [row.message_count, row.message_sum],
+        "costs": [row.cost_count, row.cost_sum],
+        "ratings": [row.rating_count, row.rating_sum],
+        "transfers": row.transfers,
+        "dropouts": row.dropouts,
+        "criteria": json.loads(row.criteria) if row.criteria else {},
+        "days": {day: [row.conversations, row.success, row.failure,
+                       row.duration_sum, row.duration_count, row.cost_sum]},
+    }
+
+
+def backfill_rollups(db: Session) -> int:
+    """Build rollups for agent-months that have conversations but no day or hour rollups yet."""
+    have = {tuple(r) for r in db.query(AgentDayRollup.agent_id, AgentDayRollup.month_partition).distinct()}
+    have &= {tuple(r) for r in db.query(AgentHourRollup.agent_id, AgentHourRollup.month_partition).distinct()}
+    wanted = set()
+    with conversation_sessions(db) as sessions:
+        for source in sessions:
+            wanted.update(tuple(r) for r in source.query(Conversation.agent_id, Conversation.month_partition).distinct())
+    wanted.update(
+        tuple(r) for r in
+        db.query(ArchiveLog.agent_id, ArchiveLog.month_partition).filter(ArchiveLog.db_path != None).distinct()
+    )
+    missing = sorted(m for m in wanted - have if m[1] != "unknown")
+    for agent_id, month in missing:
+        rebuild_month(db, agent_id, month)
+    return len(missing)
+
+
+def _summary(merged: dict) -> dict:
+    return {
+        column: {f"p{p}": round(sketch.quantile(p / 100), 1) if sketch.count else 0 for p in PERCENTILES}
+        for column, sketch in merged.items()
+    }
+
+
+def _new_sketches() -> dict:
+    return {c: QuantileSketch() for c in SKETCH_COLUMNS}
+
+
+def percentiles(db: Session, agent_id: str, month: Optional[str] = None,
+                days: Optional[tuple[str, str]] = None, months: Optional[set[str]] = None) -> dict:
+    """p50/p90/p95/p99 of positive durations, message counts and costs, merged from day sketches."""
+    return percentiles_by_agent(
+        db, [agent_id], month, days, None if months is None else {agent_id: months},
+    )[0][agent_id]
+
+
+def percentiles_by_agent(db: Session, agent_ids: list[str], month: Optional[str] = None,
+                         days: Optional[tuple[str, str]] = None,
+                         months: Optional[dict[str, set[str]]] = None) -> tuple[dict, dict]:
+    """Percentiles per agent and over all of them together, from one query.
+
+    ``days`` limits the sketches to an inclusive ("YYYY-MM-DD", "YYYY-MM-DD") range.
+    ``months`` limits each agent to the given month partitions: rollups
+    outlive eviction, so all-time KPIs over the hot data pass the months
+    they actually read (see ``partial_months``).
+    """
+    query = db.query(
+        AgentDayRollup.agent_id, AgentDayRollup.month_partition,
+        *(getattr(AgentDayRollup, c) for c in SKETCH_COLUMNS.values()),
+    ).filter(AgentDayRollup.agent_id.in_(agent_ids))
+    if month:
+        query = query.filter(AgentDayRollup.month_partition == month)
+    if days:
+        query = query.filter(AgentDayRollup.day >= days[0], AgentDayRollup.day <= days[1])
+    per_agent = {agent_id: _new_sketches() for agent_id in agent_ids}
+    combined = _new_sketches()
+    for agent_id, row_month, *sketches in query:
+        if months is not None and row_month not in months.get(agent_id, ()):
+            continue
+        for column, data in zip(SKETCH_COLUMNS, sketches):
+            sketch = QuantileSketch.from_json(data)
+            per_agent[agent_id][column].merge(sketch)
+            combined[column].merge(sketch)
+    return {agent_id: _summary(merged) for agent_id, merged in per_agent.items()}, _summary(combined)
+
+
+def partial_months(partial: Optional[dict]) -> set[str]:
+    """Month partitions of the days a kpis partial counted."""
+    return {day[:7] for day in partial["days"]} if partial else set()
+
+
+def _hour_label(hour_start: int) -> str:
+    return datetime.utcfromtimestamp(hour_start).strftime("%Y-%m-%dT%H:00")
+
+
+def range_kpis(db: Session, agent_id: str, start: int, end: int, granularity: str = "day") -> dict:
+    """KPIs of the conversations started in [start, end) (unix seconds), summed from hour buckets.
+
+    Both bounds are rounded down to whole UTC hours.  Percentiles come from
+    the day sketches of the days the range touches, so a range that starts
+    or ends mid-day includes the whole of those days there.  Besides the
+    /api/kpis fields the result has the range, an ``hour_of_week`` heatmap
+    and, for ``granularity="hour"``, ``hourly_trends``.
+    """
+    start, end = start // 3600 * 3600, end // 3600 * 3600
+    table = AgentHourRollup.__table__
+    query = (
+        select(table)
+        .where(table.c.agent_id == agent_id, table.c.hour_start >= start, table.c.hour_start < end)
+        .order_by(table.c.hour_start)
+    )
+    partial = None
+    hourly = []
+    heatmap = {"total": [[0] * 24 for _ in range(WEEKDAYS)], "transfers": [[0] * 24 for _ in range(WEEKDAYS)]}
+    for row in db.execute(query):
+        partial = merge_partials(partial, _hour_partial(row))
+        moment = datetime.utcfromtimestamp(row.hour_start)
+        heatmap["total"][moment.weekday()][moment.hour] += row.conversations
+        heatmap["transfers"][moment.weekday()][moment.hour] += row.transfers
+        if granularity == "hour":
+            hourly.append({
+                "hour": _hour_label(row.hour_start),
+                "total": row.conversations,
+                "success": row.success,
+                "failed": row.failure,
+                "avg_duration": round(row.duration_sum / row.duration_count, 1) if row.duration_count else 0,
+                "cost": row.cost_sum,
+            })
+
+    days = (datetime.utcfromtimestamp(start).strftime("%Y-%m-%d"),
+            datetime.utcfromtimestamp(max(start, end - 1)).strftime("%Y-%m-%d"))
+    result = finalize_kpis(agent_id, None, partial, percentiles(db, agent_id, days=days))
+    result["month"] = None
+    result["start"] = _hour_label(start)
+    result["end"] = _hour_label(end)
+    result["granularity"] = granularity
+    if granularity == "hour":
+        result["hourly_trends"] = hourly
+    result["hour_of_week"] = heatmap
+    return result
@@ -0,0 +1,339 @@
+"""Full-text search over conversation titles, summaries and transcripts.
+
+On SQLite the index is an FTS5 virtual table living next to the
+``conversations`` table (in the main database or in each month shard) and
+kept up to date by ``_update_conversation_details``.  FTS5 cannot look up
+its UNINDEXED columns, so a small table maps conversation ids to FTS
+rowids and entries are replaced by rowid.  Other backends, or SQLite
+builds without FTS5, fall back to a plain substring scan.
+"""
+
+import html
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, text, or_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database import Conversation
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "conversations_fts"
+FTS_IDS_TABLE = "conversations_fts_ids"
+
+# Markers that cannot appear in stored text; replaced by <mark> after escaping.
+_HL_START = "\x02"
+_HL_END = "\x03"
+
+_CREATE_FTS = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    conversation_id UNINDEXED,
+    agent_id,
+    month_partition,
+    start_time_unix UNINDEXED,
+    call_summary_title,
+    transcript_summary,
+    transcript_text,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+
+_CREATE_FTS_IDS = f"""
+CREATE TABLE {FTS_IDS_TABLE} (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL UNIQUE
+)
+"""
+
+
+def ensure_search_index(bind) -> bool:
+    """Create the FTS5 table if the backend supports it. Returns availability."""
+    if bind.dialect.name != "sqlite":
+        return False
+    try:
+        with bind.begin() as conn:
+            conn.execute(text(_CREATE_FTS))
+            has_ids = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_IDS_TABLE},
+            ).first()
+            if not has_ids:
+                # Indexes built before the id map: adopt their rowids, drop duplicates
+                conn.execute(text(_CREATE_FTS_IDS))
+                conn.execute(text(
+                    f"INSERT OR IGNORE INTO {FTS_IDS_TABLE} (id, conversation_id) "
+                    f"SELECT rowid, conversation_id FROM {FTS_TABLE}"
+                ))
+                conn.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid NOT IN (SELECT id FROM {FTS_IDS_TABLE})"))
+        return True
+    except OperationalError as e:
+        logger.warning(f"FTS5 not available, search falls back to LIKE: {e}")
+        return False
+
+
+def _has_fts(db: Session) -> bool:
+    """Whether the session's database has the FTS table (cached per session)."""
+    if "has_fts" not in db.info:
+        if db.get_bind().dialect.name != "sqlite":
+            db.info["has_fts"] = False
+        else:
+            # Probe instead of reading sqlite_master: in shard sessions the
+            # table lives in an attached schema.
+            try:
+                db.execute(text(f"SELECT 1 FROM {FTS_TABLE} LIMIT 0"))
+                db.info["has_fts"] = True
+            except OperationalError:
+                db.info["has_fts"] = False
+    return db.info["has_fts"]
+
+
+def transcript_text(transcript_json: Optional[str]) -> str:
+    """Flatten the stored transcript JSON into searchable text."""
+    if not transcript_json:
+        return ""
+    try:
+        turns = json.loads(transcript_json)
+    except (json.JSONDecodeError, TypeError):
+        return ""
+    if not isinstance(turns, list):
+        return ""
+    return "\n".join(
+        t["message"] for t in turns
+        if isinstance(t, dict) and isinstance(t.get("message"), str) and t["message"]
+    )
+
+
+_INSERT_ENTRY = text(
+    f"INSERT INTO {FTS_TABLE} (rowid, conversation_id, agent_id, month_partition, start_time_unix, "
+    "call_summary_title, transcript_summary, transcript_text) "
+    "VALUES (:rowid, :cid, :agent_id, :month, :start, :title, :summary, :transcript)"
+)
+
+
+def _entry(conv: Conversation, rowid: int) -> dict:
+    return {
+        "rowid": rowid,
+        "cid": conv.conversation_id,
+        "agent_id": conv.agent_id,
+        "month": conv.month_partition,
+        "start": conv.start_time_unix,
+        "title": conv.call_summary_title or "",
+        "summary": conv.transcript_summary or "",
+        "transcript": transcript_text(conv.transcript),
+    }
+
+
+def index_conversation(db: Session, conv: Conversation):
+    """Insert or replace the index entry for one conversation.
+
+    A conversation new to the id map has no entry yet, so only entries
+    being replaced pay for a delete (by rowid).
+    """
+    if not _has_fts(db):
+        return
+    cid = conv.conversation_id
+    mapped = db.execute(text(f"INSERT OR IGNORE INTO {FTS_IDS_TABLE} (conversation_id) VALUES (:cid)"), {"cid": cid})
+    if mapped.rowcount:
+        rowid = mapped.lastrowid
+    else:
+        rowid = db.execute(text(f"SELECT id FROM {FTS_IDS_TABLE} WHERE conversation_id = :cid"), {"cid": cid}).scalar()
+        db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": rowid})
+    db.execute(_INSERT_ENTRY, _entry(conv, rowid))
+
+
+def backfill_search_index(db: Session, batch_size: int = 1000) -> int:
+    """Index conversations with details that are not in the index yet.
+
+    They have no entries to replace, so each batch is inserted with two
+    executemany statements and no deletes.
+    """
+    if not _has_fts(db):
+        return 0
+    indexed = {r[0] for r in db.execute(text(f"SELECT conversation_id FROM {FTS_IDS_TABLE}"))}
+    missing = [
+        r[0] for r in db.query(Conversation.conversation_id)
+        .filter(Conversation.details_fetched == True)
+        .all()
+        if r[0] not in indexed
+    ]
+    lookup = text(f"SELECT conversation_id, id FROM {FTS_IDS_TABLE} WHERE conversation_id IN :cids").bindparams(
+        bindparam("cids", expanding=True),
+    )
+    for i in range(0, len(missing), batch_size):
+        cids = missing[i:i + batch_size]
+        batch = db.query(Conversation).filter(Conversation.conversation_id.in_(cids)).all()
+        db.execute(text(f"INSERT INTO {FTS_IDS_TABLE} (conversation_id) VALUES (:cid)"), [{"cid": c} for c in cids])
+        rowids = dict(db.execute(lookup, {"cids": cids}).all())
+        db.execute(_INSERT_ENTRY, [_entry(conv, rowids[conv.conversation_id]) for conv in batch])
+        db.commit()
+    return len(missing)
+
+
+def remove_from_index(db: Session, agent_id: str, month_partition: str):
+    if not _has_fts(db):
+        return
+    params = {"agent_id": agent_id, "month": month_partition}
+    db.execute(
+        text(
+            f"DELETE FROM {FTS_IDS_TABLE} WHERE id IN "
+            f"(SELECT rowid FROM {FTS_TABLE} WHERE agent_id = :agent_id AND month_partition = :month)"
+        ),
+        params,
+    )
+    db.execute(
+        text(f"DELETE FROM {FTS_TABLE} WHERE agent_id = :agent_id AND month_partition = :month"),
+        params,
+    )
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def to_match_query(q: str, agent_id: Optional[str] = None, month: Optional[str] = None) -> str:
+    """Turn free text into a safe FTS5 query: every word quoted, AND-ed.
+
+    A trailing ``*`` keeps prefix search (``fakt*``).  Agent and month
+    filters are column filters inside the MATCH, so FTS intersects doclists
+    instead of ranking every hit and discarding most of them afterwards.
+    """
+    terms = []
+    for word in q.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if word:
+            terms.append(_quote(word) + ("*" if prefix else ""))
+    if not terms:
+        return ""
+
+    match = "{call_summary_title transcript_summary transcript_text} : (" + " ".join(terms) + ")"
+    if month:
+        match = f"month_partition : ^{_quote(month)} AND " + match
+    if agent_id:
+        match = f"agent_id : ^{_quote(agent_id)} AND " + match
+    return match
+
+
+def _render_highlight(value: Optional[str]) -> str:
+    return (
+        html.escape(value or "")
+        .replace(_HL_START, "<mark>")
+        .replace(_HL_END, "</mark>")
+    )
+
+
+def _best_snippet(summary: Optional[str], transcript: Optional[str]) -> str:
+    """Prefer the summary snippet unless only the transcript has a hit."""
+    if _HL_START not in (summary or "") and _HL_START in (transcript or ""):
+        return transcript
+    return summary or ""
+
+
+def search_conversations(
+    db: Session,
+    q: str,
+    agent_id: Optional[str] = None,
+    month: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> tuple[int, list[dict]]:
+    """Ranked (bm25) search in one session. Returns (total, hits)."""
+    if not _has_fts(db):
+        return _search_like(db, q, agent_id, month, limit, offset)
+
+    match = to_match_query(q, agent_id, month)
+    if not match:
+        return 0, []
+
+    where = f"{FTS_TABLE} MATCH :match"
+    params = {"match": match, "limit": limit, "offset": offset}
+    # Exact re-check of the token-level column filters
+    if agent_id:
+        where += " AND agent_id = :agent_id"
+        params["agent_id"] = agent_id
+    if month:
+        where += " AND month_partition = :month"
+        params["month"] = month
+
+    total = db.execute(text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {where}"), params).scalar()
+    rows = db.execute(
+        text(
+            f"SELECT conversation_id, agent_id, month_partition, start_time_unix, "
+            f"highlight({FTS_TABLE}, 4, :hs, :he) AS title, "
+            f"snippet({FTS_TABLE}, 5, :hs, :he, '…', 16) AS summary_snippet, "
+            f"snippet({FTS_TABLE}, 6, :hs, :he, '…', 16) AS transcript_snippet, "
+            f"bm25({FTS_TABLE}, 0, 0, 0, 0, 5.0, 2.0, 1.0) AS score "
+            f"FROM {FTS_TABLE} WHERE {where} ORDER BY score LIMIT :limit OFFSET :offset"
+        ),
+        {**params, "hs": _HL_START, "he": _HL_END},
+    ).all()
+
+    return total, [
+        {
+            "conversation_id": r.conversation_id,
+            "agent_id": r.agent_id,
+            "month": r.month_partition,
+            "start_time": datetime.utcfromtimestamp(int(r.start_time_unix)).isoformat() if r.start_time_unix else None,
+            "title": _render_highlight(r.title),
+            "snippet": _render_highlight(_best_snippet(r.summary_snippet, r.transcript_snippet)),
+            "score": round(-r.score, 4),
+        }
+        for r in rows
+    ]
+
+
+def _search_like(db: Session, q: str, agent_id, month, limit: int, offset: int) -> tuple[int, list[dict]]:
+    """Unranked substring search for backends without FTS5."""
+    query = db.query(Conversation)
+    for word in q.replace("*", "").split():
+        pattern = f"%{word}%"
+        query = query.filter(or_(
+            Conversation.call_summary_title.ilike(pattern),
+            Conversation.transcript_summary.ilike(pattern),
+            Conversation.transcript.ilike(pattern),
+        ))
+    if agent_id:
+        query = query.filter(Conversation.agent_id == agent_id)
+    if month:
+        query = query.filter(Conversation.month_partition == month)
+
+    total = query.count()
+    rows = query.order_by(Conversation.start_time_unix.desc()).offset(offset).limit(limit).all()
+    return total, [
+        {
+            "conversation_id": c.conversation_id,
+            "agent_id": c.agent_id,
+            "month": c.month_partition,
+            "start_time": datetime.utcfromtimestamp(c.start_time_unix).isoformat() if c.start_time_unix else None,
+            "title": html.escape(c.call_summary_title or ""),
+            "snippet": html.escape((c.transcript_summary or "")[:200]),
+            "score": None,
+        }
+        for c in rows
+    ]
+
+
+def search_sessions(
+    sessions: list,
+    q: str,
+    agent_id: Optional[str] = None,
+    month: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> tuple[int, list[dict]]:
+    """Search several sessions (month shards) and merge hits by score."""
+    if len(sessions) == 1:
+        return search_conversations(sessions[0], q, agent_id, month, limit, offset)
+
+    total = 0
+    hits = []
+    for s in sessions:
+        shard_total, shard_hits = search_conversations(s, q, agent_id, month, offset + limit, 0)
+        total += shard_total
+        hits.extend(shard_hits)
+    hits.sort(key=lambda h: (h["score"] is not None, h["score"] or 0, h["start_time"] or ""), reverse=True)
+    return total, hits[offset:offset + limit]
@@ -0,0 +1,154 @@
+"""In-memory registry of app settings and configured agents.
+
+Loaded from the database and kept current by ``set_setting`` /
+``set_agents`` (write-through), so page renders, API calls and scheduled
+jobs read settings without a query.  Guarded by a lock because the
+scheduler and request handlers share it.  Each process holds its own copy
+and reloads it after ``SETTINGS_TTL`` seconds, so changes made by other
+workers show up within that time.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from database import AppSettings, Agent
+
+logger = logging.getLogger(__name__)
+
+# How long the loaded copy is trusted.  Writes made by this process are
+# seen immediately; other workers' writes within the TTL.
+SETTINGS_TTL = float(os.environ.get("SETTINGS_TTL", "5"))
+
+_lock = threading.RLock()
+_settings: Optional[dict[str, str]] = None
+_agents: Optional[list[dict]] = None
+_loaded_at = 0.0
+
+
+def load(db: Session):
+    """(Re)load settings and agents; migrates the legacy agents JSON to rows."""
+    global _settings, _agents, _loaded_at
+    with _lock:
+        _settings = {row.key: row.value for row in db.query(AppSettings).all()}
+        rows = db.query(Agent).order_by(Agent.position).all()
+        if not rows:
+            legacy = _legacy_agents(_settings)
+            if legacy:
+                _write_agents(db, legacy)
+                rows = db.query(Agent).order_by(Agent.position).all()
+                logger.info(f"Migrated {len(rows)} agents from settings JSON to the agents table")
+        _agents = [_agent_dict(a) for a in rows]
+        _loaded_at = time.monotonic()
+
+
+def _ensure_loaded(db: Session):
+    if _settings is None or _agents is None or time.monotonic() - _loaded_at >= SETTINGS_TTL:
+        load(db)
+
+
+def _legacy_agents(settings: dict) -> list[dict]:
+    """Agents from the old ``agents`` JSON setting or single ``agent_id`` key."""
+    raw = settings.get("agents")
+    if raw:
+        try:
+            agents = json.loads(raw)
+            if isinstance(agents, list) and agents:
+                return agents
+        except (json.JSONDecodeError, TypeError):
+            pass
+    old_id = settings.get("agent_id")
+    if old_id:
+        return [{"id": old_id, "name": old_id[:12]}]
+    return []
+
+
+def _agent_dict(a: Agent) -> dict:
+    return {
+        "id": a.id,
+        "name": a.name,
+        "last_synced_at": a.last_synced_at,
+        "last_sync_status": a.last_sync_status,
+        "watermark_unix": a.watermark_unix,
+    }
+
+
+def get_setting(db: Session, key: str) -> Optional[str]:
+    with _lock:
+        _ensure_loaded(db)
+        return _settings.get(key)
+
+
+def set_setting(db: Session, key: str, value: str):
+    with _lock:
+        row = db.get(AppSettings, key)
+        if row:
+            row.value = value
+        else:
+            db.add(AppSettings(key=key, value=value))
+        db.commit()
+        if _settings is not None:
+            _settings[key] = value
+
+
+def get_agents(db: Session) -> list[dict]:
+    """Return configured agents as [{"id": "...", "name": "..."}, ...]."""
+    with _lock:
+        _ensure_loaded(db)
+        return [{"id": a["id"], "name": a["name"]} for a in _agents]
+
+
+def agent_records(db: Session) -> list[dict]:
+    """Agents with their sync state (datetimes as ISO strings)."""
+    with _lock:
+        _ensure_loaded(db)
+        return [
+            {**a, "last_synced_at": a["last_synced_at"].isoformat() if a["last_synced_at"] else None}
+            for a in _agents
+        ]
+
+
+def _write_agents(db: Session, agents: list[dict]):
+    keep = [a["id"] for a in agents]
+    existing = {a.id: a for a in db.query(Agent).all()}
+    for agent_id, row in existing.items():
+        if agent_id not in keep:
+            db.delete(row)
+    for position, a in enumerate(agents):
+        row = existing.get(a["id"])
+        if row is None:
+            row = Agent(id=a["id"])
+            db.add(row)
+        row.name = a.get("name") or a["id"][:12]
+        row.position = position
+    db.commit()
+
+
+def set_agents(db: Session, agents: list[dict]):
+    """Replace the configured agents (order kept); sync state of kept agents stays."""
+    with _lock:
+        _write_agents(db, agents)
+        load(db)
+
+
+def record_sync(db: Session, agent_id: str, status: str, watermark_unix: Optional[int] = None):
+    """Store the outcome of a sync; the watermark only moves forward."""
+    with _lock:
+        row = db.get(Agent, agent_id)
+        if row is None:
+            return
+        row.last_synced_at = datetime.utcnow()
+        row.last_sync_status = status
+        if watermark_unix and (row.watermark_unix or 0) < watermark_unix:
+            row.watermark_unix = watermark_unix
+        db.commit()
+        if _agents is not None:
+            for a in _agents:
+                if a["id"] == agent_id:
+                    a.update(_agent_dict(row))
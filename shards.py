@@ -0,0 +1,255 @@
+"""Optional per-month SQLite shards for the conversations table.
+
+With ``VOICEBOT_SHARD_BY_MONTH=1`` every ``month_partition`` lives in its own
+SQLite file under ``shards/``.  A shard is ATTACHed on demand to a fresh
+in-memory connection and the ORM is pointed at it through
+``schema_translate_map``, so the usual ``Conversation`` queries run
+unchanged.  The current month is the write shard; closed months are
+attached read-only (and with ``immutable=1`` when
+``VOICEBOT_SHARD_IMMUTABLE=1``, which skips file locking entirely).
+"""
+
+import heapq
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from database import Conversation, ConversationRawDetail, IS_SQLITE, add_missing_columns
+from search_service import ensure_search_index
+
+logger = logging.getLogger(__name__)
+
+# Shards are SQLite files, so the mode is ignored on server databases.
+SHARD_BY_MONTH = os.environ.get("VOICEBOT_SHARD_BY_MONTH", "0") == "1" and IS_SQLITE
+SHARD_IMMUTABLE = os.environ.get("VOICEBOT_SHARD_IMMUTABLE", "0") == "1"
+SHARD_DIR = os.path.join(os.path.dirname(__file__), "shards")
+
+_SHARD_FILE_RE = re.compile(r"^conversations_(\d{4}-\d{2}|unknown)\.db$")
+_SCHEMA = "shard"
+
+# Tables that live in every shard (the FTS index is created separately)
+SHARD_TABLES = [Conversation.__table__, ConversationRawDetail.__table__]
+
+_create_lock = threading.Lock()
+
+# Every session gets its own in-memory main database with one shard attached.
+_attach_engine = create_engine(
+    "sqlite://",
+    creator=lambda: sqlite3.connect(":memory:", uri=True, check_same_thread=False),
+    poolclass=NullPool,
+)
+
+if SHARD_BY_MONTH:
+    os.makedirs(SHARD_DIR, exist_ok=True)
+
+
+def shard_path(month: str) -> str:
+    return os.path.join(SHARD_DIR, f"conversations_{month}.db")
+
+
+def current_month() -> str:
+    return datetime.utcnow().strftime("%Y-%m")
+
+
+def is_closed(month: str) -> bool:
+    """Closed months are those before the current one ("unknown" stays open)."""
+    return month != "unknown" and month < current_month()
+
+
+def shard_months() -> list[str]:
+    """Months that have a shard file, newest first."""
+    if not os.path.isdir(SHARD_DIR):
+        return []
+    months = []
+    for name in os.listdir(SHARD_DIR):
+        m = _SHARD_FILE_RE.match(name)
+        if m:
+            months.append(m.group(1))
+    return sorted(months, reverse=True)
+
+
+def months_between(start_unix: Optional[int], end_unix: Optional[int]) -> list[str]:
+    """Shard months overlapping [start_unix, end_unix] (open ends allowed)."""
+    low = datetime.utcfromtimestamp(start_unix).strftime("%Y-%m") if start_unix else None
+    high = datetime.utcfromtimestamp(end_unix).strftime("%Y-%m") if end_unix else None
+    return [
+        m for m in shard_months()
+        if m == "unknown" or ((low is None or m >= low) and (high is None or m <= high))
+    ]
+
+
+def ensure_shard(month: str) -> str:
+    """Create the shard file with the conversations schema if missing."""
+    path = shard_path(month)
+    if os.path.exists(path):
+        return path
+    with _create_lock:
+        if not os.path.exists(path):
+            os.makedirs(SHARD_DIR, exist_ok=True)
+            engine = create_engine(f"sqlite:///{path}")
+            try:
+                for table in SHARD_TABLES:
+                    table.create(bind=engine, checkfirst=True)
+                ensure_search_index(engine)
+            finally:
+                engine.dispose()
+            logger.info(f"Created shard {path}")
+    return path
+
+
+def migrate_shards():
+    """Bring every shard file up to the current conversations schema."""
+    for month in shard_months():
+        engine = create_engine(f"sqlite:///{shard_path(month)}")
+        try:
+            for table in SHARD_TABLES:
+                table.create(bind=engine, checkfirst=True)
+            add_missing_columns(engine, SHARD_TABLES)
+            ensure_search_index(engine)
+        finally:
+            engine.dispose()
+
+
+def _shard_uri(month: str, write: bool) -> str:
+    uri = Path(shard_path(month)).absolute().as_uri()
+    if write:
+        return uri + "?mode=rw"
+    if is_closed(month):
+        return uri + ("?mode=ro&immutable=1" if SHARD_IMMUTABLE else "?mode=ro")
+    # The open month is still being written by syncs; read it normally.
+    return uri + "?mode=ro"
+
+
+@contextmanager
+def shard_session(month: str, write: bool = False):
+    """ORM session over a single attached month shard."""
+    if write:
+        ensure_shard(month)
+    conn = _attach_engine.connect()
+    try:
+        conn.exec_driver_sql(f"ATTACH DATABASE ? AS {_SCHEMA}", (_shard_uri(month, write),))
+        conn.commit()
+        session = Session(
+            bind=conn.execution_options(schema_translate_map={None: _SCHEMA}),
+            autoflush=False,
+        )
+        try:
+            yield session
+        finally:
+            session.close()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def conversation_sessions(db: Session, month: Optional[str] = None, write: bool = False,
+                          months: Optional[list[str]] = None):
+    """Yield the sessions holding conversations for ``month`` (or all months).
+
+    Without sharding this is just ``[db]``.  In sharded mode it is one
+    session per existing shard in scope; ``months`` narrows the scope to an
+    explicit list (e.g. from :func:`months_between`).
+    """
+    if not SHARD_BY_MONTH:
+        yield [db]
+        return
+
+    if month:
+        scope = [month] if write or os.path.exists(shard_path(month)) else []
+    elif months is not None:
+        scope = months
+    else:
+        scope = shard_months()
+
+    with ExitStack() as stack:
+        yield [stack.enter_context(shard_session(m, write=write)) for m in scope]
+
+
+def write_session_for(db: Session, month: str):
+    """Context manager for the session that stores ``month`` rows."""
+    if not SHARD_BY_MONTH:
+        return _passthrough(db)
+    return shard_session(month, write=True)
+
+
+@contextmanager
+def _passthrough(db: Session):
+    yield db
+
+
+def paginate(sessions: list, build_query, sort_key, offset: int, limit: int, reverse: bool = False):
+    """Return (total, rows) for one page across several sessions.
+
+    ``build_query(session)`` must return an ordered query; ``sort_key`` and
+    ``reverse`` describe the same order in Python to merge per-session pages.
+    """
+    if len(sessions) == 1:
+        query = build_query(sessions[0])
+        return query.count(), query.offset(offset).limit(limit).all()
+
+    total = 0
+    pages = []
+    for s in sessions:
+        query = build_query(s)
+        total += query.count()
+        pages.append(query.limit(offset + limit).all())
+    merged = list(heapq.merge(*pages, key=sort_key, reverse=reverse))
+    return total, merged[offset:offset + limit]
+
+
+def migrate_hot_table(db: Session, batch_size: int = 5000) -> int:
+    """Move rows from the main conversations table into month shards."""
+    months = [r[0] for r in db.query(Conversation.month_partition).distinct().all()]
+    columns = Conversation.__table__.columns
+    moved = 0
+    for month in months:
+        query = db.query(Conversation).filter(Conversation.month_partition == month)
+        with shard_session(month, write=True) as shard:
+            existing = {r[0] for r in shard.query(Conversation.conversation_id).all()}
+            rows = [
+                {col.name: getattr(c, col.key) for col in columns}
+                for c in query.yield_per(batch_size)
+                if c.conversation_id not in existing
+            ]
+            for i in range(0, len(rows), batch_size):
+                shard.execute(Conversation.__table__.insert(), rows[i:i + batch_size])
+            _move_raw_details(db, shard, [r["conversation_id"] for r in rows], batch_size)
+            shard.commit()
+        query.delete(synchronize_session=False)
+        db.commit()
+        moved += len(rows)
+        logger.info(f"Moved {len(rows)} conversations for {month} into shard")
+    return moved
+
+
+def _move_raw_details(db: Session, shard: Session, conversation_ids: list[str], batch_size: int):
+    raw = ConversationRawDetail.__table__
+    for i in range(0, len(conversation_ids), batch_size):
+        ids = conversation_ids[i:i + batch_size]
+        rows = [dict(r._mapping) for r in db.execute(raw.select().where(raw.c.conversation_id.in_(ids)))]
+        if rows:
+            shard.execute(raw.insert(), rows)
+            db.execute(raw.delete().where(raw.c.conversation_id.in_(ids)))
+
+
+def drop_shard_if_empty(month: str) -> bool:
+    """Remove a shard file once it holds no conversations."""
+    path = shard_path(month)
+    if not os.path.exists(path):
+        return False
+    with shard_session(month) as s:
+        empty = s.query(Conversation.conversation_id).first() is None
+    if empty:
+        os.remove(path)
+        logger.info(f"Removed empty shard {path}")
+    return empty
@@ -0,0 +1,155 @@
+"""In-process sync progress registry streamed to the dashboard over SSE.
+
+It also keeps one sync per agent at a time.  Both are per process: with
+several workers only syncs started in the same worker are seen.
+"""
+
+import asyncio
+import json
+import time
+from typing import Optional
+
+# Detail progress is published at most this often; phase changes always go out.
+PUBLISH_INTERVAL = 0.5
+KEEPALIVE_SECS = 15
+
+_agents: dict[str, dict] = {}
+_subscribers: set[asyncio.Queue] = set()
+_run_id = 0
+_last_publish = 0.0
+
+ACTIVE_PHASES = ("queued", "listing", "details")
+
+
+class SyncInProgress(RuntimeError):
+    """The agent already has a sync queued or running."""
+
+
+def active(agent_id: str) -> bool:
+    state = _agents.get(agent_id)
+    return state is not None and state["phase"] in ACTIVE_PHASES
+
+
+def begin(agent_ids: list[str]) -> int:
+    """Mark agents as queued for a new sync run. Returns the run id.
+
+    Agents with a sync already queued or running keep their state; callers
+    skip them (see ``active``).
+    """
+    global _run_id
+    _run_id += 1
+    for agent_id in agent_ids:
+        if not active(agent_id):
+            _agents[agent_id] = _new_state(agent_id, "queued")
+    publish(force=True)
+    return _run_id
+
+
+def _new_state(agent_id: str, phase: str) -> dict:
+    return {
+        "agent_id": agent_id,
+        "run_id": _run_id,
+        "phase": phase,  # queued, listing, details, completed, failed
+        "sync_type": None,
+        "pages": 0,
+        "listed": 0,
+        "details_done": 0,
+        "details_total": 0,
+        "throughput": None,  # details per second
+        "eta_secs": None,
+        "error": None,
+        "started_at": None,
+        "details_started_at": None,
+        "finished_at": None,
+    }
+
+
+def start(agent_id: str, sync_type: str):
+    """Move the agent to listing; raises SyncInProgress if its sync is already running."""
+    state = _agents.get(agent_id)
+    if state is not None and state["phase"] in ("listing", "details"):
+        raise SyncInProgress(f"Sync already running for agent {agent_id}")
+    if state is None or state["phase"] != "queued":
+        # Scheduled syncs (or direct calls) were not announced by begin()
+        state = _agents[agent_id] = _new_state(agent_id, "queued")
+    state.update(phase="listing", sync_type=sync_type, started_at=time.time())
+    publish(force=True)
+
+
+def page_fetched(agent_id: str, pages: int, listed: int):
+    state = _agents.get(agent_id)
+    if state:
+        state.update(pages=pages, listed=listed)
+        publish()
+
+
+def details_started(agent_id: str, total: int):
+    state = _agents.get(agent_id)
+    if state:
+        state.update(phase="details", details_total=total, details_started_at=time.time())
+        publish(force=True)
+
+
+def detail_fetched(agent_id: str):
+    state = _agents.get(agent_id)
+    if not state:
+        return
+    state["details_done"] += 1
+    started = state["details_started_at"]
+    elapsed = time.time() - started if started else 0
+    if elapsed > 0:
+        rate = state["details_done"] / elapsed
+        state["throughput"] = round(rate, 2)
+        state["eta_secs"] = round((state["details_total"] - state["details_done"]) / rate, 1)
+    publish()
+
+
+def finish(agent_id: str, error: Optional[str] = None):
+    state = _agents.get(agent_id)
+    if state:
+        state.update(
+            phase="failed" if error else "completed",
+            error=error,
+            eta_secs=0 if not error else None,
+            finished_at=time.time(),
+        )
+        publish(force=True)
+
+
+def snapshot() -> dict:
+    return {
+        "run_id": _run_id,
+        "running": any(s["phase"] in ("queued", "listing", "details") for s in _agents.values()),
+        "agents": list(_agents.values()),
+    }
+
+
+def publish(force: bool = False):
+    global _last_publish
+    now = time.monotonic()
+    if not force and now - _last_publish < PUBLISH_INTERVAL:
+        return
+    _last_publish = now
+    data = snapshot()
+    for queue in list(_subscribers):
+        if queue.full():
+            # Slow reader: only the newest state matters
+            queue.get_nowait()
+        queue.put_nowait(data)
+
+
+async def event_stream(request):
+    """SSE generator: current state first, then every published change."""
+    queue = asyncio.Queue(maxsize=1)
+    _subscribers.add(queue)
+    try:
+        yield f"data: {json.dumps(snapshot())}\n\n"
+        while not await request.is_disconnected():
+            try:
+                data = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {json.dumps(data)}\n\n"
+    finally:
+        _subscribers.discard(queue)
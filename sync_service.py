@@ -1,17 +1,37 @@
 """Service for syncing conversations from ElevenLabs API and computing KPIs."""
 
 import asyncio
+import copy
 import csv
 import json
 import logging
 import os
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy import update, select, cast, type_coerce, JSON, and_, case, func
+from sqlalchemy.orm import Session, object_session
 
-from database import SessionLocal, Conversation, SyncLog, ArchiveLog, AppSettings
+from archive_store import write_archive_db, archived_months, month_source, archive_session
+from data_version import bump as bump_data_version
+from database import (
+    SessionLocal, Conversation, SyncLog, ArchiveLog, upsert, reserve_change_seq, release_change_seqs,
+)
 from elevenlabs_client import ElevenLabsClient
+from analytics import aggregate_batch, distributions, load_columns
+from kpis import KPI_COLUMNS, merge_partials, finalize_kpis
+from metrics import (
+    DB_COMMIT_SECONDS, KPI_COMPUTE_SECONDS, SYNC_DETAIL_FAILURES, SYNC_DETAILS_FETCHED, SYNC_SECONDS, SYNCS_IN_FLIGHT,
+)
+from phone_extractor import PhoneScan, scan_detail, extract_phone_numbers
+from reextract import store_raw_detail
+from rollups import partial_months, percentiles, percentiles_by_agent, refresh_rollups
+from search_service import index_conversation
+from settings_registry import record_sync
+from shards import SHARD_BY_MONTH, conversation_sessions, write_session_for, months_between
+import sync_progress
 
 logger = logging.getLogger(__name__)
 
@@ -19,52 +39,6 @@ CSV_DIR = os.path.join(os.path.dirname(__file__), "csv_archives")
 os.makedirs(CSV_DIR, exist_ok=True)
 
 
-def get_setting(db: Session, key: str) -> Optional[str]:
-    row = db.query(AppSettings).filter(AppSettings.key == key).first()
-    return row.value if row else None
-
-
-def set_setting(db: Session, key: str, value: str):
-    row = db.query(AppSettings).filter(AppSettings.key == key).first()
-    if row:
-        row.value = value
-    else:
-        row = AppSettings(key=key, value=value)
-        db.add(row)
-    db.commit()
-
-
-def get_agents(db: Session) -> list[dict]:
-    """Return configured agents as [{"id": "...", "name": "..."}, ...].
-
-    Handles backward-compatible migration from the old single ``agent_id``
-    setting.  If the new ``agents`` key exists it is used; otherwise the
-    legacy ``agent_id`` value is wrapped in a single-element list.
-    """
-    raw = get_setting(db, "agents")
-    if raw:
-        try:
-            agents = json.loads(raw)
-            if isinstance(agents, list) and agents:
-                return agents
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    # Fallback: migrate old single agent_id to new format
-    old_id = get_setting(db, "agent_id")
-    if old_id:
-        return [{"id": old_id, "name": old_id[:12]}]
-    return []
-
-
-def set_agents(db: Session, agents: list[dict]):
-    """Persist agents list as JSON in AppSettings."""
-    set_setting(db, "agents", json.dumps(agents, ensure_ascii=False))
-    # Keep legacy key pointing to first agent for edge-case fallback
-    if agents:
-        set_setting(db, "agent_id", agents[0]["id"])
-
-
 async def sync_conversations(
     agent_id: str,
     api_key: str,
@@ -73,7 +47,23 @@ async def sync_conversations(
     sync_type: str = "manual",
     fetch_details: bool = True,
 ) -> dict:
-    """Fetch conversations from ElevenLabs and store in DB. Returns summary."""
+    """Fetch conversations from ElevenLabs and store in DB. Returns summary.
+
+    Raises sync_progress.SyncInProgress if the agent is already syncing.
+    """
+    sync_progress.start(agent_id, sync_type)
+    try:
+        return await _sync_conversations(agent_id, api_key, start_unix, end_unix, sync_type, fetch_details)
+    except BaseException as e:
+        # Failures before the sync log exists, or while recording the failure,
+        # must not leave the agent "running": every later sync would be refused.
+        if sync_progress.active(agent_id):
+            sync_progress.finish(agent_id, error=str(e) or type(e).__name__)
+        raise
+
+
+async def _sync_conversations(agent_id: str, api_key: str, start_unix: Optional[int], end_unix: Optional[int],
+                              sync_type: str, fetch_details: bool) -> dict:
     db = SessionLocal()
     log = SyncLog(
         agent_id=agent_id,
@@ -83,17 +73,26 @@ async def sync_conversations(
     )
     db.add(log)
     db.commit()
+    SYNCS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = "failed"
+    client = ElevenLabsClient(api_key)
+    stats = SyncStats()
+    # Month -> UTC hour numbers of the rows this sync wrote; their rollups are rebuilt at the end
+    touched = {}
 
     try:
-        client = ElevenLabsClient(api_key)
-        conversations = await client.fetch_all_conversations(
-            agent_id=agent_id,
-            start_after_unix=start_unix,
-            start_before_unix=end_unix,
-        )
+        with stats.phase("listing", client):
+            conversations = await client.fetch_all_conversations(
+                agent_id=agent_id,
+                start_after_unix=start_unix,
+                start_before_unix=end_unix,
+                on_page=lambda pages, total: sync_progress.page_fetched(agent_id, pages, total),
+            )
         log.conversations_fetched = len(conversations)
 
         stored = 0
+        by_month = {}
         for conv in conversations:
             cid = conv.get("conversation_id")
             if not cid:
@@ -101,86 +100,108 @@ async def sync_conversations(
 
             start_ts = conv.get("start_time_unix_secs", 0)
             month_partition = datetime.utcfromtimestamp(start_ts).strftime("%Y-%m") if start_ts else "unknown"
-
-            existing = db.query(Conversation).filter(Conversation.conversation_id == cid).first()
-            if existing:
-                # Update fields
-                existing.status = conv.get("status", existing.status)
-                existing.call_successful = conv.get("call_successful", existing.call_successful)
-                existing.call_duration_secs = conv.get("call_duration_secs", existing.call_duration_secs)
-                existing.message_count = conv.get("message_count", existing.message_count)
-                existing.transcript_summary = conv.get("transcript_summary", existing.transcript_summary)
-                existing.call_summary_title = conv.get("call_summary_title", existing.call_summary_title)
-                existing.main_language = conv.get("main_language", existing.main_language)
-                existing.direction = conv.get("direction", existing.direction)
-                existing.rating = conv.get("rating", existing.rating)
-                existing.tool_names = json.dumps(conv.get("tool_names", []))
-            else:
-                new_conv = Conversation(
-                    conversation_id=cid,
-                    agent_id=conv.get("agent_id", agent_id),
-                    agent_name=conv.get("agent_name"),
-                    status=conv.get("status", "unknown"),
-                    call_successful=conv.get("call_successful", "unknown"),
-                    start_time_unix=start_ts,
-                    call_duration_secs=conv.get("call_duration_secs", 0),
-                    message_count=conv.get("message_count", 0),
-                    transcript_summary=conv.get("transcript_summary"),
-                    call_summary_title=conv.get("call_summary_title"),
-                    main_language=conv.get("main_language"),
-                    direction=conv.get("direction"),
-                    rating=conv.get("rating"),
-                    tool_names=json.dumps(conv.get("tool_names", [])),
-                    conversation_initiation_source=conv.get("conversation_initiation_source"),
-                    month_partition=month_partition,
-                )
-                db.add(new_conv)
-                stored += 1
-
-        db.commit()
+            # Keyed by id: overlapping pages must not upsert the same row twice
+            by_month.setdefault(month_partition, {})[cid] = (start_ts, conv)
+        for month_partition, month_convs in by_month.items():
+            touched[month_partition] = {ts // 3600 for ts, _ in month_convs.values() if ts}
+
+        watermark = max((ts for items in by_month.values() for ts, _ in items.values() if ts), default=None)
+        for month_partition, month_convs in by_month.items():
+            with write_session_for(db, month_partition) as conv_db:
+                with stats.phase("write"):
+                    inserted, written = _store_listing(conv_db, agent_id, month_partition, month_convs, seq_db=db)
+                stats.commit(conv_db, "listing")
+                release_change_seqs(db)
+                stored += inserted
+                stats.rows_written += written
+        bump_data_version(db, agent_id)
 
         # Fetch details for conversations that don't have them yet
         details_count = 0
         if fetch_details:
-            convs_needing_details = (
-                db.query(Conversation)
-                .filter(
-                    Conversation.agent_id == agent_id,
-                    Conversation.details_fetched == False,
-                )
-            )
-            if start_unix:
-                convs_needing_details = convs_needing_details.filter(Conversation.start_time_unix >= start_unix)
-            if end_unix:
-                convs_needing_details = convs_needing_details.filter(Conversation.start_time_unix <= end_unix)
-
-            for conv_row in convs_needing_details.all():
-                try:
-                    detail = await client.get_conversation_detail(conv_row.conversation_id)
-
-                    # Log metadata structure for debugging (first 3 conversations)
-                    if details_count < 3:
-                        _log_metadata_debug(conv_row.conversation_id, detail)
-
-                    _update_conversation_details(conv_row, detail)
-
-                    # Extra logging: if still no phone after extraction, log warning
-                    if not conv_row.agent_phone and not conv_row.client_phone:
-                        if details_count < 10:  # log up to 10 missing
-                            logger.warning(f"[PHONE MISSING] {conv_row.conversation_id} - no phone found after extraction")
-                    details_count += 1
-                    if details_count % 10 == 0:
-                        db.commit()
-                    await asyncio.sleep(0.15)  # rate limit
-                except Exception as e:
-                    logger.warning(f"Failed to fetch detail for {conv_row.conversation_id}: {e}")
-
-            db.commit()
+            months = months_between(start_unix, end_unix) if SHARD_BY_MONTH else None
+            with conversation_sessions(db, write=True, months=months) as conv_sessions:
+                pending = []
+                for conv_db in conv_sessions:
+                    convs_needing_details = (
+                        conv_db.query(Conversation.conversation_id)
+                        .filter(
+                            Conversation.agent_id == agent_id,
+                            Conversation.details_fetched == False,
+                        )
+                    )
+                    if start_unix:
+                        convs_needing_details = convs_needing_details.filter(Conversation.start_time_unix >= start_unix)
+                    if end_unix:
+                        convs_needing_details = convs_needing_details.filter(Conversation.start_time_unix <= end_unix)
+                    pending.append((conv_db, [r[0] for r in convs_needing_details.all()]))
+
+                sync_progress.details_started(agent_id, sum(len(ids) for _, ids in pending))
+                for conv_db, ids in pending:
+                    for i in range(0, len(ids), DETAIL_COMMIT_EVERY):
+                        # Loaded per batch: rows loaded up front would be expired by
+                        # each commit and then refreshed with one SELECT per row.
+                        rows = (
+                            conv_db.query(Conversation)
+                            .filter(Conversation.conversation_id.in_(ids[i:i + DETAIL_COMMIT_EVERY]))
+                            .all()
+                        )
+                        fetched = []
+                        for conv_row in rows:
+                            try:
+                                with stats.phase("detail_fetch", client):
+                                    detail = await client.get_conversation_detail(conv_row.conversation_id)
+                                fetched.append((conv_row, detail))
+                                with stats.phase("throttle"):
+                                    await asyncio.sleep(DETAIL_FETCH_DELAY)  # rate limit
+                            except Exception as e:
+                                SYNC_DETAIL_FAILURES.inc(agent_id=agent_id)
+                                logger.warning(f"Failed to fetch detail for {conv_row.conversation_id}: {e}")
+                            sync_progress.detail_fetched(agent_id)
+
+                        # Write and commit without awaiting in between, so no write
+                        # lock is held while other syncs run on the event loop.
+                        if not fetched:
+                            continue
+                        with stats.phase("write"):
+                            seq = reserve_change_seq(db, conv_db, len(fetched))
+                            for offset, (conv_row, detail) in enumerate(fetched):
+                                # Log metadata structure for debugging (first 3 conversations)
+                                phone_scan = None
+                                if details_count < 3:
+                                    phone_scan = scan_detail(detail)
+                                    _log_metadata_debug(conv_row.conversation_id, detail, phone_scan)
+
+                                _update_conversation_details(conv_row, detail, seq + offset, phone_scan)
+
+                                # Extra logging: if still no phone after extraction, log warning
+                                if not conv_row.agent_phone and not conv_row.client_phone:
+                                    if details_count < 10:  # log up to 10 missing
+                                        logger.warning(f"[PHONE MISSING] {conv_row.conversation_id} - no phone found after extraction")
+                                details_count += 1
+                            # Before the commit expires the rows
+                            for conv_row, _ in fetched:
+                                if conv_row.start_time_unix:
+                                    touched.setdefault(conv_row.month_partition, set()).add(
+                                        conv_row.start_time_unix // 3600)
+                        stats.commit(conv_db, "details")
+                        release_change_seqs(db)
+                        # The conversation row and its raw detail
+                        stats.rows_written += 2 * len(fetched)
+                        SYNC_DETAILS_FETCHED.inc(len(fetched), agent_id=agent_id)
+
+        with stats.phase("write"):
+            await asyncio.to_thread(_refresh_rollups, agent_id, touched)
 
         log.details_fetched = details_count
+        stats.save(log, client)
         log.status = "completed"
         log.finished_at = datetime.utcnow()
         db.commit()
+        bump_data_version(db, agent_id)
+        record_sync(db, agent_id, "completed", watermark)
+        sync_progress.finish(agent_id)
+        status = "completed"
 
         return {
             "conversations_fetched": len(conversations),
@@ -190,17 +211,179 @@ async def sync_conversations(
         }
 
     except Exception as e:
+        stats.save(log, client)
         log.status = "failed"
         log.error_message = str(e)
         log.finished_at = datetime.utcnow()
         db.commit()
+        # Shard writes that failed before their commit never use their numbers
+        release_change_seqs(db)
+        try:
+            await asyncio.to_thread(_refresh_rollups, agent_id, touched)
+        except Exception as rollup_error:
+            logger.error(f"Rollup refresh after failed sync failed: {rollup_error}")
+        # Rows committed before the failure are visible too
+        bump_data_version(db, agent_id)
+        record_sync(db, agent_id, "failed")
+        sync_progress.finish(agent_id, error=str(e))
         logger.error(f"Sync failed: {e}")
         raise
+    finally:
+        SYNC_SECONDS.observe(time.perf_counter() - started, sync_type=sync_type, status=status)
+        SYNCS_IN_FLIGHT.dec()
+        db.close()
+
+
+def _refresh_rollups(agent_id: str, touched: dict[str, set[int]]):
+    """Rebuild the rollups of the synced hours on a session of its own (run in a worker thread)."""
+    db = SessionLocal()
+    try:
+        refresh_rollups(db, agent_id, touched)
     finally:
         db.close()
 
 
-def _log_metadata_debug(conversation_id: str, detail: dict):
+# Listing fields refreshed on every sync; a key missing from the API item
+# keeps the stored value.
+_LISTING_FIELDS = (
+    "status", "call_successful", "call_duration_secs", "message_count",
+    "transcript_summary", "call_summary_title", "main_language", "direction", "rating",
+)
+
+UPSERT_BATCH_SIZE = 500
+# Details are fetched in groups of this size and committed together
+DETAIL_COMMIT_EVERY = 10
+# Pause between detail requests (429s are also retried by the client)
+DETAIL_FETCH_DELAY = float(os.environ.get("ELEVENLABS_DETAIL_DELAY", "0.15"))
+
+
+class SyncStats:
+    """Per-phase wall time and rows written by one sync, saved to its SyncLog."""
+
+    PHASES = ("listing", "write", "detail_fetch", "throttle", "commit")
+
+    def __init__(self):
+        self.secs = dict.fromkeys(self.PHASES, 0.0)
+        self.rows_written = 0
+
+    @contextmanager
+    def phase(self, name: str, client: Optional[ElevenLabsClient] = None):
+        """Time a block; the ``client``'s backoff and page delays inside it count as throttling."""
+        started = time.perf_counter()
+        throttled = client.throttle_secs if client else 0.0
+        try:
+            yield
+        finally:
+            waited = client.throttle_secs - throttled if client else 0.0
+            self.secs[name] += time.perf_counter() - started - waited
+            self.secs["throttle"] += waited
+
+    def commit(self, db: Session, phase: str):
+        started = time.perf_counter()
+        db.commit()
+        elapsed = time.perf_counter() - started
+        self.secs["commit"] += elapsed
+        DB_COMMIT_SECONDS.observe(elapsed, phase=phase)
+
+    def save(self, log: SyncLog, client: ElevenLabsClient):
+        for name, secs in self.secs.items():
+            setattr(log, f"{name}_secs", round(secs, 3))
+        log.api_calls = client.requests
+        log.api_retries = client.retries
+        log.bytes_downloaded = client.bytes_downloaded
+        log.rows_written = self.rows_written
+
+
+def _store_listing(db: Session, agent_id: str, month_partition: str, items: dict,
+                   seq_db: Optional[Session] = None) -> int:
+    """Upsert listing items ({cid: (start_ts, conv)}) for one month.
+
+    Returns (new rows, rows written).
+
+    Only inserted rows and rows whose listing fields changed are written and
+    get a new ``change_seq`` (reserved on ``seq_db``, the main database).
+    """
+    seq_db = seq_db or db
+    stored = written = 0
+    batch_items = list(items.items())
+    compared = [getattr(Conversation, f) for f in _LISTING_FIELDS + ("tool_names",)]
+    for i in range(0, len(batch_items), UPSERT_BATCH_SIZE):
+        batch = batch_items[i:i + UPSERT_BATCH_SIZE]
+        existing = {
+            r[0]: r[1:] for r in db.query(Conversation.conversation_id, *compared)
+            .filter(Conversation.conversation_id.in_([cid for cid, _ in batch]))
+            .all()
+        }
+
+        updates = []
+        inserts = []
+        for cid, (start_ts, conv) in batch:
+            if cid in existing:
+                current = dict(zip(_LISTING_FIELDS + ("tool_names",), existing[cid]))
+                row = {f: conv[f] for f in _LISTING_FIELDS if f in conv}
+                row["tool_names"] = json.dumps(conv.get("tool_names", []))
+                if all(current[f] == v for f, v in row.items()):
+                    continue
+                row["conversation_id"] = cid
+                updates.append(row)
+            else:
+                inserts.append({
+                    "conversation_id": cid,
+                    "agent_id": conv.get("agent_id", agent_id),
+                    "agent_name": conv.get("agent_name"),
+                    "status": conv.get("status", "unknown"),
+                    "call_successful": conv.get("call_successful", "unknown"),
+                    "start_time_unix": start_ts,
+                    "call_duration_secs": conv.get("call_duration_secs", 0),
+                    "message_count": conv.get("message_count", 0),
+                    "transcript_summary": conv.get("transcript_summary"),
+                    "call_summary_title": conv.get("call_summary_title"),
+                    "main_language": conv.get("main_language"),
+                    "direction": conv.get("direction"),
+                    "rating": conv.get("rating"),
+                    "tool_names": json.dumps(conv.get("tool_names", [])),
+                    "conversation_initiation_source": conv.get("conversation_initiation_source"),
+                    "month_partition": month_partition,
+                })
+
+        if updates or inserts:
+            seq = reserve_change_seq(seq_db, db, len(updates) + len(inserts))
+            for offset, row in enumerate(updates + inserts):
+                row["change_seq"] = seq + offset
+        if updates:
+            db.execute(update(Conversation), updates)
+        # Upsert rather than insert: another worker may store the same
+        # conversation between the lookup above and this statement.
+        upsert(db, Conversation.__table__, inserts, "conversation_id",
+               list(_LISTING_FIELDS) + ["tool_names", "change_seq"])
+        stored += len(inserts)
+        written += len(updates) + len(inserts)
+    return stored, written
+
+
+def backfill_change_seq(db: Session, conv_db: Session, batch_size: int = 5000) -> int:
+    """Give rows written before change tracking a sequence number (oldest first)."""
+    ids = [
+        r[0] for r in conv_db.query(Conversation.conversation_id)
+        .filter(Conversation.change_seq == None)
+        .order_by(Conversation.start_time_unix)
+        .all()
+    ]
+    if not ids:
+        return 0
+    first = reserve_change_seq(db, conv_db, len(ids))
+    for i in range(0, len(ids), batch_size):
+        conv_db.execute(update(Conversation), [
+            {"conversation_id": cid, "change_seq": first + i + j}
+            for j, cid in enumerate(ids[i:i + batch_size])
+        ])
+    conv_db.commit()
+    db.commit()
+    release_change_seqs(db)
+    return len(ids)
+
+
+def _log_metadata_debug(conversation_id: str, detail: dict, scan: PhoneScan):
     """Log full metadata structure for debugging phone number extraction."""
     meta = detail.get("metadata", {})
     body = meta.get("body", {})
@@ -229,7 +412,7 @@ def _log_metadata_debug(conversation_id: str, detail: dict):
         logger.info(f"[DEBUG PHONE] conversation_initiation_client_data is EMPTY or missing")
 
     # Deep search for phone numbers
-    phone_values = _deep_find_phone_values(detail)
+    phone_values = scan.phone_values
     if phone_values:
         logger.info(f"[DEBUG PHONE] Deep search found {len(phone_values)} phone-like values:")
         for path, value in phone_values[:20]:
@@ -250,162 +433,8 @@ def _log_metadata_debug(conversation_id: str, detail: dict):
                 logger.info(f"[DEBUG PHONE] metadata.{k} = {str(v)[:200]}")
 
 
-def _deep_find_phone_values(obj, path=""):
-    """
-    Recursively search entire JSON for phone-number-like values.
-    Returns list of (path, value) tuples.
-    """
-    import re
-    phone_re = re.compile(r'^\+?\d[\d\s\-]{6,15}\d$')
-    results = []
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            new_path = f"{path}.{k}" if path else k
-            results.extend(_deep_find_phone_values(v, new_path))
-    elif isinstance(obj, list):
-        for i, v in enumerate(obj):
-            results.extend(_deep_find_phone_values(v, f"{path}[{i}]"))
-    elif isinstance(obj, str):
-        stripped = obj.strip()
-        if phone_re.match(stripped):
-            results.append((path, stripped))
-    return results
-
-
-def _extract_phone_numbers(detail: dict, meta: dict) -> tuple:
-    """
-    Extract (agent_phone, client_phone) from conversation detail.
-
-    Tries multiple locations depending on provider:
-      1. Twilio:        metadata.body.To / metadata.body.From
-      2. SIP Trunking:  metadata.body.to_number / metadata.body.from_number
-      3. phone_call:    metadata.phone_call.agent_number / external_number
-      4. conversation_initiation_client_data.dynamic_variables
-      5. Deep recursive search in entire metadata for phone-related keys
-      6. Deep recursive search for any phone-like value patterns
-    """
-    agent_phone = None
-    client_phone = None
-
-    # --- Source 1 & 2: metadata.body (Twilio / SIP) ---
-    body = meta.get("body", {})
-    if body and isinstance(body, dict):
-        # Twilio: "To" = voicebot, "From" = klient
-        if body.get("To"):
-            agent_phone = body["To"]
-        if body.get("From"):
-            client_phone = body["From"]
-
-        # SIP Trunking: "to_number" = voicebot, "from_number" = klient
-        if not agent_phone and body.get("to_number"):
-            agent_phone = body["to_number"]
-        if not client_phone and body.get("from_number"):
-            client_phone = body["from_number"]
-
-        # lowercase variants (just in case API returns them)
-        if not agent_phone and body.get("to"):
-            agent_phone = body["to"]
-        if not client_phone and body.get("from"):
-            client_phone = body["from"]
-
-        # Additional Twilio fields: Caller / Called
-        if not agent_phone and body.get("Called"):
-            agent_phone = body["Called"]
-        if not client_phone and body.get("Caller"):
-            client_phone = body["Caller"]
-
-    # --- Source 3: metadata.phone_call ---
-    phone_call = meta.get("phone_call", {})
-    if phone_call and isinstance(phone_call, dict):
-        if not agent_phone:
-            agent_phone = phone_call.get("agent_number") or phone_call.get("to_number") or phone_call.get("to")
-        if not client_phone:
-            client_phone = phone_call.get("external_number") or phone_call.get("from_number") or phone_call.get("from")
-        # Also try phone_number fields
-        if not agent_phone:
-            agent_phone = phone_call.get("agent_phone_number") or phone_call.get("called_number")
-        if not client_phone:
-            client_phone = phone_call.get("caller_phone_number") or phone_call.get("caller_number")
-
-    # --- Source 4: conversation_initiation_client_data ---
-    client_data = detail.get("conversation_initiation_client_data", {})
-    if client_data and isinstance(client_data, dict):
-        dyn = client_data.get("dynamic_variables", {})
-        if dyn and isinstance(dyn, dict):
-            if not agent_phone:
-                agent_phone = (dyn.get("agent_number") or dyn.get("to_number")
-                               or dyn.get("To") or dyn.get("agent_phone")
-                               or dyn.get("called_number") or dyn.get("Called"))
-            if not client_phone:
-                client_phone = (dyn.get("customer_number") or dyn.get("from_number")
-                                or dyn.get("From") or dyn.get("client_phone")
-                                or dyn.get("caller_number") or dyn.get("Caller")
-                                or dyn.get("phone") or dyn.get("phone_number")
-                                or dyn.get("customer_phone"))
-
-    # --- Source 5: Deep search in metadata for phone-related keys ---
-    if (not agent_phone or not client_phone) and isinstance(meta, dict):
-        deep_result = {}
-        _deep_search_in_dict(meta, "agent_phone", "client_phone",
-                             agent_phone, client_phone, deep_result)
-        if not agent_phone and deep_result.get("agent"):
-            agent_phone = deep_result["agent"]
-        if not client_phone and deep_result.get("client"):
-            client_phone = deep_result["client"]
-
-    # --- Source 6: Deep recursive search in full detail as last resort ---
-    if not agent_phone or not client_phone:
-        phone_values = _deep_find_phone_values(detail)
-        if phone_values:
-            # Classify found phone values by path context
-            for path, value in phone_values:
-                path_lower = path.lower()
-                if not agent_phone and any(kw in path_lower for kw in
-                    ("agent", "to_number", ".to", "called", "voicebot", "bot_number")):
-                    agent_phone = value
-                elif not client_phone and any(kw in path_lower for kw in
-                    ("client", "customer", "from_number", ".from", "caller", "external", "user_phone")):
-                    client_phone = value
-
-            # If still missing, assign first/second found phone generically
-            if not agent_phone and not client_phone and len(phone_values) >= 2:
-                agent_phone = phone_values[0][1]
-                client_phone = phone_values[1][1]
-            elif not agent_phone and not client_phone and len(phone_values) == 1:
-                # Only one phone found - log it and assign to client (more common)
-                client_phone = phone_values[0][1]
-
-    # Normalize: strip whitespace
-    if agent_phone:
-        agent_phone = str(agent_phone).strip()
-    if client_phone:
-        client_phone = str(client_phone).strip()
-
-    return agent_phone, client_phone
-
-
-def _deep_search_in_dict(d: dict, agent_key_hint: str, client_key_hint: str,
-                          existing_agent, existing_client, result: dict):
-    """Search dict recursively for keys containing phone/number related names."""
-    agent_keywords = {"agent_number", "to_number", "To", "Called", "agent_phone",
-                      "called_number", "bot_number", "destination_number", "dialed_number",
-                      "agent_phone_number", "to"}
-    client_keywords = {"from_number", "From", "Caller", "external_number", "customer_number",
-                       "caller_number", "client_phone", "source_number", "originating_number",
-                       "customer_phone", "phone_number", "phone", "from", "caller_phone_number"}
-
-    for k, v in d.items():
-        if isinstance(v, dict):
-            _deep_search_in_dict(v, agent_key_hint, client_key_hint,
-                                existing_agent, existing_client, result)
-        elif isinstance(v, str) and v.strip():
-            if not existing_agent and not result.get("agent") and k in agent_keywords:
-                result["agent"] = v.strip()
-            if not existing_client and not result.get("client") and k in client_keywords:
-                result["client"] = v.strip()
-
-
-def _update_conversation_details(conv: Conversation, detail: dict):
+def _update_conversation_details(conv: Conversation, detail: dict, change_seq: Optional[int] = None,
+                                 phone_scan: Optional[PhoneScan] = None):
     meta = detail.get("metadata", {})
     analysis = detail.get("analysis", {})
 
@@ -415,7 +444,8 @@ def _update_conversation_details(conv: Conversation, detail: dict):
     conv.user_id = detail.get("user_id")
 
     # Phone numbers - extract from multiple possible locations
-    conv.agent_phone, conv.client_phone = _extract_phone_numbers(detail, meta)
+    conv.agent_phone, conv.client_phone = extract_phone_numbers(
+        detail, phone_scan, conv.conversation_initiation_source)
     conv.call_successful = analysis.get("call_successful", conv.call_successful)
     conv.transcript_summary = analysis.get("transcript_summary", conv.transcript_summary)
 
@@ -439,202 +469,237 @@ def _update_conversation_details(conv: Conversation, detail: dict):
 
     conv.details_fetched = True
     conv.fetched_at = datetime.utcnow()
+    if change_seq is not None:
+        conv.change_seq = change_seq
 
+    # Keep the full-text index and the raw detail in step with the row (same transaction)
+    db = object_session(conv)
+    if db is not None:
+        index_conversation(db, conv)
+        store_raw_detail(db, conv, detail)
 
-def compute_kpis(db: Session, agent_id: str, month: Optional[str] = None) -> dict:
-    """Compute all KPIs for a given agent and optional month partition."""
-    query = db.query(Conversation).filter(Conversation.agent_id == agent_id)
-    if month:
-        query = query.filter(Conversation.month_partition == month)
 
-    conversations = query.all()
-    total = len(conversations)
+SORT_COLUMNS = {
+    "start_time": "start_time_unix",
+    "duration": "call_duration_secs",
+    "cost": "cost",
+}
 
-    if total == 0:
-        return _empty_kpis(agent_id, month)
 
-    # 1. Conversion rate (success)
-    successful = sum(1 for c in conversations if c.call_successful == "success")
-    failed = sum(1 for c in conversations if c.call_successful == "failure")
-    unknown = sum(1 for c in conversations if c.call_successful == "unknown")
+def filter_conversations(query, filters: dict):
+    """Apply the /api/conversations filters to a Conversation query.
 
-    # 2. Call attempts
-    outbound = sum(1 for c in conversations if c.direction == "outbound")
-    inbound = sum(1 for c in conversations if c.direction == "inbound")
-    done_calls = sum(1 for c in conversations if c.status == "done")
-    failed_calls = sum(1 for c in conversations if c.status == "failed")
+    ``filters`` keys: status, call_successful, direction, source,
+    min_duration, max_duration, min_cost, max_cost, criterion and
+    criterion_result.  ``None`` values are ignored.
+    """
+    f = {k: v for k, v in filters.items() if v is not None and v != ""}
+    if "status" in f:
+        query = query.filter(Conversation.status == f["status"])
+    if "call_successful" in f:
+        query = query.filter(Conversation.call_successful == f["call_successful"])
+    if "direction" in f:
+        query = query.filter(Conversation.direction == f["direction"])
+    if "source" in f:
+        query = query.filter(Conversation.conversation_initiation_source == f["source"])
+    if "min_duration" in f:
+        query = query.filter(Conversation.call_duration_secs >= f["min_duration"])
+    if "max_duration" in f:
+        query = query.filter(Conversation.call_duration_secs <= f["max_duration"])
+    if "min_cost" in f:
+        query = query.filter(Conversation.cost >= f["min_cost"])
+    if "max_cost" in f:
+        query = query.filter(Conversation.cost <= f["max_cost"])
+    if "criterion" in f:
+        # evaluation_criteria_results is JSON text: {criterion_id: {"result": ...}}
+        if query.session.get_bind().dialect.name == "postgresql":
+            criteria = cast(Conversation.evaluation_criteria_results, JSON)
+        else:
+            criteria = type_coerce(Conversation.evaluation_criteria_results, JSON)
+        result = criteria[(f["criterion"], "result")].as_string()
+        if "criterion_result" in f:
+            query = query.filter(result == f["criterion_result"])
+        else:
+            query = query.filter(result != None)
+    return query
+
+
+def order_conversations(query, sort: str = "start_time", order: str = "desc"):
+    """Order by a sort key with conversation_id as tie-breaker (stable pages)."""
+    column = getattr(Conversation, SORT_COLUMNS.get(sort, "start_time_unix"))
+    if order == "asc":
+        return query.order_by(column.asc(), Conversation.conversation_id.asc())
+    return query.order_by(column.desc(), Conversation.conversation_id.desc())
+
+
+def conversation_sort_key(sort: str = "start_time"):
+    """Python equivalent of ``order_conversations`` for merging shard pages.
+
+    Shards are SQLite, where NULL sorts before every value.
+    """
+    attr = SORT_COLUMNS.get(sort, "start_time_unix")
 
-    # 3. Evaluation criteria scoring
-    criteria_stats = _compute_criteria_stats(conversations)
+    def key(c):
+        value = getattr(c, attr)
+        return (value is not None, value or 0, c.conversation_id)
+    return key
 
-    # 4. Call duration
-    durations = [c.call_duration_secs for c in conversations if c.call_duration_secs and c.call_duration_secs > 0]
-    avg_duration = sum(durations) / len(durations) if durations else 0
-    min_duration = min(durations) if durations else 0
-    max_duration = max(durations) if durations else 0
-    short_calls = sum(1 for d in durations if d < 30)
-    long_calls = sum(1 for d in durations if d > 300)
 
-    # 5. Transfers (termination_reason hints)
-    transfers = sum(1 for c in conversations if c.termination_reason and "transfer" in c.termination_reason.lower())
+# Rows per columnar batch read for KPI aggregation
+KPI_BATCH_SIZE = 5000
 
-    # 6. Additional KPIs
-    dropouts = sum(1 for c in conversations if c.status in ("failed", "initiated") or
-                   (c.termination_reason and "hang" in c.termination_reason.lower()))
 
-    message_counts = [c.message_count for c in conversations if c.message_count and c.message_count > 0]
-    avg_messages = sum(message_counts) / len(message_counts) if message_counts else 0
+def iter_kpi_batches(db: Session, agent_id: str, month: Optional[str] = None, batch_size: int = KPI_BATCH_SIZE):
+    """Yield the agent's KPI columns as {column: tuple} batches of up to ``batch_size`` rows.
 
-    costs = [c.cost for c in conversations if c.cost and c.cost > 0]
-    total_cost = sum(costs)
-    avg_cost = total_cost / len(costs) if costs else 0
+    Reads from month shards or the month's archive when the rows are no
+    longer in the hot table.
+    """
+    columns = [getattr(Conversation, c) for c in KPI_COLUMNS]
+    with month_source(db, agent_id, month) as sessions:
+        for source in sessions:
+            query = select(*columns).where(Conversation.agent_id == agent_id)
+            if month:
+                query = query.where(Conversation.month_partition == month)
+            for rows in source.execute(query).partitions(batch_size):
+                yield dict(zip(KPI_COLUMNS, zip(*rows)))
 
-    technical_errors = sum(1 for c in conversations if c.status == "failed")
 
-    # Ratings
-    ratings = [c.rating for c in conversations if c.rating is not None]
-    avg_rating = sum(ratings) / len(ratings) if ratings else None
+@KPI_COMPUTE_SECONDS.time()
+def compute_kpis(db: Session, agent_id: str, month: Optional[str] = None) -> dict:
+    """Compute all KPIs for a given agent and optional month partition (in this thread).
 
-    # Trends by day
-    daily_trends = _compute_daily_trends(conversations)
+    kpi_pool.compute_kpis_pooled spreads large histories over worker processes.
+    """
+    partial = None
+    for batch in iter_kpi_batches(db, agent_id, month):
+        partial = merge_partials(partial, aggregate_batch(batch))
+    return finalize_kpis(agent_id, month, partial, kpi_percentiles(db, agent_id, month, partial))
 
-    return {
-        "agent_id": agent_id,
-        "month": month or "all",
-        "total_conversations": total,
-        # KPI 1
-        "conversion_rate": round(successful / total * 100, 2) if total else 0,
-        "successful_count": successful,
-        "failed_count": failed,
-        "unknown_count": unknown,
-        # KPI 2
-        "outbound_calls": outbound,
-        "inbound_calls": inbound,
-        "done_calls": done_calls,
-        "failed_calls": failed_calls,
-        "connection_rate": round(done_calls / total * 100, 2) if total else 0,
-        # KPI 3
-        "criteria_stats": criteria_stats,
-        # KPI 4
-        "avg_duration_secs": round(avg_duration, 1),
-        "min_duration_secs": min_duration,
-        "max_duration_secs": max_duration,
-        "short_calls_under_30s": short_calls,
-        "long_calls_over_300s": long_calls,
-        # KPI 5
-        "transfer_count": transfers,
-        "transfer_rate": round(transfers / total * 100, 2) if total else 0,
-        # KPI 6
-        "dropout_count": dropouts,
-        "dropout_rate": round(dropouts / total * 100, 2) if total else 0,
-        "avg_message_count": round(avg_messages, 1),
-        "total_cost": total_cost,
-        "avg_cost_per_session": round(avg_cost, 2),
-        "technical_errors": technical_errors,
-        "error_rate": round(technical_errors / total * 100, 2) if total else 0,
-        "avg_rating": round(avg_rating, 2) if avg_rating else None,
-        # Trends
-        "daily_trends": daily_trends,
-    }
 
+def kpi_percentiles(db: Session, agent_id: str, month: Optional[str], partial: Optional[dict]) -> dict:
+    """Percentiles over the same data as the KPI counts: all-time KPIs skip evicted months."""
+    return percentiles(db, agent_id, month, months=None if month else partial_months(partial))
 
-def _compute_criteria_stats(conversations: list) -> list:
-    """Aggregate evaluation criteria across all conversations."""
-    criteria_map = {}
-    for c in conversations:
-        if not c.evaluation_criteria_results:
-            continue
-        try:
-            criteria = json.loads(c.evaluation_criteria_results)
-            if isinstance(criteria, dict):
-                for crit_id, result in criteria.items():
-                    if crit_id not in criteria_map:
-                        criteria_map[crit_id] = {"name": crit_id, "pass": 0, "fail": 0, "total": 0}
-                    criteria_map[crit_id]["total"] += 1
-                    if isinstance(result, dict):
-                        if result.get("result") == "success":
-                            criteria_map[crit_id]["pass"] += 1
-                        else:
-                            criteria_map[crit_id]["fail"] += 1
-                    elif result == "success":
-                        criteria_map[crit_id]["pass"] += 1
-                    else:
-                        criteria_map[crit_id]["fail"] += 1
-            elif isinstance(criteria, list):
-                for item in criteria:
-                    crit_id = item.get("id") or item.get("criteria_id") or str(item)
-                    if crit_id not in criteria_map:
-                        criteria_map[crit_id] = {"name": crit_id, "pass": 0, "fail": 0, "total": 0}
-                    criteria_map[crit_id]["total"] += 1
-                    if item.get("result") == "success":
-                        criteria_map[crit_id]["pass"] += 1
-                    else:
-                        criteria_map[crit_id]["fail"] += 1
-        except (json.JSONDecodeError, TypeError):
-            pass
-
-    return list(criteria_map.values())
-
-
-def _compute_daily_trends(conversations: list) -> list:
-    """Group conversations by day and compute daily stats."""
-    day_map = {}
-    for c in conversations:
-        if not c.start_time_unix:
-            continue
-        day_str = datetime.utcfromtimestamp(c.start_time_unix).strftime("%Y-%m-%d")
-        if day_str not in day_map:
-            day_map[day_str] = {"date": day_str, "total": 0, "success": 0, "failed": 0, "avg_duration": [], "cost": 0}
-        day_map[day_str]["total"] += 1
-        if c.call_successful == "success":
-            day_map[day_str]["success"] += 1
-        elif c.call_successful == "failure":
-            day_map[day_str]["failed"] += 1
-        if c.call_duration_secs:
-            day_map[day_str]["avg_duration"].append(c.call_duration_secs)
-        if c.cost:
-            day_map[day_str]["cost"] += c.cost
-
-    result = []
-    for day_str in sorted(day_map.keys()):
-        d = day_map[day_str]
-        durations = d["avg_duration"]
-        result.append({
-            "date": day_str,
-            "total": d["total"],
-            "success": d["success"],
-            "failed": d["failed"],
-            "avg_duration": round(sum(durations) / len(durations), 1) if durations else 0,
-            "cost": d["cost"],
-        })
-    return result
-
-
-def _empty_kpis(agent_id: str, month: Optional[str]) -> dict:
+
+def compute_distributions(db: Session, agent_id: str, month: Optional[str] = None) -> dict:
+    """Hour-of-day buckets, percentiles and histograms for a given agent and optional month."""
+    return distributions(agent_id, month, load_columns(iter_kpi_batches(db, agent_id, month)))
+
+
+def _grouped_kpi_query(agent_ids: list[str], month: Optional[str]):
+    """One row per agent and (status, outcome, direction, transfer, hang-up) with the KPI sums."""
+    secs = Conversation.call_duration_secs
+    positive = secs > 0
+    reason = func.lower(func.coalesce(Conversation.termination_reason, ""))
+    transfer = case((reason.like("%transfer%"), 1), else_=0)
+    hang = case((reason.like("%hang%"), 1), else_=0)
+
+    def count_if(condition):
+        return func.sum(case((condition, 1), else_=0))
+
+    def sum_if(condition, column):
+        return func.sum(case((condition, column), else_=0))
+
+    query = (
+        select(
+            Conversation.agent_id, Conversation.month_partition, Conversation.status, Conversation.call_successful, Conversation.direction,
+            transfer, hang, func.count(),
+            count_if(positive), sum_if(positive, secs), func.min(case((positive, secs))), func.max(case((positive, secs))),
+            count_if(and_(positive, secs < 30)), count_if(secs > 300),
+            count_if(Conversation.message_count > 0), sum_if(Conversation.message_count > 0, Conversation.message_count),
+            count_if(Conversation.cost > 0), sum_if(Conversation.cost > 0, Conversation.cost),
+            func.count(Conversation.rating), func.sum(Conversation.rating),
+        )
+        .where(Conversation.agent_id.in_(agent_ids))
+        .group_by(
+            Conversation.agent_id, Conversation.month_partition, Conversation.status, Conversation.call_successful, Conversation.direction,
+            transfer, hang,
+        )
+    )
+    if month:
+        query = query.where(Conversation.month_partition == month)
+    return query
+
+
+def _group_partial(row) -> dict:
+    """kpis partial for one row of _grouped_kpi_query (no criteria or daily trends)."""
+    (_, _, status, outcome, direction, transfer, hang, total,
+     dur_count, dur_sum, dur_min, dur_max, short_calls, long_calls,
+     msg_count, msg_sum, cost_count, cost_sum, rating_count, rating_sum) = row
     return {
-        "agent_id": agent_id,
-        "month": month or "all",
-        "total_conversations": 0,
-        "conversion_rate": 0, "successful_count": 0, "failed_count": 0, "unknown_count": 0,
-        "outbound_calls": 0, "inbound_calls": 0, "done_calls": 0, "failed_calls": 0, "connection_rate": 0,
-        "criteria_stats": [],
-        "avg_duration_secs": 0, "min_duration_secs": 0, "max_duration_secs": 0,
-        "short_calls_under_30s": 0, "long_calls_over_300s": 0,
-        "transfer_count": 0, "transfer_rate": 0,
-        "dropout_count": 0, "dropout_rate": 0,
-        "avg_message_count": 0, "total_cost": 0, "avg_cost_per_session": 0,
-        "technical_errors": 0, "error_rate": 0, "avg_rating": None,
-        "daily_trends": [],
+        "total": total, "outcomes": {outcome: total}, "directions": {direction: total}, "statuses": {status: total},
+        "duration": [int(dur_count), int(dur_sum), dur_min, dur_max, int(short_calls), int(long_calls)],
+        "messages": [int(msg_count), int(msg_sum)],
+        "costs": [int(cost_count), int(cost_sum)],
+        "ratings": [rating_count, float(rating_sum or 0)],
+        "transfers": total if transfer else 0,
+        "dropouts": total if status in ("failed", "initiated") or hang else 0,
+        "criteria": {}, "days": {},
     }
 
 
+@KPI_COMPUTE_SECONDS.time()
+def compare_kpis(db: Session, agent_ids: list[str], month: Optional[str] = None) -> dict:
+    """KPIs of several agents and of all of them together, without per-agent queries.
+
+    One grouped query per source (hot database or month shards); agents
+    whose month is only in an archive are read from their archive files.
+    Criteria and daily trends are left out.
+    """
+    partials = {}
+    months = {}  # agent -> month partitions read, for the percentiles
+    with conversation_sessions(db, month) as sessions:
+        for source in sessions:
+            for row in source.execute(_grouped_kpi_query(agent_ids, month)):
+                partials[row[0]] = merge_partials(partials.get(row[0]), _group_partial(row))
+                months.setdefault(row[0], set()).add(row[1])
+
+    archived_only = [a for a in agent_ids if a not in partials]
+    if month and archived_only:
+        logs = (
+            db.query(ArchiveLog.agent_id, ArchiveLog.db_path)
+            .filter(
+                ArchiveLog.agent_id.in_(archived_only),
+                ArchiveLog.month_partition == month,
+                ArchiveLog.db_path != None,
+            )
+            .order_by(ArchiveLog.archived_at.desc())
+            .all()
+        )
+        for agent_id, path in logs:
+            if agent_id in partials or not os.path.exists(path):
+                continue
+            with archive_session(path) as archive:
+                for row in archive.execute(_grouped_kpi_query([agent_id], month)):
+                    partials[agent_id] = merge_partials(partials.get(agent_id), _group_partial(row))
+
+    agent_percentiles, combined_percentiles = percentiles_by_agent(db, agent_ids, month, months=None if month else months)
+    combined = None
+    for partial in partials.values():
+        combined = merge_partials(combined, copy.deepcopy(partial))
+    results = [
+        finalize_kpis(agent_id, month, partials.get(agent_id), agent_percentiles[agent_id]) for agent_id in agent_ids
+    ]
+    results.append(finalize_kpis("all", month, combined, combined_percentiles))
+    for result in results:
+        del result["criteria_stats"], result["daily_trends"]
+    return {"month": month or "all", "agents": results[:-1], "combined": results[-1]}
+
+
 def archive_month_to_csv(db: Session, agent_id: str, month_partition: str) -> Optional[str]:
-    """Archive conversations for a given month to CSV. Returns file path."""
-    conversations = (
-        db.query(Conversation)
-        .filter(Conversation.agent_id == agent_id, Conversation.month_partition == month_partition)
-        .all()
-    )
+    """Archive conversations for a given month to CSV and a queryable SQLite file.
+
+    Returns the CSV file path.
+    """
+    with conversation_sessions(db, month_partition) as sessions:
+        conversations = [
+            c
+            for source in sessions
+            for c in source.query(Conversation)
+            .filter(Conversation.agent_id == agent_id, Conversation.month_partition == month_partition)
+            .all()
+        ]
     if not conversations:
         return None
 
@@ -657,22 +722,26 @@ def archive_month_to_csv(db: Session, agent_id: str, month_partition: str) -> Op
         for c in conversations:
             writer.writerow({field: getattr(c, field, "") for field in fields})
 
+    db_path = write_archive_db(conversations, agent_id, month_partition)
+
     # Log archive
     log = ArchiveLog(
         month_partition=month_partition,
         agent_id=agent_id,
         file_path=filepath,
+        db_path=db_path,
         records_count=len(conversations),
     )
     db.add(log)
     db.commit()
+    bump_data_version(db, agent_id)
 
     return filepath
 
 
-def check_and_archive(db: Session):
+def check_and_archive(db: Session, now: Optional[datetime] = None):
     """Check if we're past the 5th day of month, archive previous month if not done."""
-    now = datetime.utcnow()
+    now = now or datetime.utcnow()
     if now.day > 5:
         return  # only archive in first 5 days
 
@@ -682,33 +751,35 @@ def check_and_archive(db: Session):
     prev_partition = prev_month.strftime("%Y-%m")
 
     # Get all agent_ids with data for that month
-    agent_ids = (
-        db.query(Conversation.agent_id)
-        .filter(Conversation.month_partition == prev_partition)
-        .distinct()
-        .all()
-    )
+    with conversation_sessions(db, prev_partition) as sessions:
+        agent_ids = {
+            r[0]
+            for source in sessions
+            for r in source.query(Conversation.agent_id)
+            .filter(Conversation.month_partition == prev_partition)
+            .distinct()
+            .all()
+        }
 
-    for (agent_id,) in agent_ids:
-        # Check if already archived
-        existing = (
-            db.query(ArchiveLog)
-            .filter(ArchiveLog.month_partition == prev_partition, ArchiveLog.agent_id == agent_id)
-            .first()
-        )
-        if existing:
-            continue
+    archived = {
+        r[0] for r in db.query(ArchiveLog.agent_id).filter(ArchiveLog.month_partition == prev_partition).distinct()
+    }
+    for agent_id in sorted(agent_ids - archived):
         archive_month_to_csv(db, agent_id, prev_partition)
         logger.info(f"Archived {prev_partition} for agent {agent_id}")
 
 
 def get_available_months(db: Session, agent_id: str) -> list[str]:
-    """Get list of month partitions available for agent."""
-    results = (
-        db.query(Conversation.month_partition)
-        .filter(Conversation.agent_id == agent_id)
-        .distinct()
-        .order_by(Conversation.month_partition.desc())
-        .all()
-    )
-    return [r[0] for r in results]
+    """Get list of month partitions available for agent, hot or archived."""
+    months = set()
+    with conversation_sessions(db) as sessions:
+        for source in sessions:
+            results = (
+                source.query(Conversation.month_partition)
+                .filter(Conversation.agent_id == agent_id)
+                .distinct()
+                .all()
+            )
+            months.update(r[0] for r in results)
+    months.update(archived_months(db, agent_id))
+    return sorted(months, reverse=True)